@@ -0,0 +1,369 @@
+import argparse
+import hmac
+import multiprocessing
+import os
+import secrets
+import socket
+import threading
+import time
+import uuid
+
+import requests
+from flask import Flask, request, jsonify
+
+from probe_engine import MODE_COLD, CONNECTION_MODES
+from process_pool import ProcessPoolRunner, split_evenly
+from stats_aggregator import ShardedStats, StatsShard
+
+
+DEFAULT_AGENT_PORT = 5001
+# 控制端向代理节点拉取统计的间隔（秒）
+AGENT_POLL_INTERVAL = 0.5
+# 计划全部下发后，确认开始时间到同时开始之间预留的时间（秒），需大于向所有节点确认的耗时
+START_DELAY = 2.0
+# 节点收到计划后等待控制端确认开始时间的最长时间（秒），超时后计划作废
+START_WAIT_TIMEOUT = 60
+# 连续多少次无法访问节点后判定节点失联
+MAX_POLL_FAILURES = 10
+AGENT_TIMEOUT = 5
+# 节点的所有接口都要求请求头中携带共享令牌，令牌由 --token 或环境变量指定
+AGENT_TOKEN_HEADER = 'X-Agent-Token'
+AGENT_TOKEN_ENV = 'PROXY_SPEED_AGENT_TOKEN'
+# 已结束的测试计划保留的时间（秒）和最多保留的计划数，超过时先删除最早结束的计划
+PLAN_TTL = 3600
+MAX_PLANS = 100
+
+# 测试计划状态
+STATE_WAITING = 'waiting'
+STATE_RUNNING = 'running'
+STATE_FINISHED = 'finished'
+STATE_LOST = 'lost'
+
+agent_app = Flask(__name__)
+agent_plans = {}
+agent_lock = threading.Lock()
+
+
+@agent_app.before_request
+def check_agent_token():
+    token = agent_app.config.get('AGENT_TOKEN')
+    supplied = request.headers.get(AGENT_TOKEN_HEADER, '')
+    if not token or not hmac.compare_digest(supplied.encode('utf-8'), token.encode('utf-8')):
+        return jsonify({'success': False, 'error': '令牌无效'}), 401
+    return None
+
+
+class AgentPlan:
+    """代理节点上的一个测试计划：等到控制端确认的开始时间后以多进程引擎执行"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.stats = ShardedStats()
+        self.runner = ProcessPoolRunner(plan.get('proxyUrl'), timeout=plan.get('timeout', 10),
+                                        mode=plan.get('mode', MODE_COLD), pool_size=plan.get('poolSize', 10),
+                                        workers=plan.get('workers'), stats=self.stats)
+        self.runner.controller.set_rate(0 if plan.get('openLoop') else plan.get('rate', 0))
+        self.state = STATE_WAITING
+        # 开始时间（本机时钟），计划中未给出时等待控制端确认
+        self.start_at = plan.get('startAt')
+        self.started = None
+        self.finished = None
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        plan = self.plan
+        # 按本机时钟等待开始时间，控制端已换算过两端的时钟偏差
+        deadline = time.time() + START_WAIT_TIMEOUT
+        while not self.runner.controller.stopped:
+            start_at = self.start_at
+            if start_at is None:
+                if time.time() > deadline:
+                    self.runner.errors.append("未收到控制端确认的开始时间")
+                    self.runner.stop()
+                    break
+                time.sleep(0.05)
+                continue
+            delay = start_at - time.time()
+            if delay <= 0:
+                break
+            time.sleep(min(delay, 0.05))
+        self.state = STATE_RUNNING
+        self.started = time.time()
+        try:
+            if not self.runner.controller.stopped:
+                self.runner.run(plan['targetUrl'], plan['count'], plan['concurrency'],
+                                first_request_id=plan.get('firstRequestId', 1), rate=plan.get('rate', 0),
+                                open_loop=plan.get('openLoop', False))
+        except Exception as e:
+            self.runner.errors.append(f"执行错误: {str(e)}")
+        self.finished = time.time()
+        self.state = STATE_FINISHED
+
+    def status(self):
+        return {
+            'success': True,
+            'host': socket.gethostname(),
+            'state': self.state,
+            'started': self.started,
+            'finished': self.finished,
+            'errors': self.runner.errors,
+            # 累计统计（含直方图），控制端整体替换后合并
+            'stats': self.stats.snapshot().to_dict(),
+        }
+
+
+def prune_plans(now=None):
+    """删除结束超过 PLAN_TTL 的计划，计划数仍超过 MAX_PLANS 时再按结束时间删除最早的已结束计划
+
+    调用方需持有 agent_lock；未结束的计划不会被删除。
+    """
+    now = now or time.time()
+    finished = sorted((agent_plan.finished, plan_id) for plan_id, agent_plan in agent_plans.items()
+                      if agent_plan.finished is not None)
+    for finished_at, plan_id in finished:
+        if now - finished_at > PLAN_TTL or len(agent_plans) > MAX_PLANS:
+            del agent_plans[plan_id]
+
+
+def is_number(value, integer=False):
+    # JSON 中的 true/false 在Python中是 int 的子类，不算数字
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) if integer else isinstance(value, (int, float))
+
+
+def validate_plan(plan):
+    for key in ('planId', 'targetUrl', 'count', 'concurrency'):
+        if plan.get(key) in (None, ''):
+            return f"测试计划缺少字段: {key}"
+    for key in ('count', 'concurrency', 'poolSize', 'workers', 'firstRequestId'):
+        if plan.get(key) is not None and not is_number(plan[key], integer=True):
+            return f"{key} 必须是整数"
+    for key in ('rate', 'timeout', 'startAt'):
+        if plan.get(key) is not None and not is_number(plan[key]):
+            return f"{key} 必须是数字"
+    if plan['count'] <= 0 or plan['concurrency'] <= 0:
+        return "测试次数和并发数量必须大于0"
+    if plan.get('poolSize', 10) <= 0 or plan.get('timeout', 10) <= 0:
+        return "连接池大小和超时时间必须大于0"
+    if plan.get('workers') is not None and plan['workers'] <= 0:
+        return "进程数必须大于0"
+    if plan.get('rate', 0) < 0:
+        return "目标RPS不能小于0"
+    if plan.get('openLoop') and not plan.get('rate'):
+        return "开环模式需要大于0的目标RPS"
+    if plan.get('mode', MODE_COLD) not in CONNECTION_MODES:
+        return f"未知的连接模式: {plan['mode']}"
+    if plan.get('startAt') is not None and plan['startAt'] <= time.time():
+        return "开始时间已过"
+    return None
+
+
+@agent_app.route('/clock', methods=['GET'])
+def agent_clock():
+    # 控制端据此估算时钟偏差
+    return jsonify({'success': True, 'time': time.time(), 'host': socket.gethostname()})
+
+
+@agent_app.route('/plans', methods=['POST'])
+def agent_start_plan():
+    plan = request.json or {}
+    error = validate_plan(plan)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    with agent_lock:
+        prune_plans()
+        if plan['planId'] in agent_plans:
+            return jsonify({'success': False, 'error': '测试计划已存在'}), 409
+        agent_plan = agent_plans[plan['planId']] = AgentPlan(plan)
+    agent_plan.start()
+    return jsonify({'success': True})
+
+
+@agent_app.route('/plans/<plan_id>', methods=['GET'])
+def agent_plan_status(plan_id):
+    agent_plan = agent_plans.get(plan_id)
+    if agent_plan is None:
+        return jsonify({'success': False, 'error': '测试计划不存在'}), 404
+    return jsonify(agent_plan.status())
+
+
+@agent_app.route('/plans/<plan_id>/start', methods=['POST'])
+def agent_confirm_plan(plan_id):
+    # 控制端在所有节点都接受计划后统一确认开始时间，已过的开始时间会被拒绝，不会晚于其他节点开始
+    start_at = (request.json or {}).get('startAt')
+    if not is_number(start_at):
+        return jsonify({'success': False, 'error': 'startAt 必须是数字'}), 400
+    with agent_lock:
+        agent_plan = agent_plans.get(plan_id)
+        if agent_plan is None:
+            return jsonify({'success': False, 'error': '测试计划不存在'}), 404
+        if agent_plan.start_at is not None or agent_plan.state != STATE_WAITING:
+            return jsonify({'success': False, 'error': '测试计划已确认开始时间'}), 409
+        if start_at <= time.time():
+            return jsonify({'success': False, 'error': '开始时间已过'}), 409
+        agent_plan.start_at = start_at
+    return jsonify({'success': True})
+
+
+@agent_app.route('/plans/<plan_id>/stop', methods=['POST'])
+def agent_stop_plan(plan_id):
+    agent_plan = agent_plans.get(plan_id)
+    if agent_plan is None:
+        return jsonify({'success': False, 'error': '测试计划不存在'}), 404
+    agent_plan.runner.stop()
+    return jsonify({'success': True})
+
+
+def measure_clock_offset(agent_url, session):
+    """返回节点时钟相对本机的偏差（秒），按请求往返的中点估算"""
+    sent = time.time()
+    response = session.get(f"{agent_url}/clock", timeout=AGENT_TIMEOUT)
+    received = time.time()
+    response.raise_for_status()
+    return response.json()['time'] - (sent + received) / 2
+
+
+class DistributedRun:
+    """控制端：把测试计划分发到多个代理节点，约定同一时刻开始，并合并各节点的统计
+
+    测试次数、并发数和速率在节点间均分，各节点负责连续的一段请求ID。
+    控制端每 AGENT_POLL_INTERVAL 秒拉取一次各节点的累计统计，按节点替换到 self.stats 中，
+    因此 self.stats.snapshot() 是所有节点合并后的实时结果。
+    """
+
+    def __init__(self, agents, settings, token=None):
+        self.agents = [agent.rstrip('/') for agent in agents]
+        self.settings = settings
+        self.plan_id = uuid.uuid4().hex
+        self.stats = ShardedStats()
+        self.session = requests.Session()
+        # 各节点使用同一个共享令牌，未指定时从环境变量读取
+        self.session.headers[AGENT_TOKEN_HEADER] = token or os.environ.get(AGENT_TOKEN_ENV, '')
+        # 各节点的状态：state、host、errors、started、finished、stats
+        self.nodes = {agent: {'state': STATE_WAITING, 'host': None, 'errors': [], 'stats': StatsShard()}
+                      for agent in self.agents}
+        self.started = None
+        self.finished = None
+        self.stopped = False
+
+    def start(self):
+        """下发计划、确认开始时间并启动拉取线程
+
+        先向各节点下发不含开始时间的计划（同时测量时钟偏差），全部接受后再计算开始时间并逐个确认，
+        下发计划的耗时不会占用 START_DELAY。任一节点拒绝计划，或收到确认时已过开始时间而拒绝确认时
+        抛出异常，已下发的节点会被停止。
+        """
+        settings = self.settings
+        counts = split_evenly(settings['count'], len(self.agents))
+        concurrencies = split_evenly(settings['concurrency'], len(self.agents))
+        # 测试次数少于节点数时部分节点不参与，总速率只在参与的节点间均分
+        active = sum(1 for count in counts if count)
+        next_id = 1
+        # 已接受计划的节点及其时钟偏差
+        accepted = {}
+        try:
+            for agent, count, concurrency in zip(self.agents, counts, concurrencies):
+                if count == 0:
+                    self.nodes[agent]['state'] = STATE_FINISHED
+                    continue
+                offset = measure_clock_offset(agent, self.session)
+                plan = {
+                    'planId': self.plan_id,
+                    'targetUrl': settings['target_url'],
+                    'proxyUrl': settings['proxy_url'],
+                    'count': count,
+                    'concurrency': max(1, concurrency),
+                    'mode': settings['mode'],
+                    'poolSize': settings['pool_size'],
+                    'rate': settings['rate'] / active,
+                    'openLoop': settings['open_loop'],
+                    'workers': settings['workers'],
+                    'firstRequestId': next_id,
+                }
+                next_id += count
+                response = self.session.post(f"{agent}/plans", json=plan, timeout=AGENT_TIMEOUT)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{agent}: {response.json().get('error', response.status_code)}")
+                accepted[agent] = offset
+
+            start_at = time.time() + START_DELAY
+            for agent, offset in accepted.items():
+                response = self.session.post(f"{agent}/plans/{self.plan_id}/start",
+                                             json={'startAt': start_at + offset}, timeout=AGENT_TIMEOUT)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{agent}: {response.json().get('error', response.status_code)}")
+        except Exception:
+            for agent in accepted:
+                self._stop_agent(agent)
+            raise
+        self.started = start_at
+        threading.Thread(target=self._poll_loop, daemon=True).start()
+
+    def _stop_agent(self, agent):
+        try:
+            self.session.post(f"{agent}/plans/{self.plan_id}/stop", timeout=AGENT_TIMEOUT)
+        except requests.RequestException:
+            pass
+
+    def stop(self):
+        self.stopped = True
+        for agent in self.agents:
+            self._stop_agent(agent)
+
+    def _poll_agent(self, agent):
+        node = self.nodes[agent]
+        try:
+            response = self.session.get(f"{agent}/plans/{self.plan_id}", timeout=AGENT_TIMEOUT)
+            data = response.json()
+            if not data.get('success'):
+                raise RuntimeError(data.get('error'))
+        except Exception as e:
+            node['failures'] = node.get('failures', 0) + 1
+            if node['failures'] >= MAX_POLL_FAILURES:
+                node['state'] = STATE_LOST
+                node['errors'].append(f"节点失联: {e}")
+            return
+        node['failures'] = 0
+        node.update(state=data['state'], host=data['host'], errors=data['errors'], started=data['started'],
+                    finished=data['finished'], stats=StatsShard.from_dict(data['stats']))
+        self.stats.set_remote_shard(agent, node['stats'])
+
+    def _poll_loop(self):
+        while True:
+            pending = [agent for agent, node in self.nodes.items() if node['state'] not in (STATE_FINISHED, STATE_LOST)]
+            if not pending:
+                break
+            for agent in pending:
+                self._poll_agent(agent)
+            time.sleep(AGENT_POLL_INTERVAL)
+        self.finished = time.time()
+        self.session.close()
+
+    @property
+    def is_finished(self):
+        return self.finished is not None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="分布式测试的代理节点：接收控制端下发的测试计划并执行")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="监听地址，默认只接受本机连接；供其他主机访问时指定 0.0.0.0 或网卡地址")
+    parser.add_argument('--port', type=int, default=DEFAULT_AGENT_PORT, help="监听端口")
+    parser.add_argument('--token', default=os.environ.get(AGENT_TOKEN_ENV),
+                        help=f"共享令牌，控制端须在 {AGENT_TOKEN_HEADER} 请求头中携带（默认读取环境变量 {AGENT_TOKEN_ENV}）")
+    args = parser.parse_args(argv)
+    token = args.token
+    if not token:
+        # 未指定令牌时生成随机令牌，节点任何时候都不接受未认证的请求
+        token = secrets.token_urlsafe(24)
+        print(f"未指定令牌，已生成随机令牌: {token}")
+    agent_app.config['AGENT_TOKEN'] = token
+    agent_app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
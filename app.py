@@ -1,9 +1,22 @@
-from flask import Flask, request, jsonify, send_from_directory
-import requests
+from flask import Flask, request, jsonify, send_from_directory, send_file, Response, stream_with_context
+import threading
 import time
+import itertools
+import multiprocessing
+import tempfile
+from probe_engine import ProbeEngine, MODE_COLD, CONNECTION_MODES, DEFAULT_BODY_LIMIT, phases_to_ms
+from thread_engine import ThreadProbeEngine, SessionCache
+from stats_aggregator import ShardedStats
+from process_pool import ProcessPoolRunner
+from agent import DistributedRun
+from run_store import RunStore, KIND_LATENCY, RUN_FINISHED, RUN_STOPPED, RUN_FAILED
+from exporter import FORMAT_CSV, FORMAT_PARQUET, MIME_TYPES, check_format, export_batches, stream_text, stored_run_batches
 
 app = Flask(__name__)
 
+# 按 (代理地址, 连接池大小) 缓存保持连接的会话，warm 模式下复用隧道
+http_sessions = SessionCache()
+
 @app.route('/')
 def index():
     return send_from_directory('templates', 'index.html')
@@ -14,53 +27,314 @@ def serve_static(path):
 
 @app.route('/test', methods=['POST'])
 def test_proxy():
+    # 单次探测与界面的线程池引擎走同一条路径（ThreadProbeEngine.probe）
     data = request.json
     target_url = data.get('targetUrl')
     proxy_url = data.get('proxyUrl')
-    request_id = data.get('requestId')
-    
+    request_id = data.get('requestId', 1)
+    mode = data.get('mode', MODE_COLD)
     try:
-        proxy = {
-            'http': proxy_url,
-            'https': proxy_url
-        } if proxy_url else None
-        
-        start_time = time.time()
-        response = requests.get(target_url, proxies=proxy, timeout=10)
-        elapsed_time = time.time() - start_time
-        
-        if response.status_code == 200:
-            try:
-                response_data = response.json()
-                details = f"请求ID: {request_id}\n响应时间: {elapsed_time:.2f}秒\n状态码: {response.status_code}\n\n响应数据:\n{response_data}"
-            except:
-                details = f"请求ID: {request_id}\n响应时间: {elapsed_time:.2f}秒\n状态码: {response.status_code}\n\n响应数据:\n{response.text}"
-            
-            return jsonify({
-                'success': True,
-                'statusCode': response.status_code,
-                'responseTime': elapsed_time,
-                'details': details
-            })
+        pool_size = int(data.get('poolSize', 10))
+        # 返回的响应体字节数上限，0 表示不返回响应体
+        body_limit = int(data.get('bodyLimit', DEFAULT_BODY_LIMIT))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': '连接池大小和响应体上限必须是整数'}), 400
+    if pool_size <= 0 or body_limit < 0:
+        return jsonify({'success': False, 'error': '连接池大小必须大于0，响应体上限不能小于0'}), 400
+    if mode not in CONNECTION_MODES:
+        return jsonify({'success': False, 'error': f"未知的连接模式: {mode}"}), 400
+    if not isinstance(request_id, int):
+        return jsonify({'success': False, 'error': '请求ID必须是整数'}), 400
+
+    engine = ThreadProbeEngine(proxy_url, timeout=10, mode=mode, pool_size=pool_size, body_limit=body_limit,
+                               sessions=http_sessions)
+    return jsonify(test_response(engine.probe(target_url, request_id)))
+
+def test_response(result):
+    # /test 的返回字段与网页端约定一致：失败时 error 为 'timeout'、HTTP状态码或错误分类
+    data = {'success': result.success, 'details': result.details}
+    if result.success:
+        data.update(statusCode=int(result.status_code), responseTime=result.elapsed, mode=result.mode,
+                    phases=phases_to_ms(result.phases))
+    else:
+        data.update(error='timeout' if result.timeout else result.status_code, errorClass=result.error)
+    if result.body_hash:
+        # 响应体只返回截断的原始文本，由调用方决定是否格式化
+        text = result.body.decode('utf-8', errors='replace')
+        data['details'] += f"\n\n{'响应数据' if result.success else '响应内容'}:\n{text}"
+        data.update(body=text, bodySize=result.bytes, bodyHash=result.body_hash.hex(),
+                    bodyTruncated=len(result.body) < result.bytes)
+    return data
+
+# 后台运行的多进程测试，按运行ID查询合并后的实时统计
+live_runs = {}
+run_ids = itertools.count(1)
+
+def stats_summary(snapshot, open_loop=False):
+    return {
+        'total': snapshot.total,
+        'success': snapshot.success,
+        'failed': snapshot.failed,
+        'timeout': snapshot.timeout,
+        'statusCodes': snapshot.status_codes,
+        'latency': snapshot.latency.summary(),
+        'modes': {m: histogram.summary() for m, histogram in snapshot.modes.items()},
+        'phases': snapshot.phases.as_dict(),
+        # 开环模式从计划发送时间算起的校正耗时和排队延迟，闭环时为空
+        'corrected': snapshot.corrected.summary() if open_loop else None,
+        'queueDelay': snapshot.queue_delays.summary() if open_loop else None,
+    }
+
+def result_summary(result):
+    return {
+        'requestId': result.request_id,
+        'success': result.success,
+        'statusCode': result.status_code,
+        'responseTime': result.elapsed,
+        'mode': result.mode,
+        'reused': result.reused,
+        'phases': phases_to_ms(result.phases),
+        'queueDelay': result.queue_delay,
+        'bytes': result.bytes,
+        'error': result.error,
+    }
+
+def read_batch_settings(data):
+    # 解析并校验批量测试参数，返回 (参数字典, 错误信息)
+    settings = {
+        'target_url': data.get('targetUrl'),
+        'proxy_url': data.get('proxyUrl'),
+        'count': int(data.get('count', 100)),
+        'concurrency': int(data.get('concurrency', 50)),
+        'mode': data.get('mode', MODE_COLD),
+        'pool_size': int(data.get('poolSize', 10)),
+        # rate: 目标RPS，0为不限速；openLoop 为真时按该速率固定到达率发送
+        'rate': float(data.get('rate', 0)),
+        'open_loop': bool(data.get('openLoop', False)),
+        # workers: 工作进程数，大于1时使用多进程引擎
+        'workers': int(data.get('workers', 1)),
+    }
+    if settings['count'] <= 0 or settings['concurrency'] <= 0 or settings['pool_size'] <= 0 or settings['workers'] <= 0:
+        return settings, '测试次数、并发数量、连接池大小和进程数必须大于0'
+    if settings['rate'] < 0 or (settings['open_loop'] and settings['rate'] == 0):
+        return settings, '开环模式需要大于0的目标RPS'
+    if settings['mode'] not in CONNECTION_MODES:
+        return settings, f"未知的连接模式: {settings['mode']}"
+    return settings, None
+
+# 历史记录数据库，首次使用时打开
+run_store = None
+run_store_lock = threading.Lock()
+
+def get_run_store():
+    global run_store
+    with run_store_lock:
+        if run_store is None:
+            run_store = RunStore()
+        return run_store
+
+def start_stored_run(settings):
+    return get_run_store().start_run(KIND_LATENCY, settings['proxy_url'], settings['target_url'], {
+        key: settings[key] for key in ('count', 'concurrency', 'mode', 'pool_size', 'rate', 'open_loop', 'workers')})
+
+def create_runner(settings, stats):
+    runner = ProcessPoolRunner(settings['proxy_url'], timeout=10, mode=settings['mode'],
+                               pool_size=settings['pool_size'], workers=settings['workers'], stats=stats,
+                               body_limit=0)
+    runner.controller.set_rate(settings['rate'])
+    return runner
+
+@app.route('/batch', methods=['POST'])
+def batch_test():
+    # 使用asyncio引擎在一个事件循环中执行整批探测，workers 大于1时分片到多个进程
+    settings, error = read_batch_settings(request.json)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    target_url = settings['target_url']
+    count = settings['count']
+    concurrency = settings['concurrency']
+    rate = settings['rate']
+    open_loop = settings['open_loop']
+
+    stats = ShardedStats()
+    results = []
+    stored_run_id = start_stored_run(settings)
+
+    def on_result(result):
+        stats.record_result(result)
+        results.append(result)
+
+    if settings['workers'] > 1:
+        runner = create_runner(settings, stats)
+        runner.run(target_url, count, concurrency, results.extend, rate=rate, open_loop=open_loop)
+        results.sort(key=lambda result: result.request_id)
+    else:
+        # 批量结果只返回统计和耗时，不需要保存响应体
+        engine = ProbeEngine(settings['proxy_url'], timeout=10, mode=settings['mode'], pool_size=settings['pool_size'],
+                             body_limit=0)
+        if open_loop:
+            engine.run_open_loop_sync(target_url, rate, count, on_result)
         else:
-            return jsonify({
-                'success': False,
-                'error': str(response.status_code),
-                'details': f"HTTP错误: {response.status_code}\n响应内容:\n{response.text}"
-            })
-            
-    except requests.exceptions.Timeout:
-        return jsonify({
-            'success': False,
-            'error': 'timeout',
-            'details': "连接超时"
-        })
-    except requests.exceptions.RequestException as e:
-        return jsonify({
-            'success': False,
-            'error': 'CONNECTION_ERROR',
-            'details': f"连接错误: {str(e)}"
-        })
+            engine.controller.set_rate(rate)
+            engine.run_sync(target_url, count, concurrency, on_result)
+    snapshot = stats.snapshot()
+    store = get_run_store()
+    store.add_results(stored_run_id, results)
+    store.finish_run(stored_run_id, snapshot)
+    return jsonify({'success': True, 'stats': stats_summary(snapshot, open_loop),
+                    'results': [result_summary(result) for result in results], 'storedRunId': stored_run_id})
+
+@app.route('/runs', methods=['POST'])
+def start_run():
+    # 在后台启动多进程测试并立即返回运行ID，之后通过 GET /runs/<id> 查询合并后的实时统计
+    settings, error = read_batch_settings(request.json)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    run_id = next(run_ids)
+    runner = create_runner(settings, ShardedStats())
+    live_run = {'runner': runner, 'settings': settings, 'started': time.time(), 'finished': None}
+    stored_run_id = start_stored_run(settings)
+
+    def run():
+        status = RUN_FINISHED
+        try:
+            runner.run(settings['target_url'], settings['count'], settings['concurrency'],
+                       rate=settings['rate'], open_loop=settings['open_loop'])
+            if runner.controller.stopped:
+                status = RUN_STOPPED
+        except Exception as e:
+            runner.errors.append(f"执行错误: {str(e)}")
+            status = RUN_FAILED
+        # 后台运行只保存汇总和直方图，不回传逐条结果
+        get_run_store().finish_run(stored_run_id, runner.stats.snapshot(), status)
+        live_run['finished'] = time.time()
+
+    live_runs[run_id] = live_run
+    threading.Thread(target=run, daemon=True).start()
+    return jsonify({'success': True, 'runId': run_id})
+
+@app.route('/runs/<int:run_id>', methods=['GET'])
+def run_status(run_id):
+    live_run = live_runs.get(run_id)
+    if live_run is None:
+        return jsonify({'success': False, 'error': '运行不存在'}), 404
+    runner = live_run['runner']
+    finished = live_run['finished']
+    return jsonify({
+        'success': True,
+        'finished': finished is not None,
+        'elapsed': (finished or time.time()) - live_run['started'],
+        'workers': runner.workers,
+        'errors': runner.errors,
+        'stats': stats_summary(runner.stats.snapshot(), live_run['settings']['open_loop']),
+    })
+
+@app.route('/runs/<int:run_id>/stop', methods=['POST'])
+def stop_run(run_id):
+    live_run = live_runs.get(run_id)
+    if live_run is None:
+        return jsonify({'success': False, 'error': '运行不存在'}), 404
+    live_run['runner'].stop()
+    return jsonify({'success': True})
+
+@app.route('/history', methods=['GET'])
+def history():
+    # 按代理、目标、时间范围查询历史运行，返回合并后的延迟分布和运行列表
+    args = request.args
+    try:
+        days = float(args.get('days', 30))
+        limit = int(args.get('limit', 100))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'days 和 limit 必须是数字'}), 400
+    filters = {
+        'kind': args.get('kind', KIND_LATENCY) if args.get('kind') != 'all' else None,
+        'proxy': args.get('proxy') or None,
+        'target': args.get('target') or None,
+        'since': time.time() - days * 86400 if days > 0 else None,
+    }
+    store = get_run_store()
+    histogram, run_count, total, failed = store.query_latency(**filters)
+    return jsonify({
+        'success': True,
+        'runs': run_count,
+        'total': total,
+        'failed': failed,
+        'latency': histogram.summary(),
+        'items': store.list_runs(limit=limit, **filters),
+    })
+
+@app.route('/history/<int:run_id>/export', methods=['GET'])
+def export_history_run(run_id):
+    # 流式导出一次历史运行的明细，逐批从数据库读取，不在内存中保留全部结果
+    fmt = request.args.get('format', FORMAT_CSV)
+    error = check_format(fmt)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    store = get_run_store()
+    run = store.get_run(run_id)
+    if run is None:
+        return jsonify({'success': False, 'error': '运行记录不存在'}), 404
+    fields, batches = stored_run_batches(store, run)
+    filename = f"run_{run_id}.{fmt}"
+    if fmt == FORMAT_PARQUET:
+        # Parquet 的文件尾在写完后才能确定，先写入临时文件再发送
+        output = tempfile.TemporaryFile()
+        export_batches(batches, output, fields, fmt)
+        output.seek(0)
+        return send_file(output, mimetype=MIME_TYPES[fmt], as_attachment=True, download_name=filename)
+    return Response(stream_with_context(stream_text(batches, fields, fmt)), mimetype=MIME_TYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# 分布式测试：本服务作为控制端，向各代理节点（agent.py）下发计划并合并统计
+distributed_runs = {}
+
+@app.route('/distributed', methods=['POST'])
+def start_distributed():
+    data = request.json
+    agents = [agent for agent in data.get('agents', []) if agent]
+    if not agents:
+        return jsonify({'success': False, 'error': '请至少指定一个代理节点'}), 400
+    settings, error = read_batch_settings(data)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    # 节点的共享令牌，未指定时使用环境变量 PROXY_SPEED_AGENT_TOKEN
+    run = DistributedRun(agents, settings, data.get('agentToken'))
+    try:
+        run.start()
+    except Exception as e:
+        return jsonify({'success': False, 'error': f"下发测试计划失败: {str(e)}"}), 502
+    run_id = next(run_ids)
+    distributed_runs[run_id] = run
+    return jsonify({'success': True, 'runId': run_id, 'startAt': run.started})
+
+@app.route('/distributed/<int:run_id>', methods=['GET'])
+def distributed_status(run_id):
+    run = distributed_runs.get(run_id)
+    if run is None:
+        return jsonify({'success': False, 'error': '运行不存在'}), 404
+    open_loop = run.settings['open_loop']
+    return jsonify({
+        'success': True,
+        'finished': run.is_finished,
+        'startAt': run.started,
+        'elapsed': max(0, (run.finished or time.time()) - run.started),
+        'stats': stats_summary(run.stats.snapshot(), open_loop),
+        'agents': {agent: {
+            'host': node['host'],
+            'state': node['state'],
+            'errors': node['errors'],
+            'stats': stats_summary(node['stats'], open_loop),
+        } for agent, node in run.nodes.items()},
+    })
+
+@app.route('/distributed/<int:run_id>/stop', methods=['POST'])
+def stop_distributed(run_id):
+    run = distributed_runs.get(run_id)
+    if run is None:
+        return jsonify({'success': False, 'error': '运行不存在'}), 404
+    run.stop()
+    return jsonify({'success': True})
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,350 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+from probe_engine import (ProbeEngine, ProbeResult, MODE_COLD, MODE_WARM, STATUS_SUCCESS, STATUS_FAILED, ERROR_HTTP,
+                          raise_fd_limit)
+from result_store import ResultStore
+from stats_aggregator import ShardedStats
+from thread_engine import ThreadProbeEngine
+from transfer_engine import discard_download
+
+
+# 结果文件格式版本，字段含义变化时递增
+BENCHMARK_VERSION = 3
+# 默认结果文件放在用户目录下（与历史记录数据库同一目录），不写入当前目录
+DEFAULT_OUTPUT = os.path.join(os.path.expanduser('~'), '.proxy_speed_test', 'benchmark_results.json')
+# 比较两次结果时，变化超过该比例的指标标记为回退/提升
+REGRESSION_THRESHOLD = 0.10
+# 内存测试的行数
+MEMORY_ROWS = 100000
+# 每项指标中数值越小越好的字段
+LOWER_IS_BETTER = ('cpu_per_probe_us', 'bytes_per_row', 'lag_p99_ms', 'lag_max_ms', 'lag_mean_ms')
+
+
+def _serve(address_queue, stop_event):
+    # 在子进程中运行本地测试服务器，服务器的CPU开销不计入被测进程
+    from local_bench_server import LocalBenchServer
+    server = LocalBenchServer(target_port=0, proxy_port=0).start()
+    address_queue.put((server.target_url, server.proxy_url))
+    stop_event.wait()
+    server.stop()
+
+
+class BenchServer:
+    """在独立进程中运行的 LocalBenchServer"""
+
+    def __init__(self):
+        self.target_url = None
+        self.proxy_url = None
+        self._process = None
+        self._stop_event = None
+
+    def __enter__(self):
+        context = multiprocessing.get_context('spawn')
+        address_queue = context.Queue()
+        self._stop_event = context.Event()
+        self._process = context.Process(target=_serve, args=(address_queue, self._stop_event), daemon=True)
+        self._process.start()
+        self.target_url, self.proxy_url = address_queue.get(timeout=30)
+        return self
+
+    def __exit__(self, *exc):
+        self._stop_event.set()
+        self._process.join(5)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+class CpuTimer:
+    """同时记录墙钟时间和本进程（所有线程）的CPU时间"""
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall = time.perf_counter() - self.wall
+        self.cpu = time.process_time() - self.cpu
+
+
+def probe_metrics(probes, success, timer):
+    """探测吞吐：probes_per_sec 为墙钟吞吐，probes_per_core 为每CPU秒可完成的探测数"""
+    return {
+        'probes': probes,
+        'success': success,
+        'wall_seconds': round(timer.wall, 4),
+        'cpu_seconds': round(timer.cpu, 4),
+        'probes_per_sec': round(probes / timer.wall, 1) if timer.wall > 0 else 0,
+        'probes_per_core': round(probes / timer.cpu, 1) if timer.cpu > 0 else 0,
+        'cpu_per_probe_us': round(timer.cpu / probes * 1e6, 1) if probes else 0,
+    }
+
+
+def bench_asyncio_engine(target_url, proxy_url, mode, count, concurrency):
+    """asyncio 引擎的探测开销，结果同 GUI 一样写入分片统计"""
+    stats = ShardedStats()
+    engine = ProbeEngine(proxy_url, timeout=10, mode=mode, pool_size=concurrency)
+    with CpuTimer() as timer:
+        engine.run_sync(target_url, count, concurrency, stats.record_result)
+    merged = stats.snapshot()
+    return probe_metrics(merged.total, merged.success, timer)
+
+
+def bench_thread_engine(target_url, proxy_url, mode, count, concurrency):
+    """线程池 + requests 的探测开销，使用与 GUI 线程池引擎相同的 ThreadProbeEngine 和发送控制器"""
+    stats = ShardedStats()
+    engine = ThreadProbeEngine(proxy_url, timeout=10, mode=mode, pool_size=concurrency, stats=stats)
+    engine.controller.set_concurrency(concurrency)
+    with CpuTimer() as timer:
+        engine.run(target_url, count)
+    engine.sessions.close()
+    merged = stats.snapshot()
+    return probe_metrics(merged.total, merged.success, timer)
+
+
+def bench_download(target_url, proxy_url, size_mb, repeat):
+    """下载路径：每CPU秒可处理的MB数（丢弃数据，不计服务器进程的开销）"""
+    url = f"{target_url}__down?bytes={size_mb * 1024 * 1024}"
+    total = 0
+    with CpuTimer() as timer:
+        for _ in range(repeat):
+            total += discard_download(url, proxy_url)
+    megabytes = total / 1024 / 1024
+    return {
+        'megabytes': round(megabytes, 1),
+        'wall_seconds': round(timer.wall, 4),
+        'cpu_seconds': round(timer.cpu, 4),
+        'mb_per_sec': round(megabytes / timer.wall, 1) if timer.wall > 0 else 0,
+        'mb_per_core': round(megabytes / timer.cpu, 1) if timer.cpu > 0 else 0,
+    }
+
+
+def sample_result(request_id, elapsed, success=True):
+    # 与 asyncio 引擎结果的字段一致，不保存响应体
+    if success:
+        return ProbeResult(request_id, STATUS_SUCCESS, "200", elapsed,
+                           f"请求ID: {request_id}\n响应时间: {elapsed:.2f}秒\n状态码: 200", size=22)
+    return ProbeResult(request_id, STATUS_FAILED, "503", 0, "HTTP错误: 503", error=ERROR_HTTP)
+
+
+def bench_result_memory(rows=MEMORY_ROWS):
+    """ResultStore 保存 rows 条结果占用的内存（含详情文本）"""
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        store = ResultStore()
+        for request_id in range(1, rows + 1):
+            elapsed = 0.05 + (request_id % 100) / 1000
+            success = request_id % 50 != 0
+            store.append(sample_result(request_id, elapsed, success))
+        used = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return {
+        'rows': rows,
+        'bytes': used,
+        'bytes_per_row': round(used / rows, 1),
+        'megabytes_per_100k': round(used / rows * 100000 / 1024 / 1024, 2),
+    }
+
+
+def bench_ui_lag(rate, duration):
+    """界面事件循环延迟：按 rate 条/秒产生结果，用与 GUI 相同的渲染调度、虚拟表格和统计刷新
+
+    需要图形环境，无法创建窗口时返回 skipped。
+    """
+    try:
+        import tkinter as tk
+        from render_scheduler import RenderScheduler
+        from virtual_table import VirtualTable
+        window = tk.Tk()
+    except Exception as e:
+        # 没有 tkinter 或没有可用的显示器（tk.TclError）
+        return {'skipped': f"无法创建窗口: {e}"}
+
+    store = ResultStore()
+    stats = ShardedStats()
+    result_queue = queue.Queue()
+    state = {'active': True}
+
+    def format_row(row):
+        request_id, success, elapsed_time, status_code, details = row
+        return (request_id, "成功" if success else "失败", f"{elapsed_time:.2f}",
+                status_code if success else details.split('\n')[0])
+
+    table = VirtualTable(window, store, ("request_id", "status", "response_time", "status_code"), format_row)
+    table.frame.pack(fill=tk.BOTH, expand=True)
+    stats_text = tk.Text(window, height=8)
+    stats_text.pack(fill=tk.BOTH)
+
+    def store_batch(batch):
+        for result in batch:
+            store.append(result)
+
+    def render_frame(changed):
+        if changed:
+            table.refresh()
+            snapshot = stats.snapshot()
+            stats_text.delete(1.0, tk.END)
+            stats_text.insert(tk.END, f"测试总数: {snapshot.total}\n成功次数: {snapshot.success}\n"
+                                      f"平均响应时间: {snapshot.latency.mean:.3f}秒\n")
+
+    def produce():
+        # 模拟引擎线程：按固定速率产生结果并写入统计分片
+        interval = 1.0 / rate
+        started = time.perf_counter()
+        request_id = 0
+        while time.perf_counter() - started < duration:
+            request_id += 1
+            elapsed = 0.05 + (request_id % 100) / 1000
+            result = sample_result(request_id, elapsed)
+            stats.record_result(result)
+            result_queue.put(result)
+            delay = started + request_id * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        state['active'] = False
+
+    scheduler = RenderScheduler(window, result_queue, store_batch, render_frame, is_active=lambda: state['active'])
+
+    def finish():
+        if scheduler.running:
+            window.after(50, finish)
+        else:
+            window.quit()
+
+    scheduler.start()
+    threading.Thread(target=produce, daemon=True).start()
+    window.after(50, finish)
+    window.mainloop()
+    window.destroy()
+
+    lag = scheduler.lag
+    return {
+        'results': len(store),
+        'rate': rate,
+        'frames': scheduler.frames,
+        'lag_mean_ms': round(lag.mean * 1000, 2),
+        'lag_p99_ms': round(lag.percentile(99) * 1000, 2),
+        'lag_max_ms': round(lag.max * 1000, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_benchmarks(args, log=print):
+    """依次执行各项测试，返回可直接写入JSON的结果"""
+    raise_fd_limit()
+    results = {}
+    with BenchServer() as server:
+        log(f"本地测试服务器: {server.target_url} | 代理: {server.proxy_url}")
+        for engine, bench in (('asyncio', bench_asyncio_engine), ('threads', bench_thread_engine)):
+            for mode in (MODE_COLD, MODE_WARM):
+                for route, proxy_url in (('direct', None), ('proxy', server.proxy_url)):
+                    name = f"probe_{engine}_{mode}_{route}"
+                    log(f"{name} ...")
+                    # 先用少量探测预热，避免首次导入和建连开销计入结果
+                    bench(server.target_url, proxy_url, mode, min(args.count, 50), args.concurrency)
+                    results[name] = bench(server.target_url, proxy_url, mode, args.count, args.concurrency)
+        for route, proxy_url in (('direct', None), ('proxy', server.proxy_url)):
+            name = f"download_{route}"
+            log(f"{name} ...")
+            results[name] = bench_download(server.target_url, proxy_url, args.download_mb, args.download_repeat)
+
+    log("result_memory ...")
+    results['result_memory'] = bench_result_memory()
+    log("ui_lag ...")
+    results['ui_lag'] = bench_ui_lag(args.ui_rate, args.ui_duration)
+
+    return {
+        'version': BENCHMARK_VERSION,
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parameters': {
+            'count': args.count,
+            'concurrency': args.concurrency,
+            'download_mb': args.download_mb,
+            'download_repeat': args.download_repeat,
+            'ui_rate': args.ui_rate,
+            'ui_duration': args.ui_duration,
+        },
+        'results': results,
+    }
+
+
+def compare_results(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """逐项比较两次结果，返回 [(测试, 指标, 旧值, 新值, 变化比例, 是否回退)]"""
+    changes = []
+    for name, metrics in current['results'].items():
+        old_metrics = baseline.get('results', {}).get(name) or {}
+        for key, value in metrics.items():
+            old = old_metrics.get(key)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            if key not in LOWER_IS_BETTER and not key.endswith(('_per_sec', '_per_core')):
+                continue
+            change = value / old - 1
+            worse = -change if key not in LOWER_IS_BETTER else change
+            changes.append((name, key, old, value, change, worse > threshold))
+    return changes
+
+
+def format_report(data):
+    text = f"版本 {data['revision'] or '未知'} | Python {data['python']} | {data['cpu_count']} 核\n"
+    for name, metrics in data['results'].items():
+        text += f"{name}: " + ", ".join(f"{key}={value}" for key, value in metrics.items()) + "\n"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测量测速工具自身的开销（本地服务器，结果保存为JSON）")
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT, help="结果文件")
+    parser.add_argument('--baseline', help="与之前保存的结果文件比较，指标变差超过10%%时返回非零")
+    parser.add_argument('--count', type=int, default=5000, help="每项探测测试的请求数")
+    parser.add_argument('--concurrency', type=int, default=50, help="探测并发数")
+    parser.add_argument('--download-mb', type=int, default=256, help="每次下载的大小（MB）")
+    parser.add_argument('--download-repeat', type=int, default=3, help="下载次数")
+    parser.add_argument('--ui-rate', type=int, default=5000, help="界面测试每秒产生的结果数")
+    parser.add_argument('--ui-duration', type=float, default=5, help="界面测试时长（秒）")
+    args = parser.parse_args(argv)
+
+    data = run_benchmarks(args)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(format_report(data))
+    print(f"结果已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressed = False
+        for name, key, old, value, change, worse in compare_results(baseline, data):
+            mark = "  <- 回退" if worse else ""
+            regressed = regressed or worse
+            print(f"{name}.{key}: {old} -> {value} ({change * 100:+.1f}%){mark}")
+        return 1 if regressed else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
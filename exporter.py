@@ -0,0 +1,168 @@
+import csv
+import io
+import json
+import operator
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from run_store import KIND_SPEED
+
+
+# 导出格式，按文件扩展名选择
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'
+FORMAT_PARQUET = 'parquet'
+EXPORT_FORMATS = {'.csv': FORMAT_CSV, '.ndjson': FORMAT_NDJSON, '.jsonl': FORMAT_NDJSON, '.parquet': FORMAT_PARQUET}
+# 每批读取和写出的行数，也是导出时内存中最多保留的行数（Parquet 每批一个行组）
+EXPORT_BATCH_SIZE = 10000
+
+# 各类结果的导出列：(列名, 类型)，类型用于 Parquet 列定义
+LATENCY_FIELDS = (('request_id', 'int'), ('success', 'bool'), ('elapsed', 'float'), ('status_code', 'str'),
+                  ('error', 'str'), ('bytes', 'int'), ('body_hash', 'str'), ('details', 'str'))
+# 速度测试的列名与 TransferResult 的属性名相同，速度单位为 KB/s
+SPEED_FIELDS = (('test_id', 'int'), ('success', 'bool'), ('url', 'str'), ('bytes', 'int'), ('elapsed', 'float'),
+                ('realtime_speed', 'float'), ('avg_speed', 'float'), ('error', 'str'))
+# 历史数据库中保存的明细（不含响应详情）
+STORED_PROBE_FIELDS = (('request_id', 'int'), ('ts', 'float'), ('success', 'bool'), ('status_code', 'str'),
+                       ('elapsed', 'float'), ('queue_delay', 'float'), ('error', 'str'), ('bytes', 'int'),
+                       ('proxy', 'str'))
+STORED_TRANSFER_FIELDS = (('transfer_id', 'int'), ('ts', 'float'), ('success', 'bool'), ('bytes', 'int'),
+                          ('elapsed', 'float'), ('avg_speed', 'float'), ('error', 'str'))
+
+MIME_TYPES = {FORMAT_CSV: 'text/csv', FORMAT_NDJSON: 'application/x-ndjson',
+              FORMAT_PARQUET: 'application/vnd.apache.parquet'}
+
+
+def format_for_path(path):
+    """按扩展名返回导出格式，未知扩展名按 CSV 处理"""
+    return EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), FORMAT_CSV)
+
+
+def check_format(fmt):
+    """格式不可用时返回错误信息"""
+    if fmt not in MIME_TYPES:
+        return f"不支持的导出格式: {fmt}"
+    if fmt == FORMAT_PARQUET and pyarrow is None:
+        return "导出 Parquet 需要安装 pyarrow（pip install pyarrow）"
+    return None
+
+
+def record_batches(records, fields, batch_size=EXPORT_BATCH_SIZE):
+    """把结果记录（属性名与导出列名相同）按批转换为导出行"""
+    get_row = operator.attrgetter(*(name for name, kind in fields))
+    for start in range(0, len(records), batch_size):
+        yield [get_row(record) for record in records[start:start + batch_size]]
+
+
+def iter_batches(rows, batch_size=EXPORT_BATCH_SIZE):
+    """把逐行迭代器切成批次"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class RecordWriter:
+    """逐批写出结果行，rows 为按 fields 顺序排列的元组
+
+    target 可以是文件路径或已打开的文件对象（CSV/NDJSON 为文本文件，Parquet 为二进制文件）。
+    """
+
+    def __init__(self, target, fields, fmt=None):
+        self.fmt = fmt or (format_for_path(target) if isinstance(target, str) else FORMAT_CSV)
+        error = check_format(self.fmt)
+        if error:
+            raise ValueError(error)
+        self.names = [name for name, kind in fields]
+        self.count = 0
+        self._owns_file = isinstance(target, str)
+        if self.fmt == FORMAT_PARQUET:
+            types = {'int': pyarrow.int64(), 'bool': pyarrow.bool_(), 'float': pyarrow.float64(),
+                     'str': pyarrow.string()}
+            self.schema = pyarrow.schema([(name, types[kind]) for name, kind in fields])
+            self.file = None
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(target, self.schema)
+            return
+        self.file = open(target, 'w', encoding='utf-8', newline='') if self._owns_file else target
+        # 复用同一个编码器，json.dumps 带参数时每次调用都会新建编码器
+        self.json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        if self.fmt == FORMAT_CSV:
+            self.csv_writer = csv.writer(self.file)
+            self.csv_writer.writerow(self.names)
+
+    def write_rows(self, rows):
+        if self.fmt == FORMAT_CSV:
+            self.csv_writer.writerows(rows)
+        elif self.fmt == FORMAT_NDJSON:
+            names, encode = self.names, self.json_encoder.encode
+            self.file.write(''.join(encode(dict(zip(names, row))) + '\n' for row in rows))
+        elif rows:
+            columns = list(zip(*rows))
+            self.parquet_writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+                schema=self.schema))
+        self.count += len(rows)
+
+    def close(self):
+        if self.fmt == FORMAT_PARQUET:
+            self.parquet_writer.close()
+        elif self._owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_batches(batches, target, fields, fmt=None, should_stop=None, on_progress=None):
+    """把结果批次写入 target，返回写出的行数
+
+    每次只持有一批数据，内存占用与结果总数无关；should_stop() 为真时提前结束，
+    on_progress(已写出行数) 在每批写完后调用。
+    """
+    with RecordWriter(target, fields, fmt) as writer:
+        for batch in batches:
+            if should_stop and should_stop():
+                break
+            writer.write_rows(batch)
+            if on_progress:
+                on_progress(writer.count)
+    return writer.count
+
+
+def stream_text(batches, fields, fmt):
+    """把结果批次编码为 CSV/NDJSON 文本块的生成器，供 HTTP 流式响应使用"""
+    buffer = io.StringIO()
+    writer = RecordWriter(buffer, fields, fmt)
+    for batch in batches:
+        writer.write_rows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # 没有任何批次时仍输出 CSV 表头
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stored_run_batches(store, run, batch_size=EXPORT_BATCH_SIZE):
+    """历史数据库中一次运行的明细，返回 (导出列, 批次迭代器)"""
+    if run['kind'] == KIND_SPEED:
+        fields, rows = STORED_TRANSFER_FIELDS, store.transfers(run['id'], batch_size)
+    else:
+        fields, rows = STORED_PROBE_FIELDS, store.probes(run['id'], batch_size)
+    # 数据库中以 0/1 保存是否成功
+    rows = (row[:2] + (bool(row[2]),) + row[3:] for row in rows)
+    return fields, iter_batches(rows, batch_size)
@@ -0,0 +1,182 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+
+import requests
+
+
+# 本机IP查询服务，按顺序发起，先返回有效结果的为准
+IP_SERVICES = [
+    'https://ipinfo.ipidea.io',
+    'https://ipinfo.io/json',
+    'https://api.ipify.org?format=json',
+    'https://api.myip.com',
+]
+LOOKUP_TIMEOUT = 10
+# 对冲延迟：前面的服务超过该时间（秒）未返回或已失败时，再向下一个服务发起查询，0 为同时发起
+HEDGE_DELAY = 0.3
+
+# 查询结果按网络接口缓存在磁盘上，启动时直接显示未过期的缓存，再在后台刷新
+IP_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.proxy_speed_test', 'ip_cache.json')
+IP_CACHE_TTL = 3600
+
+
+def parse_ip_info(data):
+    """把不同查询服务的返回格式统一为同一组字段"""
+    # asn 可能是包含名称、域名等的对象，也可能只是编号
+    asn = data.get('asn') or {}
+    if not isinstance(asn, dict):
+        asn = {'asn': asn}
+    return {
+        'ip': data.get('ip', ''),
+        'country': data.get('country_code', data.get('country', '')),
+        'region': data.get('province', data.get('region', '')),
+        'city': data.get('city', ''),
+        'country_code': data.get('country_code', data.get('countryCode', '')),
+        'org': data.get('org', ''),
+        'hostname': data.get('hostname', ''),
+        'loc': data.get('loc', ''),
+        'postal': data.get('postal', ''),
+        'timezone': data.get('timezone', ''),
+        'asn': asn.get('asn', ''),
+        'asn_name': asn.get('name', data.get('asn_name', '')),
+        'asn_domain': asn.get('domain', data.get('asn_domain', '')),
+        'asn_route': asn.get('route', data.get('asn_route', '')),
+        'asn_type': asn.get('type', data.get('asn_type', '')),
+    }
+
+
+def is_mainland_ip(info):
+    return info.get('country_code') == 'CN'
+
+
+def format_ip_info(info):
+    """格式化为界面和命令行显示的文本"""
+    text = f"IP: {info['ip']}"
+    if info['hostname']:
+        text += f"\n主机名: {info['hostname']}"
+    if info['country'] or info['region'] or info['city']:
+        text += f"\n位置: {info['country']} {info['region']} {info['city']}"
+    for key, label in (('loc', '坐标'), ('postal', '邮编'), ('timezone', '时区'), ('org', '组织'), ('asn', 'ASN'),
+                       ('asn_name', 'ASN名称'), ('asn_domain', 'ASN域名'), ('asn_route', 'ASN路由'),
+                       ('asn_type', 'ASN类型')):
+        if info[key]:
+            text += f"\n{label}: {info[key]}"
+
+    # 判断是否为国内IP
+    if is_mainland_ip(info):
+        text += "\n\n⚠️ 当前IP为中国大陆IP，可能无法正常使用代理服务"
+    else:
+        text += "\n\n✅ 当前IP为海外IP，可以正常使用代理服务"
+    return text
+
+
+def query_service(service_url, timeout=LOOKUP_TIMEOUT):
+    """查询单个服务，返回字段字典，失败或返回内容中没有IP时返回 None"""
+    try:
+        response = requests.get(service_url, timeout=timeout)
+        if response.status_code == 200:
+            info = parse_ip_info(response.json())
+            if info['ip']:
+                return info
+    except Exception:
+        pass  # 超时、请求异常或返回格式错误
+    return None
+
+
+def lookup_local_ip(services=IP_SERVICES, timeout=LOOKUP_TIMEOUT, hedge_delay=HEDGE_DELAY):
+    """对冲查询各服务，返回 (字段字典, 服务地址)，全部失败时返回 (None, None)
+
+    先查询第一个服务，每过 hedge_delay 秒仍无结果、或已发起的服务都失败时，立即向下一个服务发起查询，
+    取最先返回的有效结果。查询在守护线程中进行，返回后其余未完成的请求不会阻塞调用方或进程退出。
+    """
+    answers = queue.Queue()
+
+    def query(service_url):
+        answers.put((query_service(service_url, timeout), service_url))
+
+    started = finished = 0
+    while finished < len(services):
+        wait_time = None
+        if started < len(services):
+            threading.Thread(target=query, args=(services[started],), daemon=True).start()
+            started += 1
+            wait_time = hedge_delay
+        try:
+            info, service_url = answers.get(timeout=wait_time)
+        except queue.Empty:
+            continue  # 超过对冲延迟仍无结果，向下一个服务发起查询
+        finished += 1
+        if info:
+            return info, service_url
+    return None, None
+
+
+def network_key():
+    """当前默认路由所在网络接口的本机地址，用作缓存键，切换网络后缓存自然失效
+
+    连接 UDP 套接字只查询路由表，不发送数据；没有可用网络时返回空字符串。
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(('8.8.8.8', 80))
+            return sock.getsockname()[0]
+    except OSError:
+        return ''
+
+
+def load_cached_ip(key, ttl=IP_CACHE_TTL, path=IP_CACHE_PATH):
+    """读取该网络接口未过期的缓存，返回 (字段字典, 服务地址, 缓存时间)，没有时返回 None"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            entry = json.load(f).get(key)
+    except (OSError, ValueError, AttributeError):
+        return None
+    if not entry or time.time() - entry['time'] > ttl:
+        return None
+    return entry['info'], entry['service'], entry['time']
+
+
+def save_cached_ip(key, info, service_url, path=IP_CACHE_PATH):
+    """写入缓存，各网络接口的结果分别保存；写入失败时忽略"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            cache = json.load(f)
+        if not isinstance(cache, dict):
+            cache = {}
+    except (OSError, ValueError):
+        cache = {}
+    cache[key] = {'info': info, 'service': service_url, 'time': time.time()}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，避免多个进程同时写入时读到不完整的文件
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except OSError:
+        pass
+
+
+def refresh_local_ip(key=None, services=IP_SERVICES, timeout=LOOKUP_TIMEOUT, hedge_delay=HEDGE_DELAY,
+                     path=IP_CACHE_PATH):
+    """查询本机IP并写入缓存，返回 (字段字典, 服务地址)"""
+    if key is None:
+        key = network_key()
+    info, service_url = lookup_local_ip(services, timeout, hedge_delay)
+    if info:
+        save_cached_ip(key, info, service_url, path)
+    return info, service_url
+
+
+def format_cache_age(cached_at):
+    """缓存时间距今的描述，如 '3分钟前'"""
+    age = max(0, time.time() - cached_at)
+    if age < 60:
+        return "刚刚"
+    if age < 3600:
+        return f"{int(age // 60)}分钟前"
+    return f"{int(age // 3600)}小时前"
@@ -0,0 +1,162 @@
+from array import array
+
+
+# 每个2的幂区间细分为 64 个子桶，相对误差不超过 1/64（约1.6%）
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+# 以微秒为单位记录，最大可跟踪约 1 小时，超出部分计入最后一个桶
+MAX_TRACKABLE_US = 3600 * 1000 * 1000
+MAX_SHIFT = MAX_TRACKABLE_US.bit_length() - SUB_BUCKET_BITS
+BUCKET_COUNT = SUB_BUCKET_COUNT + MAX_SHIFT * SUB_BUCKET_HALF
+
+# 统计面板和导出中报告的百分位
+REPORT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value_us):
+    if value_us < SUB_BUCKET_COUNT:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS
+    if shift > MAX_SHIFT:
+        return BUCKET_COUNT - 1
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + ((value_us >> shift) - SUB_BUCKET_HALF)
+
+
+def bucket_value(index):
+    # 返回桶内的中间值（微秒）
+    if index < SUB_BUCKET_COUNT:
+        return index
+    shift = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+    sub_bucket = (index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return (sub_bucket << shift) + (1 << (shift - 1))
+
+
+class LatencyHistogram:
+    """固定内存的对数分桶延迟直方图（HDR风格）
+
+    记录为O(1)，内存与样本数无关；可按百分位查询，并可与其他直方图合并
+    （跨多次测试、多个工作线程或进程）。对外接口以秒为单位。
+    """
+
+    def __init__(self):
+        self.counts = array('Q', bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def record(self, seconds):
+        self.record_us(int(seconds * 1e6))
+
+    def record_ns(self, nanoseconds):
+        self.record_us(nanoseconds // 1000)
+
+    def record_us(self, value_us):
+        if value_us < 0:
+            value_us = 0
+        self.counts[bucket_index(value_us)] += 1
+        self.count += 1
+        self.total_us += value_us
+        if self.min_us is None or value_us < self.min_us:
+            self.min_us = value_us
+        if value_us > self.max_us:
+            self.max_us = value_us
+
+    def merge(self, other):
+        """将另一个直方图的样本合并进来"""
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.min_us is not None and (self.min_us is None or other.min_us < self.min_us):
+            self.min_us = other.min_us
+        if other.max_us > self.max_us:
+            self.max_us = other.max_us
+        return self
+
+    def percentile(self, percentile):
+        """返回给定百分位（0-100）的延迟（秒），无样本时返回 0"""
+        if self.count == 0:
+            return 0
+        target = max(1, int(self.count * percentile / 100 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= target:
+                    # 不超过实际记录到的最大值
+                    return min(bucket_value(index), self.max_us) / 1e6
+        return self.max_us / 1e6
+
+    def percentiles(self, percentiles=REPORT_PERCENTILES):
+        # 一次遍历计算多个百分位，返回 {百分位: 秒}
+        result = {}
+        if self.count == 0:
+            return {p: 0 for p in percentiles}
+        targets = sorted((max(1, int(self.count * p / 100 + 0.5)), p) for p in percentiles)
+        seen = 0
+        position = 0
+        for index, count in enumerate(self.counts):
+            if not count:
+                continue
+            seen += count
+            while position < len(targets) and seen >= targets[position][0]:
+                result[targets[position][1]] = min(bucket_value(index), self.max_us) / 1e6
+                position += 1
+            if position == len(targets):
+                break
+        return result
+
+    @property
+    def mean(self):
+        return self.total_us / self.count / 1e6 if self.count else 0
+
+    @property
+    def min(self):
+        return (self.min_us or 0) / 1e6
+
+    @property
+    def max(self):
+        return self.max_us / 1e6
+
+    def summary(self):
+        """返回 count/mean/min/max/p50/p90/p99/p99.9（秒），用于显示和导出"""
+        summary = {'count': self.count, 'mean': self.mean, 'min': self.min, 'max': self.max}
+        for percentile, value in self.percentiles().items():
+            summary[f"p{percentile:g}"] = value
+        return summary
+
+    def to_dict(self):
+        # 稀疏序列化，只保存非空桶，便于跨进程传输和持久化
+        return {
+            'buckets': {index: count for index, count in enumerate(self.counts) if count},
+            'count': self.count,
+            'total_us': self.total_us,
+            'min_us': self.min_us,
+            'max_us': self.max_us,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for index, count in data['buckets'].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data['count']
+        histogram.total_us = data['total_us']
+        histogram.min_us = data['min_us']
+        histogram.max_us = data['max_us']
+        return histogram
+
+
+def format_latency_summary(histogram):
+    # 格式化为统计面板中的百分位文本
+    if histogram.count == 0:
+        return "暂无数据\n"
+    summary = histogram.summary()
+    return (f"p50 {summary['p50']:.3f}秒 | p90 {summary['p90']:.3f}秒\n"
+            f"p99 {summary['p99']:.3f}秒 | p99.9 {summary['p99.9']:.3f}秒\n"
+            f"最大 {summary['max']:.3f}秒\n")
@@ -0,0 +1,207 @@
+import asyncio
+import sys
+import time
+
+from probe_engine import ProbeEngine, MODE_COLD, raise_fd_limit
+from stats_aggregator import StatsShard
+
+
+# 扫描维度：逐步提高并发数（闭环），或逐步提高目标RPS（开环）
+SWEEP_CONCURRENCY = 'concurrency'
+SWEEP_RATE = 'rate'
+SWEEP_NAMES = {SWEEP_CONCURRENCY: '并发', SWEEP_RATE: 'RPS'}
+
+# 拐点判定：相比上一步吞吐提升不足 10% 而 p99 上升超过 25%，或错误率超过 5%
+KNEE_THROUGHPUT_GAIN = 0.10
+KNEE_LATENCY_GROWTH = 0.25
+MAX_ERROR_RATE = 0.05
+# RPS扫描的实际吞吐跟随目标RPS，改为判定：实际吞吐低于目标的 90%，或 p99 比上一步翻倍；
+# 实际吞吐按探测的计划发送时间归入步骤，发送跟不上计划（排队延迟）时吞吐下降；
+# 毫秒级的 p99 在步骤间波动较大，单独使用时阈值比并发扫描高
+KNEE_RATE_ACHIEVED = 0.90
+KNEE_RATE_LATENCY_GROWTH = 1.0
+
+
+def parse_schedule(text):
+    """解析逗号分隔的步骤列表（如 "10,20,50,100"），要求为递增的正数"""
+    values = [float(part) for part in text.replace('，', ',').split(',') if part.strip()]
+    if not values or values[0] <= 0 or values != sorted(values):
+        raise ValueError("步骤列表必须是递增的正数")
+    return values
+
+
+def summarize_step(value, stats, elapsed, success=None):
+    """汇总一个步骤的吞吐、错误率和延迟百分位；开环步骤使用校正耗时
+
+    吞吐为 success / elapsed：success 为计入本步骤的成功次数，未给出时使用全部成功次数。
+    """
+    if success is None:
+        success = stats.success
+    latency = stats.corrected if stats.corrected.count else stats.latency
+    percentiles = latency.percentiles((50, 90, 99)) if latency.count else {}
+    return {
+        'value': value,
+        'total': stats.total,
+        'success': stats.success,
+        'error_rate': stats.failed / stats.total if stats.total else 0,
+        'throughput': success / elapsed if elapsed > 0 else 0,
+        'p50': percentiles.get(50),
+        'p90': percentiles.get(90),
+        'p99': percentiles.get(99),
+    }
+
+
+def find_knee(steps, kind=SWEEP_CONCURRENCY):
+    """返回 (拐点步骤序号, 推荐步骤序号)，未出现拐点时拐点为 None
+
+    并发扫描以吞吐不再提升而 p99 上升为拐点；RPS扫描的吞吐跟随目标RPS，
+    以实际吞吐跟不上目标或 p99 明显上升为拐点。
+    推荐工作点为拐点之前吞吐最高的步骤；第一步就过载时没有推荐值。
+    """
+    knee = None
+    for index, step in enumerate(steps):
+        if step['error_rate'] > MAX_ERROR_RATE:
+            knee = index
+            break
+        if kind == SWEEP_RATE and step['throughput'] < KNEE_RATE_ACHIEVED * step['value']:
+            knee = index
+            break
+        if index == 0:
+            continue
+        previous = steps[index - 1]
+        if not previous['throughput'] or not previous['p99'] or step['p99'] is None:
+            continue
+        gain = step['throughput'] / previous['throughput'] - 1
+        growth = step['p99'] / previous['p99'] - 1
+        if kind == SWEEP_RATE:
+            saturated = growth > KNEE_RATE_LATENCY_GROWTH
+        else:
+            saturated = gain < KNEE_THROUGHPUT_GAIN and growth > KNEE_LATENCY_GROWTH
+        if saturated:
+            knee = index
+            break
+    candidates = range(knee if knee is not None else len(steps))
+    recommended = max(candidates, key=lambda index: steps[index]['throughput'], default=None)
+    return knee, recommended
+
+
+def format_sweep_report(kind, steps, knee=None, recommended=None):
+    name = SWEEP_NAMES[kind]
+    text = f"{name:>8} {'请求':>7} {'错误率':>7} {'吞吐(次/秒)':>11} {'p50':>8} {'p90':>8} {'p99':>8}\n"
+    for index, step in enumerate(steps):
+        latencies = "".join(f" {step[key]:8.3f}" if step[key] is not None else f" {'N/A':>8}"
+                            for key in ('p50', 'p90', 'p99'))
+        mark = "  <- 拐点" if index == knee else ""
+        text += (f"{step['value']:>8g} {step['total']:>7} {step['error_rate'] * 100:>6.1f}% "
+                 f"{step['throughput']:>11.1f}{latencies}{mark}\n")
+    if recommended is not None:
+        step = steps[recommended]
+        text += f"\n推荐工作点: {name} {step['value']:g}（吞吐 {step['throughput']:.1f} 次/秒"
+        if step['p99'] is not None:
+            text += f"，p99 {step['p99']:.3f}秒"
+        text += "）\n"
+    elif steps and knee == 0:
+        text += "\n第一步即已过载，请从更低的负载开始扫描\n"
+    if steps and knee is None:
+        text += "未检测到拐点，可继续提高负载\n"
+    return text
+
+
+class LoadSweep:
+    """按步骤逐级加压，寻找代理的饱和拐点
+
+    每个步骤持续 step_duration 秒：并发扫描在闭环模式下以给定并发持续发送，
+    RPS扫描在开环模式下以给定到达率发送。每步结束后汇总吞吐、错误率和延迟百分位。
+    """
+
+    def __init__(self, target_url, proxy_url=None, kind=SWEEP_CONCURRENCY, schedule=(), step_duration=10,
+                 timeout=10, mode=MODE_COLD, pool_size=10):
+        self.target_url = target_url
+        self.proxy_url = proxy_url
+        self.kind = kind
+        self.schedule = list(schedule)
+        self.step_duration = step_duration
+        self.timeout = timeout
+        self.mode = mode
+        self.pool_size = pool_size
+        self.steps = []
+        self.stopped = False
+        # 进度信息，由事件循环线程写入，界面线程只读
+        self.step_index = 0
+        self.step_stats = None
+        self.engine = None
+
+    def stop(self):
+        self.stopped = True
+        if self.engine:
+            self.engine.stop()
+
+    async def run_step(self, value):
+        stats = StatsShard()
+        self.step_stats = stats
+        engine = ProbeEngine(self.proxy_url, timeout=self.timeout, mode=self.mode, pool_size=self.pool_size,
+                             body_limit=0)
+        self.engine = engine
+        if self.kind == SWEEP_RATE:
+            return await self.run_rate_step(value, stats, engine)
+        started = time.monotonic()
+        window = {}
+
+        def end_window():
+            # 加压窗口结束：记下窗口内完成的成功次数和时长，之后等待在途探测完成的排空时间不计入吞吐
+            window['success'] = stats.success
+            window['elapsed'] = time.monotonic() - started
+            engine.stop()
+
+        window_handle = asyncio.get_running_loop().call_later(self.step_duration, end_window)
+        try:
+            # 持续发送直到步骤时间用完，停止后等待在途探测完成
+            await engine.run(self.target_url, sys.maxsize, int(value), stats.record_result)
+        finally:
+            window_handle.cancel()
+        if not window:
+            # 提前停止
+            end_window()
+        return summarize_step(value, stats, window['elapsed'], window['success'])
+
+    async def run_rate_step(self, value, stats, engine):
+        """开环步骤：按计划发送时间把全部探测归入本步骤，等待它们完成后再汇总
+
+        只统计窗口内完成的次数会漏掉尾部的在途探测，延迟较高的正常代理也会显得吞吐不足。
+        吞吐按发送时长计算：计划时长加上最大排队延迟，发送跟不上计划时吞吐随之下降。
+        """
+        count = max(1, int(value * self.step_duration))
+        started = time.monotonic()
+        delays = {'max': 0.0}
+
+        def on_result(result):
+            stats.record_result(result)
+            if result.queue_delay and result.queue_delay > delays['max']:
+                delays['max'] = result.queue_delay
+
+        await engine.run_open_loop(self.target_url, value, count, on_result)
+        if self.stopped:
+            # 提前停止时只发出了部分探测，按实际时长计算
+            elapsed = time.monotonic() - started
+        else:
+            elapsed = count / value + delays['max']
+        return summarize_step(value, stats, elapsed)
+
+    async def run(self, on_step=None):
+        """依次执行各步骤，每完成一步调用 on_step(step)，返回 (拐点, 推荐) 序号"""
+        raise_fd_limit()
+        self.stopped = False
+        self.steps = []
+        for index, value in enumerate(self.schedule):
+            if self.stopped:
+                break
+            self.step_index = index
+            step = await self.run_step(value)
+            self.steps.append(step)
+            if on_step:
+                on_step(step)
+        self.engine = None
+        return find_knee(self.steps, self.kind)
+
+    def run_sync(self, on_step=None):
+        return asyncio.run(self.run(on_step))
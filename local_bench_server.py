@@ -0,0 +1,569 @@
+import argparse
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from probe_engine import read_response_head
+
+
+# 本地测试目标和转发代理的默认端口
+DEFAULT_TARGET_PORT = 8080
+DEFAULT_PROXY_PORT = 8081
+# 下载响应和中转时每次写出的最大字节数
+WRITE_BLOCK = 64 * 1024
+ZERO_BLOCK = bytes(WRITE_BLOCK)
+# 中转时单次读取的最大字节数
+RELAY_BLOCK = 256 * 1024
+MAX_HEADER_SIZE = 64 * 1024
+
+REASONS = {
+    200: 'OK', 204: 'No Content', 206: 'Partial Content', 400: 'Bad Request', 403: 'Forbidden',
+    404: 'Not Found', 407: 'Proxy Authentication Required', 416: 'Range Not Satisfiable',
+    429: 'Too Many Requests', 500: 'Internal Server Error', 502: 'Bad Gateway',
+    503: 'Service Unavailable', 504: 'Gateway Timeout',
+}
+
+
+class FaultInjector:
+    """按配置注入故障：响应前延迟（含抖动）、带宽上限、错误状态码、直接断开连接
+
+    bandwidth 为每个连接每个方向的上限（字节/秒），0 表示不限速；
+    error_rate、drop_rate 为 0-1 之间的概率。
+    """
+
+    def __init__(self, latency=0, jitter=0, bandwidth=0, error_rate=0, error_status=503, drop_rate=0,
+                 seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+
+    async def delay(self):
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0, self.latency + self.random.uniform(-self.jitter, self.jitter)))
+
+    def should_drop(self):
+        return self.drop_rate > 0 and self.random.random() < self.drop_rate
+
+    def should_fail(self):
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def throttle(self):
+        return Throttle(self.bandwidth)
+
+
+class Throttle:
+    """按带宽上限控制发送节奏，发送超前时等待"""
+
+    def __init__(self, bandwidth=0):
+        self.bandwidth = bandwidth
+        self.started = time.monotonic()
+        self.sent = 0
+
+    async def pace(self, count):
+        if not self.bandwidth:
+            return
+        self.sent += count
+        ahead = self.started + self.sent / self.bandwidth - time.monotonic()
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+
+async def read_request_head(reader):
+    """读取请求行和请求头，返回 (方法, 请求目标, 协议版本, 请求头)，连接关闭时返回 None"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ValueError("请求头过长")
+    lines = head.decode('iso-8859-1').split('\r\n')
+    method, target, version = lines[0].split(' ', 2)
+    headers = {}
+    for line in lines[1:]:
+        key, sep, value = line.partition(':')
+        if sep:
+            headers[key.strip().lower()] = value.strip()
+    return method.upper(), target, version, headers
+
+
+def wants_keep_alive(version, headers):
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+
+def response_head(status, headers=(), keep_alive=True):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'Unknown')}"]
+    lines.extend(f"{key}: {value}" for key, value in headers)
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1')
+
+
+def simple_response(status, body, content_type='application/json', keep_alive=True, extra_headers=()):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    headers = [('Content-Type', content_type), ('Content-Length', len(body))]
+    headers.extend(extra_headers)
+    return response_head(status, headers, keep_alive) + body
+
+
+async def discard_body(reader, headers):
+    """读取并丢弃请求体，返回字节数"""
+    received = 0
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return received
+            received += len(await reader.readexactly(size))
+            await reader.readexactly(2)
+    remaining = int(headers.get('content-length', 0))
+    while remaining:
+        data = await reader.read(min(remaining, RELAY_BLOCK))
+        if not data:
+            raise asyncio.IncompleteReadError(b'', remaining)
+        received += len(data)
+        remaining -= len(data)
+    return received
+
+
+def parse_range(value, size):
+    # 只支持单个区间 bytes=start-end / bytes=start- / bytes=-suffix，无法满足时返回 None
+    if not value.startswith('bytes=') or ',' in value:
+        return None
+    start, _, end = value[6:].partition('-')
+    if not start:
+        length = int(end)
+        return (max(0, size - length), size - 1) if length else None
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    return (start, end) if start <= end else None
+
+
+class LocalTargetServer:
+    """本地测试目标，模拟测试中用到的外部端点
+
+    - /__down?bytes=N   下载 N 字节（支持 Range），对应速度测试的下载文件
+    - /__up             POST 上传，丢弃请求体并返回收到的字节数
+    - /status/<code>    返回指定状态码
+    - 其他路径          返回一段与 IP 查询接口相似的 JSON
+    """
+
+    def __init__(self, faults=None):
+        self.faults = faults or FaultInjector()
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        peer = writer.get_extra_info('peername') or ('', 0)
+        try:
+            while True:
+                request = await read_request_head(reader)
+                if request is None:
+                    break
+                method, target, version, headers = request
+                self.requests += 1
+                keep_alive = wants_keep_alive(version, headers)
+                await self.faults.delay()
+                if self.faults.should_drop():
+                    break
+                if method in ('POST', 'PUT'):
+                    received = await discard_body(reader, headers)
+                else:
+                    received = 0
+                if self.faults.should_fail():
+                    status = self.faults.error_status
+                    writer.write(simple_response(status, json.dumps({'error': REASONS.get(status, 'error')}),
+                                                 keep_alive=keep_alive))
+                else:
+                    await self.respond(writer, method, target, headers, peer, received, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, method, target, headers, peer, received, keep_alive):
+        parts = urlsplit(target)
+        path = parts.path
+        if path == '/__down':
+            size = int(parse_qs(parts.query).get('bytes', ['0'])[0])
+            await self.send_download(writer, method, size, headers.get('range'), keep_alive)
+        elif path == '/__up':
+            writer.write(simple_response(200, json.dumps({'received': received}), keep_alive=keep_alive))
+        elif path.startswith('/status/'):
+            status = int(path.rsplit('/', 1)[1] or 200)
+            writer.write(simple_response(status, json.dumps({'status': status}), keep_alive=keep_alive))
+        else:
+            body = json.dumps({
+                'ip': peer[0],
+                'city': 'Localhost',
+                'region': 'Local',
+                'country': 'ZZ',
+                'org': 'local-bench-server',
+                'path': path,
+            })
+            writer.write(simple_response(200, body, keep_alive=keep_alive))
+
+    async def send_download(self, writer, method, size, range_header, keep_alive):
+        start, end, status = 0, size - 1, 200
+        extra_headers = [('Accept-Ranges', 'bytes')]
+        if range_header:
+            byte_range = parse_range(range_header, size)
+            if byte_range is None:
+                writer.write(simple_response(416, b'', extra_headers=[('Content-Range', f"bytes */{size}")],
+                                             keep_alive=keep_alive))
+                return
+            start, end = byte_range
+            status = 206
+            extra_headers.append(('Content-Range', f"bytes {start}-{end}/{size}"))
+        length = max(0, end - start + 1)
+        headers = [('Content-Type', 'application/octet-stream'), ('Content-Length', length)] + extra_headers
+        writer.write(response_head(status, headers, keep_alive))
+        if method == 'HEAD':
+            return
+        throttle = self.faults.throttle()
+        remaining = length
+        while remaining:
+            count = min(remaining, WRITE_BLOCK)
+            writer.write(ZERO_BLOCK if count == WRITE_BLOCK else ZERO_BLOCK[:count])
+            await writer.drain()
+            await throttle.pace(count)
+            remaining -= count
+
+
+async def pipe(reader, writer, throttle):
+    # 单向中转直到对端关闭
+    try:
+        while True:
+            data = await reader.read(RELAY_BLOCK)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+            await throttle.pace(len(data))
+    except OSError:
+        pass
+    finally:
+        if writer.can_write_eof():
+            try:
+                writer.write_eof()
+            except OSError:
+                pass
+
+
+async def relay_body(reader, writer, headers, throttle, status_code=200, is_head=False, is_request=False):
+    """按 Content-Length / chunked / 连接关闭 转发消息体，返回是否以连接关闭结束
+
+    请求没有 Content-Length 和 chunked 时视为没有请求体。
+    """
+    if is_head or 100 <= status_code < 200 or status_code in (204, 304):
+        return False
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        while True:
+            size_line = await reader.readline()
+            writer.write(size_line)
+            size = int(size_line.split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                while True:
+                    line = await reader.readline()
+                    writer.write(line)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                await writer.drain()
+                return False
+            remaining = size + 2
+            while remaining:
+                data = await reader.read(min(remaining, RELAY_BLOCK))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                writer.write(data)
+                await writer.drain()
+                await throttle.pace(len(data))
+                remaining -= len(data)
+    if 'content-length' in headers:
+        remaining = int(headers['content-length'])
+        while remaining:
+            data = await reader.read(min(remaining, RELAY_BLOCK))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', remaining)
+            writer.write(data)
+            await writer.drain()
+            await throttle.pace(len(data))
+            remaining -= len(data)
+        return False
+    if is_request:
+        return False
+    await pipe(reader, writer, throttle)
+    return True
+
+
+class LocalForwardProxy:
+    """本地 HTTP 转发代理：支持 CONNECT 隧道和绝对地址的普通 HTTP 请求
+
+    auth 为 "user:pass" 时要求 Basic 认证，失败返回 407。故障注入作用于每个请求：
+    延迟在建立隧道/转发之前，错误时返回 faults.error_status，中断时直接关闭客户端连接。
+    """
+
+    def __init__(self, faults=None, auth=None):
+        self.faults = faults or FaultInjector(error_status=502)
+        self.auth_header = 'Basic ' + base64.b64encode(auth.encode('utf-8')).decode('ascii') if auth else None
+        self.requests = 0
+        self.tunnels = 0
+
+    async def handle(self, reader, writer):
+        # 普通请求的上游连接按 (主机, 端口) 缓存在客户端连接上
+        upstreams = {}
+        try:
+            while True:
+                request = await read_request_head(reader)
+                if request is None:
+                    break
+                method, target, version, headers = request
+                self.requests += 1
+                keep_alive = wants_keep_alive(version, headers) and \
+                    headers.get('proxy-connection', '').lower() != 'close'
+                if self.auth_header and headers.get('proxy-authorization') != self.auth_header:
+                    writer.write(simple_response(407, '代理认证失败', 'text/plain; charset=utf-8',
+                                                 keep_alive=False,
+                                                 extra_headers=[('Proxy-Authenticate', 'Basic realm="proxy"')]))
+                    await writer.drain()
+                    break
+                await self.faults.delay()
+                if self.faults.should_drop():
+                    break
+                if self.faults.should_fail():
+                    status = self.faults.error_status
+                    writer.write(simple_response(status, REASONS.get(status, 'error'), 'text/plain',
+                                                 keep_alive=False))
+                    await writer.drain()
+                    break
+                if method == 'CONNECT':
+                    await self.tunnel(reader, writer, target)
+                    break
+                if not await self.forward(reader, writer, method, target, version, headers, upstreams, keep_alive):
+                    break
+        except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            for _, upstream_writer in upstreams.values():
+                upstream_writer.close()
+            writer.close()
+
+    async def tunnel(self, reader, writer, target):
+        host, _, port = target.rpartition(':')
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(host.strip('[]'), int(port))
+        except (OSError, ValueError):
+            writer.write(simple_response(502, '无法连接目标', 'text/plain; charset=utf-8', keep_alive=False))
+            await writer.drain()
+            return
+        self.tunnels += 1
+        writer.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+        await writer.drain()
+        try:
+            await asyncio.gather(pipe(reader, upstream_writer, self.faults.throttle()),
+                                 pipe(upstream_reader, writer, self.faults.throttle()))
+        finally:
+            upstream_writer.close()
+
+    async def forward(self, reader, writer, method, target, version, headers, upstreams, keep_alive):
+        """转发一个普通HTTP请求，返回客户端连接是否可以继续使用"""
+        parts = urlsplit(target)
+        if parts.scheme != 'http' or not parts.hostname:
+            writer.write(simple_response(400, '需要绝对地址', 'text/plain; charset=utf-8', keep_alive=False))
+            await writer.drain()
+            return False
+        key = (parts.hostname, parts.port or 80)
+        upstream = upstreams.get(key)
+        if upstream is None or upstream[1].is_closing():
+            try:
+                upstream = await asyncio.open_connection(*key)
+            except OSError:
+                writer.write(simple_response(502, '无法连接目标', 'text/plain; charset=utf-8', keep_alive=False))
+                await writer.drain()
+                return False
+            upstreams[key] = upstream
+        upstream_reader, upstream_writer = upstream
+
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        lines = [f"{method} {path} {version}"]
+        for key_name, value in headers.items():
+            if key_name in ('proxy-authorization', 'proxy-connection'):
+                continue
+            lines.append(f"{key_name}: {value}")
+        upstream_writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1'))
+        await relay_body(reader, upstream_writer, headers, Throttle(), is_request=True)
+        await upstream_writer.drain()
+
+        status_code, response_headers = await read_response_head(upstream_reader)
+        response_lines = [f"HTTP/1.1 {status_code} {REASONS.get(status_code, 'Unknown')}"]
+        response_lines.extend(f"{key_name}: {value}" for key_name, value in response_headers.items())
+        writer.write(('\r\n'.join(response_lines) + '\r\n\r\n').encode('iso-8859-1'))
+        closed = await relay_body(upstream_reader, writer, response_headers, self.faults.throttle(),
+                                  status_code, method == 'HEAD')
+        await writer.drain()
+        if closed or response_headers.get('connection', '').lower() == 'close':
+            upstream_writer.close()
+            upstreams.pop(key, None)
+            return False
+        return keep_alive
+
+
+class LocalBenchServer:
+    """同时运行本地测试目标和转发代理，可在后台线程中启动，供自测和离线测试使用
+
+    端口为 0 时由系统分配，启动后可从 target_port / proxy_port 读取实际端口。
+    """
+
+    def __init__(self, host='127.0.0.1', target_port=DEFAULT_TARGET_PORT, proxy_port=DEFAULT_PROXY_PORT,
+                 target_faults=None, proxy_faults=None, proxy_auth=None):
+        self.host = host
+        self.target_port = target_port
+        self.proxy_port = proxy_port
+        self.target = LocalTargetServer(target_faults)
+        self.proxy = LocalForwardProxy(proxy_faults, proxy_auth)
+        self.loop = None
+        self._servers = []
+        # 所有客户端连接，停止时主动断开，让各连接的处理协程自然结束
+        self._connections = set()
+        self._stop_event = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    @property
+    def target_url(self):
+        return f"http://{self.host}:{self.target_port}/"
+
+    @property
+    def proxy_url(self):
+        return f"http://{self.host}:{self.proxy_port}"
+
+    def _tracked(self, handler):
+        async def handle(reader, writer):
+            self._connections.add(writer)
+            try:
+                await handler(reader, writer)
+            finally:
+                self._connections.discard(writer)
+        return handle
+
+    async def start_servers(self):
+        target_server = await asyncio.start_server(self._tracked(self.target.handle), self.host, self.target_port,
+                                                   limit=MAX_HEADER_SIZE, backlog=4096)
+        proxy_server = await asyncio.start_server(self._tracked(self.proxy.handle), self.host, self.proxy_port,
+                                                  limit=MAX_HEADER_SIZE, backlog=4096)
+        self._servers = [target_server, proxy_server]
+        self.target_port = target_server.sockets[0].getsockname()[1]
+        self.proxy_port = proxy_server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self, on_ready=None):
+        await self.start_servers()
+        self._stop_event = asyncio.Event()
+        self._ready.set()
+        if on_ready:
+            on_ready()
+        try:
+            await self._stop_event.wait()
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        for server in self._servers:
+            server.close()
+        for writer in list(self._connections):
+            writer.transport.abort()
+        for server in self._servers:
+            await server.wait_closed()
+        # 等待各连接的处理协程处理完断开，最多等待1秒
+        for _ in range(100):
+            if not self._connections:
+                break
+            await asyncio.sleep(0.01)
+
+    def start(self):
+        """在后台线程中启动，返回时端口已可用"""
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.loop.run_until_complete(self.serve_forever())
+            finally:
+                self.loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def stop(self):
+        if self.loop and self._stop_event:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+        if self._thread:
+            self._thread.join(5)
+
+
+def faults_from_args(args, prefix, default_status):
+    return FaultInjector(
+        latency=getattr(args, f"{prefix}latency") / 1000,
+        jitter=getattr(args, f"{prefix}jitter") / 1000,
+        bandwidth=int(getattr(args, f"{prefix}bandwidth") * 1024),
+        error_rate=getattr(args, f"{prefix}error_rate"),
+        error_status=getattr(args, f"{prefix}error_status") or default_status,
+        drop_rate=getattr(args, f"{prefix}drop_rate"),
+        seed=args.seed,
+    )
+
+
+def add_fault_arguments(parser, prefix, label):
+    option = prefix.replace('_', '-')
+    parser.add_argument(f"--{option}latency", type=float, default=0, help=f"{label}响应前的延迟（毫秒）")
+    parser.add_argument(f"--{option}jitter", type=float, default=0, help=f"{label}延迟的随机抖动（毫秒）")
+    parser.add_argument(f"--{option}bandwidth", type=float, default=0, help=f"{label}每连接带宽上限（KB/s），0为不限")
+    parser.add_argument(f"--{option}error-rate", type=float, default=0, help=f"{label}返回错误状态码的概率（0-1）")
+    parser.add_argument(f"--{option}error-status", type=int, default=0, help=f"{label}错误时返回的状态码")
+    parser.add_argument(f"--{option}drop-rate", type=float, default=0, help=f"{label}直接断开连接的概率（0-1）")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地测试目标服务器和 HTTP/CONNECT 转发代理，用于离线测试和自测")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_TARGET_PORT, help="测试目标端口")
+    parser.add_argument('--proxy-port', type=int, default=DEFAULT_PROXY_PORT, help="转发代理端口")
+    parser.add_argument('--proxy-auth', help="代理认证，格式 user:pass")
+    parser.add_argument('--seed', type=int, help="故障注入的随机种子，便于复现")
+    add_fault_arguments(parser, '', "目标")
+    add_fault_arguments(parser, 'proxy_', "代理")
+    args = parser.parse_args(argv)
+
+    server = LocalBenchServer(args.host, args.port, args.proxy_port,
+                              target_faults=faults_from_args(args, '', 503),
+                              proxy_faults=faults_from_args(args, 'proxy_', 502),
+                              proxy_auth=args.proxy_auth)
+
+    def print_urls():
+        auth = f"{args.proxy_auth}@" if args.proxy_auth else ''
+        print(f"测试目标: {server.target_url}")
+        print(f"下载地址: {server.target_url}__down?bytes=10485760")
+        print(f"上传地址: {server.target_url}__up")
+        print(f"转发代理: http://{auth}{args.host}:{server.proxy_port}")
+
+    try:
+        asyncio.run(server.serve_forever(print_urls))
+    except KeyboardInterrupt:
+        print(f"\n目标请求: {server.target.requests} | 代理请求: {server.proxy.requests} | 隧道: {server.proxy.tunnels}")
+
+
+if __name__ == '__main__':
+    main()
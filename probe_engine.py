@@ -0,0 +1,678 @@
+import asyncio
+import base64
+import hashlib
+import ipaddress
+import json
+import socket
+import ssl
+import time
+from urllib.parse import urlsplit, unquote
+
+from rate_control import DispatchController, POLL_INTERVAL
+
+
+# 探测结果状态，与线程池引擎 ThreadProbeEngine.probe 的返回保持一致
+STATUS_SUCCESS = "成功"
+STATUS_FAILED = "失败"
+
+# 非HTTP状态码的错误分类
+ERROR_TIMEOUT = 'TIMEOUT'
+ERROR_PROXY = 'PROXY_ERROR'
+ERROR_CONNECTION = 'CONNECTION_ERROR'
+# 目标返回非200状态码，以及执行测试本身出错（非网络原因）
+ERROR_HTTP = 'HTTP_ERROR'
+ERROR_EXECUTION = 'EXECUTION_ERROR'
+
+USER_AGENT = 'proxy-speed-test/asyncio'
+# 未指定目标地址时使用的默认目标
+DEFAULT_TARGET_URL = "https://ipinfo.io/json"
+
+# 连接模式：cold 每次探测新建连接，warm 复用保持连接的隧道，both 交替执行便于对比
+MODE_COLD = 'cold'
+MODE_WARM = 'warm'
+MODE_BOTH = 'both'
+CONNECTION_MODES = (MODE_COLD, MODE_WARM, MODE_BOTH)
+
+# 每次探测默认保存的响应体字节数，0 表示不保存响应体（纯吞吐测试）
+DEFAULT_BODY_LIMIT = 1024
+# 响应体哈希的字节数
+BODY_HASH_SIZE = 16
+
+
+# 单次探测的各阶段，依次为：DNS解析、TCP连接（代理或目标）、CONNECT隧道、TLS握手、首字节、响应体
+PHASES = ('dns', 'connect', 'tunnel', 'tls', 'ttfb', 'body')
+PHASE_NAMES = {
+    'dns': 'DNS解析',
+    'connect': 'TCP连接',
+    'tunnel': 'CONNECT隧道',
+    'tls': 'TLS握手',
+    'ttfb': '首字节',
+    'body': '响应体',
+}
+PHASE_DNS, PHASE_CONNECT, PHASE_TUNNEL, PHASE_TLS, PHASE_TTFB, PHASE_BODY = range(len(PHASES))
+
+# 解析结果的默认缓存时间（秒），0 表示每次探测都重新解析并计入DNS阶段
+DNS_CACHE_TTL = 0
+
+# 开环模式下在途探测数的安全上限，超过时等待，等待时间计入排队延迟
+OPEN_LOOP_MAX_IN_FLIGHT = 10000
+
+
+class PhaseTimer:
+    """用 perf_counter_ns 记录各阶段耗时（纳秒），未经历的阶段保持 None"""
+    __slots__ = ('durations', '_last')
+
+    def __init__(self):
+        self.durations = [None] * len(PHASES)
+        self._last = time.perf_counter_ns()
+
+    def reset(self):
+        # 复用连接失败重试时，从头重新计时
+        self.durations = [None] * len(PHASES)
+        self._last = time.perf_counter_ns()
+
+    def mark(self, phase):
+        now = time.perf_counter_ns()
+        self.durations[phase] = now - self._last
+        self._last = now
+
+
+class PhaseAggregate:
+    """各阶段耗时的累计统计，用于统计面板和导出"""
+
+    def __init__(self):
+        self.counts = [0] * len(PHASES)
+        self.totals = [0] * len(PHASES)
+        self.maxima = [0] * len(PHASES)
+
+    def add(self, durations):
+        if not durations:
+            return
+        for index, duration in enumerate(durations):
+            if duration is None:
+                continue
+            self.counts[index] += 1
+            self.totals[index] += duration
+            if duration > self.maxima[index]:
+                self.maxima[index] = duration
+
+    def merge(self, other):
+        for index in range(len(PHASES)):
+            self.counts[index] += other.counts[index]
+            self.totals[index] += other.totals[index]
+            if other.maxima[index] > self.maxima[index]:
+                self.maxima[index] = other.maxima[index]
+        return self
+
+    def to_dict(self):
+        # 原始累计值，用于跨进程传输
+        return {'counts': self.counts, 'totals': self.totals, 'maxima': self.maxima}
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        aggregate.counts = list(data['counts'])
+        aggregate.totals = list(data['totals'])
+        aggregate.maxima = list(data['maxima'])
+        return aggregate
+
+    def as_dict(self):
+        # 返回 {阶段: {'count', 'avg_ms', 'max_ms'}}，只包含有样本的阶段
+        summary = {}
+        for index, phase in enumerate(PHASES):
+            if self.counts[index]:
+                summary[phase] = {
+                    'count': self.counts[index],
+                    'avg_ms': self.totals[index] / self.counts[index] / 1e6,
+                    'max_ms': self.maxima[index] / 1e6,
+                }
+        return summary
+
+
+def phases_to_ms(durations):
+    # 将纳秒耗时列表转换为 {阶段: 毫秒}，跳过未经历的阶段
+    if not durations:
+        return {}
+    return {phase: duration / 1e6 for phase, duration in zip(PHASES, durations) if duration is not None}
+
+
+def format_phases(durations):
+    return "\n".join(f"{PHASE_NAMES[phase]}: {ms:.1f}ms" for phase, ms in phases_to_ms(durations).items())
+
+
+def capture_body(body, limit):
+    """保留响应体的前 limit 字节和完整内容的哈希，limit 为 0 时都不保存"""
+    if not limit:
+        return b'', b''
+    return body[:limit], hashlib.blake2b(body, digest_size=BODY_HASH_SIZE).digest()
+
+
+def format_body(body, size, digest):
+    """查看详情时才解码和格式化响应体：完整保存的JSON缩进显示，截断或非JSON时显示原文"""
+    if not digest:
+        return f"响应大小: {size} 字节（未保存响应体）"
+    text = body.decode('utf-8', errors='replace')
+    header = f"响应大小: {size} 字节\n哈希: {digest.hex()}"
+    if len(body) < size:
+        header += f"\n（只保存了前 {len(body)} 字节）"
+    else:
+        try:
+            text = json.dumps(json.loads(text), ensure_ascii=False, indent=2)
+        except ValueError:
+            pass
+    return f"{header}\n\n响应数据:\n{text}"
+
+
+def mode_for_request(mode, request_id):
+    # both 模式下奇数请求走 cold，偶数请求走 warm，使两组样本在时间上交错
+    if mode == MODE_BOTH:
+        return MODE_COLD if request_id % 2 else MODE_WARM
+    return mode
+
+
+class ProbeResult:
+    """单次探测的结果
+
+    线程池、asyncio 和多进程引擎以及 app.py 都产生这一种记录，经结果队列、统计、
+    历史记录和导出传递，不再从详情文本中解析状态码。
+    """
+    __slots__ = ('request_id', 'status', 'status_code', 'elapsed', 'details', 'timeout', 'mode', 'reused',
+                 'phases', 'queue_delay', 'body', 'bytes', 'body_hash', 'error', 'proxy', 'target', 'started')
+
+    def __init__(self, request_id, status, status_code, elapsed=0, details="", timeout=False,
+                 mode=MODE_COLD, reused=False, phases=None, queue_delay=None, body=b'', size=0, body_hash=b'',
+                 error=None, proxy=None, target=None, started=None):
+        self.request_id = request_id
+        self.status = status
+        self.status_code = status_code
+        self.elapsed = elapsed
+        self.details = details
+        self.timeout = timeout
+        self.mode = mode
+        self.reused = reused
+        # 失败的错误分类（ERROR_*），成功时为 None
+        self.error = error
+        # 代理地址和目标地址，同一次运行的所有结果共用同一个字符串对象
+        self.proxy = proxy
+        self.target = target
+        # 发起探测的时间（time.time()），历史记录按它保存每条探测的时间
+        self.started = started
+        # 各阶段耗时（纳秒），顺序见 PHASES
+        self.phases = phases
+        # 开环模式下计划发送时间到实际发送的延迟（秒），闭环模式为 None
+        self.queue_delay = queue_delay
+        # 截断后的响应体前缀、完整响应体的字节数和哈希，格式化留到查看详情时再做
+        self.body = body
+        self.bytes = size
+        self.body_hash = body_hash
+
+    @property
+    def success(self):
+        return self.status == STATUS_SUCCESS
+
+    @property
+    def corrected_elapsed(self):
+        # 从计划发送时间算起的耗时，包含排队延迟
+        return self.elapsed + (self.queue_delay or 0)
+
+    @property
+    def brief(self):
+        # 表格中显示的一行摘要：成功为状态码，失败为详情的第一行
+        return self.status_code if self.success else self.details.split('\n', 1)[0]
+
+
+class ProxyConnectError(Exception):
+    """代理服务器拒绝或无法建立连接"""
+
+    def __init__(self, message, status_code=ERROR_PROXY):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def parse_proxy(proxy_url):
+    """解析代理地址，返回 (主机, 端口, Proxy-Authorization头) ，无代理时返回 None"""
+    if not proxy_url:
+        return None
+    if '://' not in proxy_url:
+        proxy_url = 'http://' + proxy_url
+    parts = urlsplit(proxy_url)
+    auth_header = None
+    if parts.username is not None:
+        credentials = f"{unquote(parts.username)}:{unquote(parts.password or '')}"
+        auth_header = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+    return parts.hostname, parts.port or 80, auth_header
+
+
+def is_ip_literal(host):
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+def raise_fd_limit():
+    """尽量提高进程可打开的文件描述符数量，以支撑上千个并发连接"""
+    try:
+        import resource
+    except ImportError:
+        return
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY:
+            hard = 65536
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def parse_status_line(status_line):
+    # 状态行形如 "HTTP/1.1 200 OK"，格式不对时抛出 ValueError，由 probe 归为连接错误
+    parts = status_line.decode('iso-8859-1').strip().split(' ', 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/') or len(parts[1]) != 3 or not parts[1].isdigit():
+        raise ValueError(f"无效的状态行: {status_line[:100]!r}")
+    return int(parts[1])
+
+
+async def read_response_head(reader, timer=None):
+    # 读取状态行和响应头，收到状态行即视为首字节到达
+    status_line = await reader.readuntil(b'\r\n')
+    if timer:
+        timer.mark(PHASE_TTFB)
+    status_code = parse_status_line(status_line)
+    headers = {}
+    while True:
+        line = await reader.readuntil(b'\r\n')
+        if line == b'\r\n':
+            break
+        key, sep, value = line.decode('iso-8859-1').partition(':')
+        if sep:
+            headers[key.strip().lower()] = value.strip()
+    return status_code, headers
+
+
+async def read_response_body(reader, status_code, headers):
+    # 按 Content-Length / chunked / 连接关闭 三种方式读取响应体
+    if 100 <= status_code < 200 or status_code in (204, 304):
+        return b''
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                # 跳过 trailer
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        return b''.join(chunks)
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+    return await reader.read()
+
+
+def build_request(method, url_parts, absolute_form=False, auth_header=None, keep_alive=False):
+    host = url_parts.hostname
+    default_port = 443 if url_parts.scheme == 'https' else 80
+    host_header = host if not url_parts.port or url_parts.port == default_port else f"{host}:{url_parts.port}"
+    path = url_parts.path or '/'
+    if url_parts.query:
+        path += '?' + url_parts.query
+    target = f"{url_parts.scheme}://{host_header}{path}" if absolute_form else path
+    lines = [
+        f"{method} {target} HTTP/1.1",
+        f"Host: {host_header}",
+        f"User-Agent: {USER_AGENT}",
+        "Accept: */*",
+        "Accept-Encoding: identity",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if auth_header:
+        lines.append(f"Proxy-Authorization: {auth_header}")
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1')
+
+
+class ConnectionPool:
+    """保持连接的隧道池，按目标缓存空闲连接，每个目标最多保留 pool_size 个"""
+
+    def __init__(self, pool_size=10):
+        self.pool_size = pool_size
+        self._idle = {}
+
+    def acquire(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def release(self, key, reader, writer):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < self.pool_size and not writer.is_closing():
+            idle.append((reader, writer))
+        else:
+            writer.close()
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
+
+
+class ProbeEngine:
+    """基于asyncio的探测引擎，不依赖Tk，可由GUI线程、Flask或命令行驱动
+
+    一个事件循环即可同时维持上千个并发探测，每个探测返回的成功/失败/超时/状态码
+    与线程池引擎 ThreadProbeEngine.probe 一致。
+    """
+
+    def __init__(self, proxy_url=None, timeout=10, mode=MODE_COLD, pool_size=10, ssl_context=None,
+                 body_limit=DEFAULT_BODY_LIMIT, dns_ttl=DNS_CACHE_TTL):
+        self.proxy_url = proxy_url
+        self.proxy = parse_proxy(proxy_url)
+        self.timeout = timeout
+        self.mode = mode
+        self.body_limit = body_limit
+        self.pool = ConnectionPool(pool_size)
+        # 已解析的地址 {(主机, 端口): ((IP, 端口), 过期时间)} 和进行中的解析 {(主机, 端口): Task}，
+        # 本引擎的所有探测共用；dns_ttl 为 0 时不缓存，只合并同时发起的解析
+        self.dns_ttl = dns_ttl
+        self._addresses = {}
+        self._lookups = {}
+        # 批量扫描时可共享同一个SSL上下文，避免为每个代理重复加载证书
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        # 发送控制：限速、并发上限、暂停/继续，运行中可随时调整
+        self.controller = DispatchController()
+
+    def stop(self):
+        self.controller.stop()
+
+    async def _resolve(self, host, port):
+        """解析主机地址，同时发起的解析共用同一次查询；dns_ttl 大于 0 时按 (主机, 端口) 缓存
+
+        getaddrinfo 在默认线程池中执行，高并发下的排队时间会被计入DNS阶段，可开启缓存避免。
+        缓存过期或连接失败后重新解析，轮询DNS的网关不会整次运行固定在一个IP上。
+        返回 (地址, 是否等待了解析)；命中缓存时不计DNS阶段。
+        """
+        key = (host, port)
+        cached = self._addresses.get(key)
+        if cached:
+            if cached[1] > time.monotonic():
+                return cached[0], False
+            del self._addresses[key]
+        loop = asyncio.get_running_loop()
+        lookup = self._lookups.get(key)
+        # 上一个事件循环中未完成的查询不能在新的事件循环中等待
+        if lookup is None or lookup.get_loop() is not loop:
+            lookup = loop.create_task(loop.getaddrinfo(host, port, type=socket.SOCK_STREAM))
+            self._lookups[key] = lookup
+        try:
+            # 单个探测超时被取消时不取消共用的查询
+            addresses = await asyncio.shield(lookup)
+        finally:
+            # 查询失败时不缓存，后续探测重新解析
+            if lookup.done() and self._lookups.get(key) is lookup:
+                del self._lookups[key]
+        address = addresses[0][4][:2]
+        if self.dns_ttl > 0:
+            self._addresses[key] = (address, time.monotonic() + self.dns_ttl)
+        return address, True
+
+    async def _open_connection(self, host, port, timer):
+        # 分别计时DNS解析和TCP连接，IP地址无需解析
+        if is_ip_literal(host):
+            address = (host, port)
+        else:
+            address, looked_up = await self._resolve(host, port)
+            if looked_up:
+                timer.mark(PHASE_DNS)
+        try:
+            reader, writer = await asyncio.open_connection(address[0], address[1])
+        except OSError:
+            # 缓存的地址可能已失效，下次探测重新解析
+            self._addresses.pop((host, port), None)
+            raise
+        timer.mark(PHASE_CONNECT)
+        return reader, writer
+
+    async def _open_tunnel(self, url_parts, timer):
+        # 建立到目标的连接（直连或经过代理），返回 (reader, writer)
+        host = url_parts.hostname
+        is_https = url_parts.scheme == 'https'
+        port = url_parts.port or (443 if is_https else 80)
+
+        if not self.proxy:
+            reader, writer = await self._open_connection(host, port, timer)
+        else:
+            proxy_host, proxy_port, auth_header = self.proxy
+            try:
+                reader, writer = await self._open_connection(proxy_host, proxy_port, timer)
+            except OSError as e:
+                raise ProxyConnectError(f"代理服务器连接失败: {e}")
+
+        if not is_https:
+            # HTTP目标直接发送请求（经代理时使用绝对URI）
+            return reader, writer
+
+        # HTTPS目标经代理时先通过CONNECT建立隧道，再在隧道内完成TLS握手
+        try:
+            if self.proxy:
+                await self._connect_tunnel(reader, writer, host, port, auth_header)
+                timer.mark(PHASE_TUNNEL)
+            await writer.start_tls(self.ssl_context, server_hostname=host)
+            timer.mark(PHASE_TLS)
+        except BaseException:
+            writer.close()
+            raise
+        return reader, writer
+
+    async def _connect_tunnel(self, reader, writer, host, port, auth_header):
+        connect_lines = [f"CONNECT {host}:{port} HTTP/1.1", f"Host: {host}:{port}"]
+        if auth_header:
+            connect_lines.append(f"Proxy-Authorization: {auth_header}")
+        writer.write(('\r\n'.join(connect_lines) + '\r\n\r\n').encode('iso-8859-1'))
+        await writer.drain()
+        status_code, headers = await read_response_head(reader)
+        if status_code != 200:
+            body = b''
+            try:
+                body = await asyncio.wait_for(read_response_body(reader, status_code, headers), 2)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError):
+                pass
+            message = body.decode('utf-8', errors='replace') or "代理服务器连接失败"
+            raise ProxyConnectError(message, str(status_code))
+
+    def _pool_key(self, url_parts):
+        # 经代理访问HTTP目标时，同一条代理连接可服务任意目标
+        if self.proxy and url_parts.scheme == 'http':
+            return ('proxy',)
+        return url_parts.scheme, url_parts.hostname, url_parts.port
+
+    async def _exchange(self, reader, writer, url_parts, keep_alive, pool_key, timer):
+        absolute_form = bool(self.proxy) and url_parts.scheme == 'http'
+        auth_header = self.proxy[2] if absolute_form else None
+        writer.write(build_request('GET', url_parts, absolute_form, auth_header, keep_alive))
+        await writer.drain()
+        status_code, headers = await read_response_head(reader, timer)
+        body = await read_response_body(reader, status_code, headers)
+        timer.mark(PHASE_BODY)
+        # 只有长度明确且服务器未要求关闭的连接才放回连接池
+        reusable = (keep_alive and headers.get('connection', '').lower() != 'close'
+                    and ('content-length' in headers or 'chunked' in headers.get('transfer-encoding', '').lower()))
+        if reusable:
+            self.pool.release(pool_key, reader, writer)
+        else:
+            writer.close()
+        return status_code, body
+
+    async def _fetch(self, url, mode, timer):
+        url_parts = urlsplit(url)
+        keep_alive = mode == MODE_WARM
+        pool_key = self._pool_key(url_parts)
+        if keep_alive:
+            connection = self.pool.acquire(pool_key)
+            if connection:
+                reader, writer = connection
+                try:
+                    status_code, body = await self._exchange(reader, writer, url_parts, True, pool_key, timer)
+                    return status_code, body, True
+                except (OSError, asyncio.IncompleteReadError):
+                    # 空闲连接已被对端关闭，改用新连接重试
+                    writer.close()
+                    timer.reset()
+
+        reader, writer = await self._open_tunnel(url_parts, timer)
+        try:
+            status_code, body = await self._exchange(reader, writer, url_parts, keep_alive, pool_key, timer)
+        except BaseException:
+            writer.close()
+            raise
+        return status_code, body, False
+
+    async def probe(self, url, request_id):
+        """执行单次探测，不抛出异常"""
+        mode = mode_for_request(self.mode, request_id)
+        started = time.time()
+        start_time = time.perf_counter_ns()
+        timer = PhaseTimer()
+        proxy_url = self.proxy_url
+        try:
+            status_code, body, reused = await asyncio.wait_for(self._fetch(url, mode, timer), self.timeout)
+        except asyncio.TimeoutError:
+            # 超时的探测也保留已完成阶段的耗时，便于判断卡在哪一阶段
+            return ProbeResult(request_id, STATUS_FAILED, ERROR_TIMEOUT, 0, "连接超时", timeout=True, mode=mode,
+                               phases=timer.durations, error=ERROR_TIMEOUT, proxy=proxy_url, target=url,
+                               started=started)
+        except ProxyConnectError as e:
+            return ProbeResult(request_id, STATUS_FAILED, e.status_code, 0, str(e), mode=mode,
+                               phases=timer.durations, error=ERROR_PROXY, proxy=proxy_url, target=url,
+                               started=started)
+        except (OSError, ssl.SSLError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            return ProbeResult(request_id, STATUS_FAILED, ERROR_CONNECTION, 0, f"连接错误: {str(e)}", mode=mode,
+                               phases=timer.durations, error=ERROR_CONNECTION, proxy=proxy_url, target=url,
+                               started=started)
+        elapsed_time = (time.perf_counter_ns() - start_time) / 1e9
+
+        # 只保留截断的原始响应体和哈希，解码和格式化在查看详情时由 format_body 完成
+        prefix, digest = capture_body(body, self.body_limit)
+        if status_code == 200:
+            details = (f"请求ID: {request_id}\n响应时间: {elapsed_time:.2f}秒\n状态码: {status_code}\n"
+                       f"连接模式: {mode}{' (复用连接)' if reused else ''}\n"
+                       f"{format_phases(timer.durations)}")
+            return ProbeResult(request_id, STATUS_SUCCESS, str(status_code), elapsed_time, details,
+                               mode=mode, reused=reused, phases=timer.durations, body=prefix, size=len(body),
+                               body_hash=digest, proxy=proxy_url, target=url, started=started)
+        return ProbeResult(request_id, STATUS_FAILED, str(status_code), 0, f"HTTP错误: {status_code}", mode=mode,
+                           reused=reused, phases=timer.durations, body=prefix, size=len(body), body_hash=digest,
+                           error=ERROR_HTTP, proxy=proxy_url, target=url, started=started)
+
+    async def run(self, url, count, concurrency=None, on_result=None, first_request_id=1):
+        """执行 count 次探测，每完成一次调用 on_result(result)
+
+        每个探测在获得 self.controller 的发送许可后才创建，在途任务数不超过并发上限，
+        内存占用与并发数成正比，与测试次数无关；暂停、限速和并发调整在几毫秒内生效。
+        """
+        raise_fd_limit()
+        controller = self.controller
+        if concurrency:
+            controller.set_concurrency(concurrency)
+        in_flight = set()
+        slot_freed = asyncio.Event()
+        next_id = first_request_id
+        last_id = first_request_id + count
+
+        def on_done(task):
+            in_flight.discard(task)
+            slot_freed.set()
+            if on_result and not task.cancelled():
+                on_result(task.result())
+
+        try:
+            while next_id < last_id and not controller.stopped:
+                wait_time = controller.try_acquire(len(in_flight))
+                if wait_time:
+                    # 等待令牌或空闲槽位，有任务完成时提前唤醒
+                    slot_freed.clear()
+                    try:
+                        await asyncio.wait_for(slot_freed.wait(), wait_time)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                task = asyncio.create_task(self.probe(url, next_id))
+                next_id += 1
+                in_flight.add(task)
+                task.add_done_callback(on_done)
+            if in_flight:
+                await asyncio.wait(set(in_flight))
+        finally:
+            self.pool.close()
+
+    async def run_open_loop(self, url, rate, count, on_result=None, first_request_id=1,
+                            max_in_flight=OPEN_LOOP_MAX_IN_FLIGHT):
+        """开环模式：按固定到达率 rate（次/秒）发出 count 次探测，不等待已发出的探测完成
+
+        第 i 次探测的计划发送时间为 开始时间 + i / rate，代理变慢时发送速率不变。
+        实际发送相对计划时间的延迟（事件循环繁忙、在途过多）记入 queue_delay，
+        校正耗时从计划发送时间算起，避免协调遗漏使延迟看起来偏低。
+        暂停期间的计划整体后移，暂停时长不计入排队延迟。
+        """
+        raise_fd_limit()
+        controller = self.controller
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / rate
+        in_flight = set()
+        slot_freed = asyncio.Event()
+
+        def on_done(task):
+            in_flight.discard(task)
+            slot_freed.set()
+            if on_result and not task.cancelled():
+                on_result(task.result())
+
+        async def scheduled_probe(request_id, intended):
+            # 任务真正开始执行时才计算排队延迟
+            queue_delay = max(0.0, loop.time() - intended)
+            result = await self.probe(url, request_id)
+            result.queue_delay = queue_delay
+            return result
+
+        start = loop.time()
+        try:
+            for index in range(count):
+                if controller.stopped:
+                    break
+                delay = start + index * interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if controller.paused:
+                    paused_at = loop.time()
+                    while controller.paused and not controller.stopped:
+                        await asyncio.sleep(POLL_INTERVAL)
+                    start += loop.time() - paused_at
+                intended = start + index * interval
+                while len(in_flight) >= max_in_flight and not controller.stopped:
+                    slot_freed.clear()
+                    try:
+                        await asyncio.wait_for(slot_freed.wait(), POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                task = asyncio.create_task(scheduled_probe(first_request_id + index, intended))
+                in_flight.add(task)
+                task.add_done_callback(on_done)
+            if in_flight:
+                await asyncio.wait(set(in_flight))
+        finally:
+            self.pool.close()
+
+    def run_sync(self, url, count, concurrency=None, on_result=None, first_request_id=1):
+        """在当前线程中创建事件循环并运行，供GUI的后台线程和Flask调用"""
+        asyncio.run(self.run(url, count, concurrency, on_result, first_request_id))
+
+    def run_open_loop_sync(self, url, rate, count, on_result=None, first_request_id=1):
+        asyncio.run(self.run_open_loop(url, rate, count, on_result, first_request_id))
@@ -0,0 +1,198 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+
+from probe_engine import ProbeEngine, MODE_COLD, DEFAULT_BODY_LIMIT
+from rate_control import DispatchController
+from stats_aggregator import StatsShard, ShardedStats
+
+
+# 工作进程上报统计和结果的间隔（秒），也是暂停、限速等设置传到工作进程的最大延迟
+MERGE_INTERVAL = 0.2
+# 共享控制数组的下标：由主进程写入，工作进程只读
+CONTROL_PAUSED, CONTROL_STOPPED, CONTROL_RATE, CONTROL_BURST, CONTROL_CONCURRENCY = range(5)
+CONTROL_SIZE = 5
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def split_evenly(total, parts):
+    """把 total 尽量平均地分成 parts 份，前面的份数多分余数"""
+    size, remainder = divmod(total, parts)
+    return [size + (1 if index < remainder else 0) for index in range(parts)]
+
+
+def apply_control(controller, control, index, workers):
+    # 把总并发、总速率按工作进程数均分后应用到本进程的发送控制器
+    if control[CONTROL_PAUSED]:
+        controller.pause()
+    else:
+        controller.resume()
+    if control[CONTROL_STOPPED]:
+        controller.stop()
+    concurrency = int(control[CONTROL_CONCURRENCY])
+    controller.set_concurrency(max(1, split_evenly(concurrency, workers)[index]))
+    rate = control[CONTROL_RATE] / workers
+    if rate != controller.bucket.rate:
+        controller.set_rate(rate, max(1, int(control[CONTROL_BURST] / workers)))
+
+
+async def run_worker(index, workers, settings, control, out_queue):
+    """工作进程中的探测循环：运行自己的 asyncio 引擎，定期上报累计统计和新结果"""
+    engine = ProbeEngine(settings['proxy_url'], timeout=settings['timeout'], mode=settings['mode'],
+                         pool_size=settings['pool_size'], body_limit=settings['body_limit'])
+    apply_control(engine.controller, control, index, workers)
+    shard = StatsShard()
+    pending = []
+    collect = settings['collect_results']
+
+    def on_result(result):
+        shard.record_result(result)
+        if collect:
+            pending.append(result)
+
+    def flush():
+        out_queue.put(('stats', index, shard.to_dict()))
+        if pending:
+            out_queue.put(('results', index, pending[:]))
+            pending.clear()
+
+    async def report():
+        while True:
+            await asyncio.sleep(MERGE_INTERVAL)
+            apply_control(engine.controller, control, index, workers)
+            flush()
+
+    reporter = asyncio.create_task(report())
+    try:
+        if settings['open_loop']:
+            await engine.run_open_loop(settings['url'], settings['rate'], settings['count'], on_result,
+                                       settings['first_request_id'])
+        else:
+            await engine.run(settings['url'], settings['count'], on_result=on_result,
+                             first_request_id=settings['first_request_id'])
+    finally:
+        reporter.cancel()
+        flush()
+
+
+def worker_main(index, workers, settings, control, out_queue):
+    # 工作进程入口，必须位于模块顶层以便 spawn 方式启动
+    error = None
+    try:
+        asyncio.run(run_worker(index, workers, settings, control, out_queue))
+    except Exception as e:
+        error = f"工作进程 {index} 执行错误: {e}"
+    out_queue.put(('done', index, error))
+
+
+class ProcessPoolRunner:
+    """把探测任务分片到多个工作进程执行，绕开单进程的GIL限制
+
+    每个工作进程运行自己的 asyncio 引擎，负责一段连续的请求ID，总并发和总速率按进程数均分。
+    闭环模式下进程数不超过总并发；运行中把总并发调低到进程数以下时，每个进程仍保留一个并发。
+    工作进程每 MERGE_INTERVAL 秒上报一次累计统计，主进程按进程编号替换到 self.stats 中，
+    因此 self.stats.snapshot() 始终是所有进程合并后的实时结果。
+    self.controller 的暂停、限速、并发和停止设置会同步到各工作进程。
+    """
+
+    def __init__(self, proxy_url=None, timeout=10, mode=MODE_COLD, pool_size=10, workers=None, stats=None,
+                 body_limit=DEFAULT_BODY_LIMIT):
+        self.proxy_url = proxy_url
+        self.timeout = timeout
+        self.mode = mode
+        self.pool_size = pool_size
+        self.body_limit = body_limit
+        self.workers = max(1, workers or default_workers())
+        self.controller = DispatchController()
+        # 可传入调用方已有的统计，与其中本进程记录的数据一起合并显示
+        self.stats = stats if stats is not None else ShardedStats()
+        self.errors = []
+        self._runs = 0
+
+    def stop(self):
+        self.controller.stop()
+
+    def _sync_control(self, control):
+        controller = self.controller
+        control[CONTROL_PAUSED] = 1 if controller.paused else 0
+        control[CONTROL_STOPPED] = 1 if controller.stopped else 0
+        control[CONTROL_RATE] = controller.bucket.rate
+        control[CONTROL_BURST] = controller.bucket.burst
+        control[CONTROL_CONCURRENCY] = controller.concurrency
+
+    def run(self, url, count, concurrency=None, on_results=None, first_request_id=1, rate=0, open_loop=False):
+        """执行 count 次探测并阻塞到全部完成，每收到一批结果调用 on_results(results)
+
+        open_loop 为真时各进程按 rate / 进程数 的到达率开环发送。结果在工作进程中批量
+        收集后传回，不需要逐条结果时传入 on_results=None 可省去传输开销。
+        """
+        if concurrency:
+            self.controller.set_concurrency(concurrency)
+        workers = max(1, min(self.workers, count))
+        if not open_loop:
+            # 每个工作进程至少占用一个并发，进程数不超过总并发，在途请求才不会多于设定值
+            workers = min(workers, self.controller.concurrency)
+        # 多次运行共用同一份统计时，各次运行的工作进程分片互不覆盖
+        self._runs += 1
+        run_key = (id(self), self._runs)
+        # spawn 方式不继承界面线程和打开的连接，在各平台上行为一致
+        context = multiprocessing.get_context('spawn')
+        control = context.Array('d', CONTROL_SIZE, lock=False)
+        self._sync_control(control)
+        out_queue = context.Queue()
+
+        processes = []
+        next_id = first_request_id
+        for index, worker_count in enumerate(split_evenly(count, workers)):
+            settings = {
+                'url': url,
+                'proxy_url': self.proxy_url,
+                'timeout': self.timeout,
+                'mode': self.mode,
+                'pool_size': self.pool_size,
+                'count': worker_count,
+                'first_request_id': next_id,
+                'rate': rate / workers,
+                'open_loop': open_loop,
+                'collect_results': on_results is not None,
+                # 不回传逐条结果时不需要保存响应体
+                'body_limit': self.body_limit if on_results is not None else 0,
+            }
+            next_id += worker_count
+            process = context.Process(target=worker_main, args=(index, workers, settings, control, out_queue),
+                                      daemon=True)
+            process.start()
+            processes.append(process)
+
+        running = set(range(workers))
+        try:
+            while running:
+                self._sync_control(control)
+                try:
+                    kind, index, payload = out_queue.get(timeout=MERGE_INTERVAL)
+                except queue.Empty:
+                    # 工作进程异常退出（如被系统终止）时不会再有消息
+                    for index in list(running):
+                        if processes[index].exitcode not in (None, 0):
+                            running.discard(index)
+                            self.errors.append(f"工作进程 {index} 异常退出: {processes[index].exitcode}")
+                    continue
+                if kind == 'stats':
+                    self.stats.set_remote_shard((run_key, index), StatsShard.from_dict(payload))
+                elif kind == 'results':
+                    on_results(payload)
+                elif kind == 'done':
+                    running.discard(index)
+                    if payload:
+                        self.errors.append(payload)
+        finally:
+            if running:
+                control[CONTROL_STOPPED] = 1
+            for process in processes:
+                process.join(5)
+                if process.is_alive():
+                    process.terminate()
@@ -0,0 +1,169 @@
+import asyncio
+import csv
+import json
+import ssl
+import time
+
+from probe_engine import ProbeEngine, MODE_COLD, raise_fd_limit
+
+
+# 每个代理的汇总字段，CSV 输出按此顺序
+SCAN_FIELDS = ('proxy', 'alive', 'attempts', 'success', 'p50', 'p90', 'max', 'error')
+
+
+def normalize_proxy_line(line):
+    """将代理列表中的一行转换为代理URL，无法识别时返回 None
+
+    支持 host:port、user:pass@host:port、host:port:user:pass 以及 http://... 形式。
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if '://' in line:
+        return line
+    if '@' in line:
+        return 'http://' + line
+    parts = line.split(':')
+    if len(parts) == 2:
+        return f"http://{parts[0]}:{parts[1]}"
+    if len(parts) == 4:
+        host, port, user, password = parts
+        return f"http://{user}:{password}@{host}:{port}"
+    return None
+
+
+def iter_proxy_file(path):
+    # 逐行读取，不把整个列表载入内存
+    with open(path, 'r', encoding='utf-8', errors='replace') as proxy_file:
+        for line in proxy_file:
+            proxy_url = normalize_proxy_line(line)
+            if proxy_url:
+                yield proxy_url
+
+
+def percentile_of_sorted(values, percentile):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(len(values) * percentile / 100 + 0.5) - 1))
+    return values[index]
+
+
+def summarize_proxy(proxy_url, results):
+    """汇总单个代理的多次探测结果"""
+    latencies = sorted(result.elapsed for result in results if result.success)
+    errors = {}
+    for result in results:
+        if not result.success:
+            # 按错误分类（超时、代理错误、连接错误等）统计，没有分类时使用状态码
+            error = result.error or result.status_code
+            errors[error] = errors.get(error, 0) + 1
+    return {
+        'proxy': proxy_url,
+        'alive': bool(latencies),
+        'attempts': len(results),
+        'success': len(latencies),
+        'p50': percentile_of_sorted(latencies, 50),
+        'p90': percentile_of_sorted(latencies, 90),
+        'max': latencies[-1] if latencies else None,
+        # 出现次数最多的错误分类
+        'error': max(errors, key=errors.get) if errors else '',
+    }
+
+
+class ScanWriter:
+    """按代理逐条写出汇总结果，根据扩展名选择 CSV 或 NDJSON"""
+
+    def __init__(self, path, flush_interval=1.0):
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.is_csv = path.lower().endswith('.csv')
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        if self.is_csv:
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=SCAN_FIELDS)
+            self.csv_writer.writeheader()
+
+    def write(self, summary):
+        if self.is_csv:
+            self.csv_writer.writerow(summary)
+        else:
+            self.file.write(json.dumps(summary, ensure_ascii=False, separators=(',', ':')) + '\n')
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = now
+
+    def close(self):
+        self.file.close()
+
+
+class ProxyScanner:
+    """批量扫描代理列表
+
+    从文件流式读取代理，在全局并发上限内并行探测，每个代理探测 attempts 次，
+    每完成一个代理立即写出汇总。内存占用与并发数成正比，与列表长度无关。
+    """
+
+    def __init__(self, target_url, concurrency=500, attempts=3, timeout=10, mode=MODE_COLD):
+        self.target_url = target_url
+        self.concurrency = concurrency
+        self.attempts = attempts
+        self.timeout = timeout
+        self.mode = mode
+        self.ssl_context = ssl.create_default_context()
+        self.stopped = False
+        # 进度计数，由事件循环线程写入，界面线程只读
+        self.scanned = 0
+        self.alive = 0
+        self.started_at = None
+
+    def stop(self):
+        self.stopped = True
+
+    @property
+    def rate(self):
+        # 每秒扫描的代理数
+        if not self.started_at:
+            return 0
+        elapsed = time.monotonic() - self.started_at
+        return self.scanned / elapsed if elapsed > 0 else 0
+
+    async def scan_proxy(self, proxy_url):
+        engine = ProbeEngine(proxy_url, timeout=self.timeout, mode=self.mode, ssl_context=self.ssl_context,
+                             body_limit=0)
+        results = []
+        try:
+            for attempt in range(1, self.attempts + 1):
+                if self.stopped:
+                    break
+                results.append(await engine.probe(self.target_url, attempt))
+        finally:
+            engine.pool.close()
+        return summarize_proxy(proxy_url, results)
+
+    async def run(self, proxy_urls, on_summary):
+        raise_fd_limit()
+        self.stopped = False
+        self.started_at = time.monotonic()
+        proxy_iter = iter(proxy_urls)
+
+        async def worker():
+            while not self.stopped:
+                try:
+                    proxy_url = next(proxy_iter)
+                except StopIteration:
+                    return
+                summary = await self.scan_proxy(proxy_url)
+                self.scanned += 1
+                if summary['alive']:
+                    self.alive += 1
+                on_summary(summary)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    def scan_file(self, input_path, output_path):
+        """扫描代理列表文件并写出结果，在调用线程中运行事件循环"""
+        writer = ScanWriter(output_path)
+        try:
+            asyncio.run(self.run(iter_proxy_file(input_path), writer.write))
+        finally:
+            writer.close()
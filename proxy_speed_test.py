@@ -1,12 +1,35 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import requests
+from tkinter import ttk, messagebox, filedialog
 import time
 import threading
+import functools
+import multiprocessing
+import sqlite3
 from urllib.parse import urlparse
-import json
 import re
 from concurrent.futures import ThreadPoolExecutor
+from latency_stats import LatencyHistogram, format_latency_summary
+from stats_aggregator import ShardedStats
+from proxy_scan import ProxyScanner
+from load_sweep import LoadSweep, SWEEP_CONCURRENCY, SWEEP_RATE, SWEEP_NAMES, parse_schedule, format_sweep_report
+from result_store import ResultStore
+from virtual_table import VirtualTable
+from render_scheduler import RenderScheduler
+from transfer_engine import (TransferProgress, TransferResult, SegmentedDownload, discard_download, streaming_upload,
+                             scaling_efficiency, DEFAULT_CHUNK_SIZE, SAMPLE_INTERVAL, DEFAULT_DOWNLOAD_URL,
+                             DEFAULT_UPLOAD_URL)
+from rate_control import DispatchController
+from process_pool import ProcessPoolRunner, default_workers
+from thread_engine import ThreadProbeEngine, SessionCache, MAX_THREAD_WORKERS
+from ip_lookup import (refresh_local_ip, load_cached_ip, network_key, format_ip_info, format_cache_age,
+                       is_mainland_ip)
+from run_store import RunStore, KIND_LATENCY, KIND_SPEED, RUN_FINISHED, RUN_STOPPED, format_history_report
+from exporter import (LATENCY_FIELDS, SPEED_FIELDS, EXPORT_BATCH_SIZE, check_format, format_for_path,
+                      record_batches, export_batches)
+from probe_engine import (ProbeEngine, ProbeResult, MODE_COLD, MODE_WARM, CONNECTION_MODES, DEFAULT_TARGET_URL,
+                          PHASE_NAMES, DEFAULT_BODY_LIMIT, STATUS_FAILED, ERROR_EXECUTION, mode_for_request,
+                          format_body)
+
 
 class ProxySpeedTester:
     def __init__(self):
@@ -69,25 +92,53 @@ class ProxySpeedTester:
 
         # 初始化目标地址
         self.target_entry = None
-        self.default_target = "https://ipinfo.io/json"
+        self.default_target = DEFAULT_TARGET_URL
         self.current_request_id = 0
 
-        # 初始化统计数据
-        self.stats = {
-            'total': 0,
-            'success': 0,
-            'failed': 0,
-            'timeout': 0,
-            'status_codes': {},
-            'total_response_time': 0  # 添加总响应时间统计
-        }
+        # 初始化统计数据：每个工作线程写自己的分片，界面显示时再合并
+        self.stats = ShardedStats()
+        # 跨多次测试累计的响应时间分布
+        self.cumulative_latency = LatencyHistogram()
 
-        # 创建线程池
-        self.executor = ThreadPoolExecutor(max_workers=50)
+        # 创建线程池：线程按需创建，实际并发由发送控制器限制，可在运行中调整
+        self.executor = ThreadPoolExecutor(max_workers=MAX_THREAD_WORKERS)
 
         # 初始化测试状态
         self.is_testing = False
         self.pause_testing = False
+        # 当前运行中的asyncio探测引擎
+        self.probe_engine = None
+        # 当前测试的发送控制器（令牌桶限速、并发上限、暂停/继续）
+        self.dispatch_controller = None
+        # 开环模式的目标到达率（闭环为0）和测试起止时间
+        self.open_loop_rate = 0
+        self.test_started_at = None
+        self.test_finished_at = None
+        # 按 (代理地址, 连接池大小) 缓存的保持连接会话，线程池引擎在多次测试间复用
+        self.http_sessions = SessionCache()
+        self.connection_mode = MODE_COLD
+        self.pool_size = 10
+        # 每条结果保存的响应体字节数，0 表示不保存
+        self.body_limit = DEFAULT_BODY_LIMIT
+
+        # 测试结果的列式存储，表格只按需读取可见行
+        self.result_store = ResultStore()
+        # 主测试标签页的批量渲染调度器
+        self.render_scheduler = None
+
+        # 历史记录：每次运行和每条结果都写入本地数据库，无法打开时不保存，原因显示在历史记录标签页
+        self.run_store_error = None
+        try:
+            self.run_store = RunStore()
+        except (OSError, sqlite3.Error) as e:
+            self.run_store_error = f"无法打开历史记录数据库: {str(e)}\n本次运行的测试结果不会保存到历史记录"
+            self.run_store = None
+        self.current_run_id = None
+
+        # 速度测试每次传输的结果（TransferResult）
+        self.speed_records = []
+        # 正在进行的导出：{'kind', 'rows', 'total'}
+        self.export_state = None
 
         # 初始化UI
         self.setup_ui()
@@ -96,239 +147,89 @@ class ProxySpeedTester:
         threading.Thread(target=self.check_local_ip, daemon=True).start()
 
     def check_local_ip(self):
-        # 使用多个IP查询服务，按顺序尝试
-        ip_services = [
-            'https://ipinfo.ipidea.io',
-            'https://ipinfo.io/json',
-            'https://api.ipify.org?format=json',
-            'https://api.myip.com'
-        ]
-
-        for service_url in ip_services:
-            try:
-                # 增加超时时间到10秒
-                response = requests.get(service_url, timeout=10)
-                if response.status_code == 200:
-                    data = response.json()
-
-                    # 根据不同服务解析不同的返回格式
-                    ip = data.get('ip', '')
-                    country = data.get('country_code', data.get('country', ''))
-                    region = data.get('province', data.get('region', ''))
-                    city = data.get('city', '')
-                    country_code = data.get('country_code', data.get('countryCode', ''))
-                    org = data.get('org', '')
-                    hostname = data.get('hostname', '')
-                    loc = data.get('loc', '')
-                    postal = data.get('postal', '')
-                    timezone = data.get('timezone', '')
-                    asn = data.get('asn', {}).get('asn', data.get('asn', ''))
-                    asn_name = data.get('asn', {}).get('name', data.get('asn_name', ''))
-                    asn_domain = data.get('asn', {}).get('domain', data.get('asn_domain', ''))
-                    asn_route = data.get('asn', {}).get('route', data.get('asn_route', ''))
-                    asn_type = data.get('asn', {}).get('type', data.get('asn_type', ''))
-
-                    # 构建完整的IP信息
-                    location_info = f"IP: {ip}"
-
-                    if hostname:
-                        location_info += f"\n主机名: {hostname}"
-
-                    if country or region or city:
-                        location_info += f"\n位置: {country} {region} {city}"
-
-                    if loc:
-                        location_info += f"\n坐标: {loc}"
-
-                    if postal:
-                        location_info += f"\n邮编: {postal}"
-
-                    if timezone:
-                        location_info += f"\n时区: {timezone}"
-
-                    if org:
-                        location_info += f"\n组织: {org}"
-
-                    if asn:
-                        location_info += f"\nASN: {asn}"
-
-                    if asn_name:
-                        location_info += f"\nASN名称: {asn_name}"
-
-                    if asn_domain:
-                        location_info += f"\nASN域名: {asn_domain}"
-
-                    if asn_route:
-                        location_info += f"\nASN路由: {asn_route}"
-
-                    if asn_type:
-                        location_info += f"\nASN类型: {asn_type}"
-
-                    # 判断是否为国内IP
-                    if country_code == 'CN':
-                        location_info += "\n\n⚠️ 当前IP为中国大陆IP，可能无法正常使用代理服务"
-                        text_color = '#ef4444'
-                    else:
-                        location_info += "\n\n✅ 当前IP为海外IP，可以正常使用代理服务"
-                        text_color = '#22c55e'
-
-                    # 更新Text控件内容
-                    self.ip_info_text.config(state=tk.NORMAL)
-                    self.ip_info_text.delete('1.0', tk.END)
-                    self.ip_info_text.insert('1.0', location_info)
-                    self.ip_info_text.tag_configure("color", foreground=text_color)
-                    self.ip_info_text.tag_add("color", "1.0", "end")
-                    self.ip_info_text.config(state=tk.DISABLED)
-
-                    # 同时更新隐藏的Label以保持兼容性
-                    self.ip_info_label.config(text=location_info, foreground=text_color)
-                    return
-            except requests.exceptions.Timeout:
-                continue  # 超时则尝试下一个服务
-            except requests.exceptions.RequestException:
-                continue  # 请求异常则尝试下一个服务
-            except Exception:
-                continue  # 其他异常则尝试下一个服务
-
-        # 所有服务都失败时显示错误信息
-        error_message = "获取IP信息失败: 所有IP查询服务均无响应，请检查网络连接"
-        # 更新Text控件显示错误信息
+        # 先显示该网络接口未过期的缓存结果，再在后台刷新；回调在主线程中执行，显示的值在调度时绑定
+        key = network_key()
+        cached = load_cached_ip(key)
+        if cached:
+            cached_info, _, cached_at = cached
+            note = f"（缓存于{format_cache_age(cached_at)}，正在刷新...）"
+            self.window.after(0, functools.partial(self.show_ip_info, cached_info, note))
+
+        # 对冲查询多个IP查询服务，取最先返回的有效结果
+        info, _ = refresh_local_ip(key)
+        if info:
+            self.window.after(0, functools.partial(self.show_ip_info, info))
+        elif cached:
+            note = f"（刷新失败，显示的是{format_cache_age(cached_at)}的缓存结果）"
+            self.window.after(0, functools.partial(self.show_ip_info, cached_info, note))
+        else:
+            self.window.after(0, functools.partial(self.show_ip_info, None))
+
+    def show_ip_info(self, info, note=""):
+        if info:
+            location_info = format_ip_info(info) + (f"\n{note}" if note else "")
+            text_color = '#ef4444' if is_mainland_ip(info) else '#22c55e'
+        else:
+            # 所有服务都失败时显示错误信息
+            location_info = "获取IP信息失败: 所有IP查询服务均无响应，请检查网络连接"
+            text_color = '#ef4444'
+
+        # 更新Text控件内容
         self.ip_info_text.config(state=tk.NORMAL)
         self.ip_info_text.delete('1.0', tk.END)
-        self.ip_info_text.insert('1.0', error_message)
-        self.ip_info_text.tag_configure("error", foreground='#ef4444')
-        self.ip_info_text.tag_add("error", "1.0", "end")
+        self.ip_info_text.insert('1.0', location_info)
+        self.ip_info_text.tag_configure("color", foreground=text_color)
+        self.ip_info_text.tag_add("color", "1.0", "end")
         self.ip_info_text.config(state=tk.DISABLED)
 
         # 同时更新隐藏的Label以保持兼容性
-        self.ip_info_label.config(text=error_message, foreground='#ef4444')
-
-    def test_connection(self, target_name, url, request_id):
-        try:
-            proxy_url = self.proxy_entry.get().strip()
-            proxy = {
-                'http': proxy_url,
-                'https': proxy_url
-            } if proxy_url else None
-
-            start_time = time.time()
-            response = requests.get(url, proxies=proxy, timeout=10)
-            elapsed_time = time.time() - start_time
-
-            # 更新状态码统计
-            status_code = str(response.status_code)
-            self.stats['status_codes'][status_code] = self.stats['status_codes'].get(status_code, 0) + 1
-
-            if response.status_code == 200:
-                self.stats['success'] += 1
-                self.stats['total_response_time'] += elapsed_time  # 累计响应时间
-                self.stats['response_times'].append(elapsed_time)  # 记录所有响应时间
-
-                # 更新最大和最小响应时间
-                if elapsed_time > self.stats['max_response_time']:
-                    self.stats['max_response_time'] = elapsed_time
-                if elapsed_time < self.stats['min_response_time']:
-                    self.stats['min_response_time'] = elapsed_time
-
-                response.encoding = 'utf-8'  # 设置响应编码为UTF-8
-                try:
-                    response_data = response.json()
-                    details = f"请求ID: {request_id}\n响应时间: {elapsed_time:.2f}秒\n状态码: {response.status_code}\n\n响应数据:\n"
-                    formatted_data = json.dumps(response_data, ensure_ascii=False, indent=2)
-                    details += formatted_data
-                except json.JSONDecodeError:
-                    # 如果不是JSON格式，直接显示原始文本
-                    details = f"请求ID: {request_id}\n响应时间: {elapsed_time:.2f}秒\n状态码: {response.status_code}\n\n响应数据:\n{response.text}"
-                return "成功", details, elapsed_time
-            else:
-                self.stats['failed'] = self.stats.get('failed', 0) + 1
-                response.encoding = 'utf-8'
-                error_details = f"HTTP错误: {response.status_code}\n响应内容:\n{response.text}"
-                return "失败", error_details, 0
-
-        except requests.exceptions.Timeout:
-            self.stats['timeout'] += 1
-            self.stats['failed'] = self.stats.get('failed', 0) + 1
-            error_code = 'TIMEOUT'
-            self.stats['status_codes'][error_code] = self.stats['status_codes'].get(error_code, 0) + 1
-            return "失败", "连接超时", 0
-        except requests.exceptions.ProxyError as e:
-            self.stats['failed'] = self.stats.get('failed', 0) + 1
-            error_message = "代理服务器连接失败"
-            status_code = 'PROXY_ERROR'
-
-            # 获取原始错误对象
-            cause = e.__context__
-            if cause:
-                if hasattr(cause, 'response') and cause.response:
-                    try:
-                        response = cause.response
-                        response.encoding = 'utf-8'
-                        error_message = response.text
-                        if not error_message and response.content:
-                            error_message = response.content.decode('utf-8', errors='replace')
-                        status_code = str(response.status_code)
-                    except Exception as decode_error:
-                        error_message = f"解码错误: {str(decode_error)}"
-                elif str(cause).startswith('errorMsg:'):
-                    # 直接处理类似 'errorMsg: user forbidden...' 的错误信息
-                    error_message = str(cause)
-                    status_code = '403'  # 对于这类错误，通常是403 Forbidden
-
-            # 更新统计信息
-            self.stats['status_codes'][status_code] = self.stats['status_codes'].get(status_code, 0) + 1
-
-            return "失败", error_message, 0
-        except requests.exceptions.RequestException as e:
-            self.stats['failed'] = self.stats.get('failed', 0) + 1
-            error_code = 'CONNECTION_ERROR'
-            self.stats['status_codes'][error_code] = self.stats['status_codes'].get(error_code, 0) + 1
-            return "失败", f"连接错误: {str(e)}", 0
+        self.ip_info_label.config(text=location_info, foreground=text_color)
 
     def clear_results(self):
-        # 清除树视图中的所有项目
-        for item in self.result_tree.get_children():
-            self.result_tree.delete(item)
-        # 重置统计数据
-        self.stats = {
-            'total': 0,
-            'success': 0,
-            'failed': 0,
-            'timeout': 0,
-            'status_codes': {},
-            'total_response_time': 0,  # 总响应时间统计
-            'max_response_time': 0,    # 最大响应时间
-            'min_response_time': float('inf'),  # 最小响应时间
-            'response_times': []       # 所有响应时间列表，用于计算中位数和其他统计
-        }
+        # 清除结果存储并刷新表格
+        self.result_store.clear()
+        self.result_table.clear_selection()
+        self.result_table.follow = True
+        self.result_table.refresh()
+        # 重置统计数据（总数、成功、失败、超时、状态码、响应时间分布、连接模式分布、阶段耗时）
+        self.stats = ShardedStats()
         self.update_stats_display()
         self.update_details_display("")
         # 确保UI更新
         self.window.update_idletasks()
 
     def update_stats_display(self):
-        if self.stats['total'] > 0:
-            success_rate = (self.stats['success'] / self.stats['total']) * 100
-            failed_rate = (self.stats['failed'] / self.stats['total']) * 100
-            timeout_rate = (self.stats['timeout'] / self.stats['total']) * 100
+        # 合并各线程的统计分片
+        stats = self.stats.snapshot()
+        if stats.total > 0:
+            success_rate = (stats.success / stats.total) * 100
+            failed_rate = (stats.failed / stats.total) * 100
+            timeout_rate = (stats.timeout / stats.total) * 100
 
             # 计算平均响应时间
-            avg_response_time = 0
-            if self.stats['success'] > 0:
-                avg_response_time = self.stats['total_response_time'] / self.stats['success']
-
-            stats_text = f"测试总数: {self.stats['total']}\n"
-            stats_text += f"成功次数: {self.stats['success']}\n"
-            stats_text += f"失败次数: {self.stats['failed']}\n"
-            stats_text += f"超时次数: {self.stats['timeout']}\n"
-            stats_text += f"平均响应时间: {avg_response_time:.3f}秒\n\n"  # 添加平均响应时间
+            avg_response_time = stats.latency.mean
+
+            stats_text = f"测试总数: {stats.total}\n"
+            stats_text += f"成功次数: {stats.success}\n"
+            stats_text += f"失败次数: {stats.failed}\n"
+            stats_text += f"超时次数: {stats.timeout}\n"
+            stats_text += f"平均响应时间: {avg_response_time:.3f}秒\n"  # 添加平均响应时间
+            stats_text += format_latency_summary(stats.latency) + "\n"
             stats_text += f"成功率: {success_rate:.2f}%\n"
             stats_text += f"失败率: {failed_rate:.2f}%\n"
             stats_text += f"超时率: {timeout_rate:.2f}%\n\n"
             stats_text += "状态码分布:\n"
-            for code, count in self.stats['status_codes'].items():
-                percentage = (count / self.stats['total']) * 100
+            for code, count in stats.status_codes.items():
+                percentage = (count / stats.total) * 100
                 stats_text += f"状态码 {code}: {count} 次 ({percentage:.2f}%)\n"
+            stats_text += self.format_open_loop_summary(stats)
+            stats_text += self.format_mode_comparison(stats)
+            stats_text += self.format_phase_summary(stats)
+            if self.render_scheduler:
+                stats_text += "\n" + self.render_scheduler.lag_text()
+            if self.cumulative_latency.count:
+                stats_text += f"\n历史累计 ({self.cumulative_latency.count} 次):\n"
+                stats_text += format_latency_summary(self.cumulative_latency)
         else:
             stats_text = "暂无测试数据"
 
@@ -337,19 +238,81 @@ class ProxySpeedTester:
         self.stats_text.insert('1.0', stats_text)
         self.stats_text.config(state=tk.DISABLED)
 
+    def format_open_loop_summary(self, stats):
+        # 开环模式下与上面的服务耗时并列显示从计划发送时间算起的校正耗时
+        if stats.queue_delays.count == 0:
+            return ""
+        elapsed = (self.test_finished_at or time.monotonic()) - self.test_started_at if self.test_started_at else 0
+        text = "\n开环统计 (从计划发送时间计算):\n"
+        text += f"目标到达率: {self.open_loop_rate:g} 次/秒"
+        if elapsed > 0:
+            text += f" | 实际发送: {stats.queue_delays.count / elapsed:.1f} 次/秒"
+        text += f"\n校正耗时: 平均 {stats.corrected.mean:.3f}秒\n"
+        text += format_latency_summary(stats.corrected)
+        text += (f"排队延迟: p50 {stats.queue_delays.percentile(50):.3f}秒 | "
+                 f"p99 {stats.queue_delays.percentile(99):.3f}秒 | 最大 {stats.queue_delays.max:.3f}秒\n")
+        return text
+
+    def format_mode_comparison(self, stats):
+        # cold/warm 两组响应时间分布并列显示，中位数之差近似为建立隧道的握手开销
+        modes = stats.modes
+        if not any(histogram.count for histogram in modes.values()):
+            return ""
+        text = "\n连接模式对比:\n"
+        for mode, histogram in modes.items():
+            if histogram.count == 0:
+                text += f"{mode}: 暂无数据\n"
+                continue
+            text += f"{mode}: {histogram.count} 次 平均 {histogram.mean:.3f}秒\n"
+            text += format_latency_summary(histogram)
+        if all(histogram.count for histogram in modes.values()):
+            overhead = modes[MODE_COLD].percentile(50) - modes[MODE_WARM].percentile(50)
+            text += f"握手开销估计 (p50差值): {overhead:.3f}秒\n"
+        return text
+
+    def format_phase_summary(self, stats):
+        phase_summary = stats.phases.as_dict()
+        if not phase_summary:
+            return ""
+        text = "\n阶段耗时 (平均/最大):\n"
+        for phase, summary in phase_summary.items():
+            text += f"{PHASE_NAMES[phase]}: {summary['avg_ms']:.1f}ms / {summary['max_ms']:.1f}ms\n"
+        return text
+
     def update_details_display(self, details):
         self.details_text.config(state=tk.NORMAL)
         self.details_text.delete('1.0', tk.END)
         self.details_text.insert('1.0', details)
         self.details_text.config(state=tk.DISABLED)
 
+    def format_result_row(self, row):
+        request_id, success, elapsed_time, status_code, details = row
+        return (request_id, "成功" if success else "失败",
+                f"{elapsed_time:.2f}" if elapsed_time > 0 else "N/A",
+                status_code if success else details.split('\n')[0])
+
     def on_tree_select(self, event):
-        selected_items = self.result_tree.selection()
-        if selected_items:
-            item = selected_items[0]
-            details = self.result_tree.item(item)['tags'][0]
+        index = self.result_table.selected_index()
+        if index is not None:
+            # 查看某一行时停止自动跟随，避免新结果把选中行滚走
+            self.result_table.follow = False
+            # 响应体只在查看时解码和格式化
+            details = self.result_store.details[index]
+            body, body_size, body_hash = self.result_store.body(index)
+            if body_size or body_hash:
+                details += "\n\n" + format_body(body, body_size, body_hash)
             self.update_details_display(details)
 
+    def jump_to_result(self):
+        # 输入的是行号（从1开始）
+        try:
+            row_number = int(self.jump_entry.get())
+        except ValueError:
+            messagebox.showerror("错误", "请输入有效的行号")
+            return
+        if not self.result_table.jump_to(row_number - 1):
+            messagebox.showerror("错误", f"行号超出范围（共 {len(self.result_store)} 行）")
+
     def start_test(self):
         # 如果测试已经在运行，则不重复启动
         if self.is_testing:
@@ -360,18 +323,42 @@ class ProxySpeedTester:
 
         try:
             test_count = int(self.count_entry.get())
-            concurrency = int(self.concurrency_entry.get())
-            if test_count <= 0 or concurrency <= 0:
-                messagebox.showerror("错误", "请输入大于0的测试次数和并发数量")
+            concurrency, rate, burst = self.read_dispatch_settings()
+            pool_size = int(self.pool_size_entry.get())
+            workers = int(self.workers_entry.get())
+            body_limit = int(self.body_limit_entry.get())
+            if test_count <= 0 or concurrency <= 0 or pool_size <= 0 or workers <= 0:
+                messagebox.showerror("错误", "请输入大于0的测试次数、并发数量、连接池大小和进程数")
+                return
+            if body_limit < 0:
+                messagebox.showerror("错误", "响应保存字节数不能小于0")
                 return
+            self.body_limit = body_limit
+            self.connection_mode = self.connection_mode_var.get()
+            self.pool_size = pool_size
+            # 开环模式按目标RPS固定到达率发送，必须指定速率
+            open_loop = self.load_mode_var.get() == "开环"
+            if open_loop and rate <= 0:
+                messagebox.showerror("错误", "开环模式需要指定大于0的目标RPS")
+                return
+            self.open_loop_rate = rate if open_loop else 0
+            self.test_started_at = time.monotonic()
+            self.test_finished_at = None
+
+            # 通过发送控制器限制并发和速率，不再修改线程池的内部属性
+            self.dispatch_controller = DispatchController(rate, burst, concurrency)
 
-            # 更新线程池的并发数量
-            self.executor._max_workers = concurrency
+            if self.run_store:
+                self.current_run_id = self.run_store.start_run(
+                    KIND_LATENCY, self.proxy_entry.get().strip(), self.target_entry.get().strip() or self.default_target,
+                    {'count': test_count, 'concurrency': concurrency, 'rate': rate, 'burst': burst,
+                     'engine': self.engine_var.get(), 'mode': self.connection_mode, 'pool_size': pool_size,
+                     'open_loop': open_loop, 'workers': workers})
 
             # 启用测试按钮，确保UI状态正确
             self.test_button.config(state="normal")
         except ValueError:
-            messagebox.showerror("错误", "请输入有效的测试次数和并发数量")
+            messagebox.showerror("错误", "请输入有效的测试次数、并发数量、目标RPS、突发大小、进程数和响应保存字节数")
             return
 
         # 设置测试状态
@@ -383,86 +370,113 @@ class ProxySpeedTester:
         import queue
         result_queue = queue.Queue()
 
-        # 定义UI更新函数，在主线程中定期检查队列并更新UI
-        def update_ui():
-            try:
-                # 尝试从队列获取结果，但不阻塞
-                while not result_queue.empty():
-                    rid, status, elapsed_time, details, status_code = result_queue.get_nowait()
-                    # 插入结果到树视图
-                    self.result_tree.insert('', 'end', values=(rid, status,
-                        f"{elapsed_time:.2f}" if elapsed_time > 0 else "N/A",
-                        status_code if status == "成功" else details.split('\n')[0]),
-                        tags=(details,))
-                    # 确保滚动到最新的结果
-                    self.result_tree.see(self.result_tree.get_children()[-1])
-                    # 更新统计信息显示
-                    self.update_stats_display()
-                    # 标记任务完成
-                    result_queue.task_done()
-                    # 确保UI更新
-                    self.window.update_idletasks()
-            except queue.Empty:
-                # 队列为空，继续等待
-                pass
+        # 每帧一次性取出队列中的结果写入列式存储
+        run_id = self.current_run_id
+
+        def store_batch(batch):
+            for result in batch:
+                self.result_store.append(result)
+            if run_id is not None:
+                self.run_store.add_results(run_id, batch)
+
+        # 每帧最多刷新一次可见行和统计信息
+        def render_frame(changed):
+            if changed:
+                self.result_table.refresh()
+                self.update_stats_display()
+
+        # 启动按帧率批量渲染的UI更新循环（最多30帧/秒）
+        self.render_scheduler = RenderScheduler(self.window, result_queue, store_batch, render_frame,
+                                                is_active=lambda: self.is_testing, fps=30)
+        self.render_scheduler.start()
+
+        # 开环模式由asyncio引擎按计划时间发送，线程池无法维持固定到达率
+        use_processes = self.engine_var.get() == "多进程"
+        use_asyncio = (self.engine_var.get() == "asyncio" or open_loop) and not use_processes
+        controller = self.dispatch_controller
+
+        def execution_error(request_id, message):
+            return ProbeResult(request_id, STATUS_FAILED, ERROR_EXECUTION, 0, message, error=ERROR_EXECUTION)
+
+        # 使用asyncio引擎时，在后台线程中运行单个事件循环承载全部并发
+        def run_engine_tests():
+            target_url = self.target_entry.get().strip() or self.default_target
+            first_request_id = self.current_request_id + 1
+            self.current_request_id += test_count
+            self.probe_engine = ProbeEngine(self.proxy_entry.get().strip(), timeout=10,
+                                            mode=self.connection_mode, pool_size=self.pool_size,
+                                            body_limit=self.body_limit)
+            self.probe_engine.controller = controller
+
+            def on_result(result):
+                # 事件循环线程写入自己的统计分片
+                self.stats.record_result(result)
+                result_queue.put(result)
 
-            # 如果测试仍在进行，继续定期检查队列
-            if self.is_testing:
-                self.window.after(100, update_ui)
+            try:
+                if open_loop:
+                    self.probe_engine.run_open_loop_sync(target_url, rate, test_count, on_result, first_request_id)
+                else:
+                    self.probe_engine.run_sync(target_url, test_count, on_result=on_result,
+                                               first_request_id=first_request_id)
+            except Exception as e:
+                result_queue.put(execution_error(first_request_id, f"执行错误: {str(e)}"))
+
+        # 多进程引擎：各工作进程运行自己的asyncio引擎，统计由工作进程定期上报并合并到 self.stats
+        def run_process_tests():
+            target_url = self.target_entry.get().strip() or self.default_target
+            first_request_id = self.current_request_id + 1
+            self.current_request_id += test_count
+            runner = ProcessPoolRunner(self.proxy_entry.get().strip(), timeout=10, mode=self.connection_mode,
+                                       pool_size=self.pool_size, workers=workers, stats=self.stats,
+                                       body_limit=self.body_limit)
+            runner.controller = controller
+
+            def on_results(results):
+                for result in results:
+                    result_queue.put(result)
 
-        # 启动UI更新循环
-        self.window.after(100, update_ui)
+            try:
+                runner.run(target_url, test_count, on_results=on_results, first_request_id=first_request_id,
+                           rate=rate, open_loop=open_loop)
+            except Exception as e:
+                runner.errors.append(f"执行错误: {str(e)}")
+            for error in runner.errors:
+                result_queue.put(execution_error(first_request_id, error))
 
         # 创建线程进行测试
         def run_tests():
             try:
-                # 创建所有测试任务
-                futures = []
-                for _ in range(test_count):
-                    target_url = self.target_entry.get().strip() or self.default_target
-                    self.current_request_id += 1
-                    self.stats['total'] += 1
-                    future = self.executor.submit(self.test_connection, "Target", target_url, self.current_request_id)
-                    futures.append((self.current_request_id, future))
-
-                # 批量处理结果
-                batch_size = 5
-                for i in range(0, len(futures), batch_size):
-                    # 检查是否暂停
-                    while self.pause_testing and self.is_testing:
-                        time.sleep(0.1)
-
-                    # 检查是否停止测试
-                    if not self.is_testing:
-                        break
-
-                    batch = futures[i:i + batch_size]
-
-                    for request_id, future in batch:
-                        try:
-                            status, details, elapsed_time = future.result()
-                            status_code = "N/A"
-                            if "状态码:" in details:
-                                status_code = details.split("状态码:")[1].split("\n")[0].strip()
-                            elif "状态码: " in details:
-                                status_code = details.split("状态码: ")[1].split("\n")[0].strip()
-                            elif status == "成功":
-                                status_code = "200"
-
-                            # 将结果放入队列，由主线程处理UI更新
-                            result_queue.put((request_id, status, elapsed_time, details, status_code))
-
-                        except Exception as e:
-                            error_message = str(e)
-                            # 将错误结果放入队列
-                            result_queue.put((request_id, "失败", 0, f"执行错误: {error_message}", "N/A"))
+                if use_processes:
+                    run_process_tests()
+                    return
+                if use_asyncio:
+                    run_engine_tests()
+                    return
 
-                    # 小延迟以避免UI卡顿
-                    time.sleep(0.01)
+                # 线程池引擎：与自测基准使用同一个 ThreadProbeEngine，按发送控制器的许可流式提交
+                target_url = self.target_entry.get().strip() or self.default_target
+                first_request_id = self.current_request_id + 1
+                self.current_request_id += test_count
+                engine = ThreadProbeEngine(self.proxy_entry.get().strip(), timeout=10, mode=self.connection_mode,
+                                           pool_size=self.pool_size, body_limit=self.body_limit, stats=self.stats,
+                                           sessions=self.http_sessions, executor=self.executor)
+                engine.controller = controller
+                # 将结果放入队列，由主线程处理UI更新
+                engine.run(target_url, test_count, result_queue.put, first_request_id)
             finally:
                 # 测试完成后重置状态
                 self.is_testing = False
                 self.pause_testing = False
+                self.probe_engine = None
+                self.dispatch_controller = None
+                self.test_finished_at = time.monotonic()
+                # 本次测试的响应时间分布合并到历史累计中
+                snapshot = self.stats.snapshot()
+                self.cumulative_latency.merge(snapshot.latency)
+                if run_id is not None:
+                    self.run_store.finish_run(run_id, snapshot)
+                    self.current_run_id = None
                 # 使用after方法在主线程中更新按钮状态
                 self.window.after(0, lambda: self.pause_button.config(text="暂停测试", state="disabled"))
                 # 恢复测试按钮状态
@@ -483,11 +497,37 @@ class ProxySpeedTester:
             return
 
         self.pause_testing = not self.pause_testing
+        # 暂停后不再发出新的探测，在途探测照常完成
+        if self.dispatch_controller:
+            if self.pause_testing:
+                self.dispatch_controller.pause()
+            else:
+                self.dispatch_controller.resume()
         if self.pause_testing:
             self.pause_button.config(text="继续测试", state="normal")
         else:
             self.pause_button.config(text="暂停测试", state="normal")
 
+    def read_dispatch_settings(self):
+        # 读取并发数量、目标RPS（0为不限速）和突发大小，格式错误时抛出 ValueError
+        concurrency = int(self.concurrency_entry.get())
+        rate = float(self.rate_entry.get() or 0)
+        burst = int(self.burst_entry.get() or 1)
+        if concurrency <= 0 or rate < 0 or burst <= 0:
+            raise ValueError
+        return concurrency, rate, burst
+
+    def apply_dispatch_settings(self):
+        # 测试运行中实时调整并发和速率
+        try:
+            concurrency, rate, burst = self.read_dispatch_settings()
+        except ValueError:
+            messagebox.showerror("错误", "请输入有效的并发数量、目标RPS和突发大小")
+            return
+        if self.dispatch_controller and self.is_testing:
+            self.dispatch_controller.set_concurrency(concurrency)
+            self.dispatch_controller.set_rate(rate, burst)
+
     def setup_ui(self):
         # 创建主框架
         main_frame = ttk.Frame(self.window)
@@ -538,6 +578,75 @@ class ProxySpeedTester:
         self.concurrency_entry.grid(row=1, column=3, pady=5)
         self.concurrency_entry.insert(0, "50")
 
+        # 执行引擎选择：线程池（requests）、asyncio（单事件循环，支持上千并发）
+        # 或多进程（每个进程一个asyncio事件循环，HTTPS等CPU密集的测试可用满多核）
+        engine_label = ttk.Label(input_frame, text="执行引擎:", style='Card.TLabel')
+        engine_label.grid(row=2, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.engine_var = tk.StringVar(value="线程池")
+        self.engine_combo = ttk.Combobox(input_frame, textvariable=self.engine_var,
+                                         values=("线程池", "asyncio", "多进程"), state="readonly", width=12)
+        self.engine_combo.grid(row=2, column=1, pady=5, sticky="w")
+
+        # 连接模式：cold 每次新建隧道，warm 复用保持连接的隧道，both 交替执行并对比
+        connection_mode_label = ttk.Label(input_frame, text="连接模式:", style='Card.TLabel')
+        connection_mode_label.grid(row=2, column=2, padx=(0, 8), pady=5, sticky="e")
+
+        self.connection_mode_var = tk.StringVar(value=MODE_COLD)
+        self.connection_mode_combo = ttk.Combobox(input_frame, textvariable=self.connection_mode_var,
+                                                  values=CONNECTION_MODES, state="readonly", width=6)
+        self.connection_mode_combo.grid(row=2, column=3, pady=5)
+
+        pool_size_label = ttk.Label(input_frame, text="连接池大小:", style='Card.TLabel')
+        pool_size_label.grid(row=3, column=2, padx=(0, 8), pady=5, sticky="e")
+
+        self.pool_size_entry = ttk.Entry(input_frame, width=8, font=('微软雅黑', 10))
+        self.pool_size_entry.grid(row=3, column=3, pady=5)
+        self.pool_size_entry.insert(0, "10")
+
+        # 目标RPS（0为不限速）和突发大小，测试中可通过“应用设置”实时调整
+        rate_label = ttk.Label(input_frame, text="目标RPS:", style='Card.TLabel')
+        rate_label.grid(row=3, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        rate_frame = ttk.Frame(input_frame, style='Card.TFrame')
+        rate_frame.grid(row=3, column=1, pady=5, sticky="w")
+
+        self.rate_entry = ttk.Entry(rate_frame, width=8, font=('微软雅黑', 10))
+        self.rate_entry.pack(side=tk.LEFT)
+        self.rate_entry.insert(0, "0")
+
+        burst_label = ttk.Label(rate_frame, text="突发:", style='Card.TLabel')
+        burst_label.pack(side=tk.LEFT, padx=(12, 8))
+
+        self.burst_entry = ttk.Entry(rate_frame, width=8, font=('微软雅黑', 10))
+        self.burst_entry.pack(side=tk.LEFT)
+        self.burst_entry.insert(0, "10")
+
+        # 负载模式：闭环在并发上限内等待完成后再发送，开环按目标RPS固定到达率发送
+        load_mode_label = ttk.Label(input_frame, text="负载模式:", style='Card.TLabel')
+        load_mode_label.grid(row=4, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.load_mode_var = tk.StringVar(value="闭环")
+        self.load_mode_combo = ttk.Combobox(input_frame, textvariable=self.load_mode_var,
+                                            values=("闭环", "开环"), state="readonly", width=12)
+        self.load_mode_combo.grid(row=4, column=1, pady=5, sticky="w")
+
+        # 多进程引擎的工作进程数，默认等于CPU核数
+        workers_label = ttk.Label(input_frame, text="进程数:", style='Card.TLabel')
+        workers_label.grid(row=4, column=2, padx=(0, 8), pady=5, sticky="e")
+
+        self.workers_entry = ttk.Entry(input_frame, width=8, font=('微软雅黑', 10))
+        self.workers_entry.grid(row=4, column=3, pady=5)
+        self.workers_entry.insert(0, str(default_workers()))
+
+        # 每条结果保存的响应体字节数（另存完整响应体的哈希），0 为不保存，适合纯吞吐测试
+        body_limit_label = ttk.Label(input_frame, text="响应保存(字节):", style='Card.TLabel')
+        body_limit_label.grid(row=5, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.body_limit_entry = ttk.Entry(input_frame, width=8, font=('微软雅黑', 10))
+        self.body_limit_entry.grid(row=5, column=1, pady=5, sticky="w")
+        self.body_limit_entry.insert(0, str(DEFAULT_BODY_LIMIT))
+
         # 配置列权重，使输入框可以随窗口调整大小
         input_frame.columnconfigure(1, weight=1)
 
@@ -553,10 +662,19 @@ class ProxySpeedTester:
                                  command=self.toggle_pause, state="disabled")
         self.pause_button.pack(side=tk.LEFT, padx=6)
 
+        apply_button = ttk.Button(button_frame, text="应用设置", style="Secondary.TButton",
+                                  command=self.apply_dispatch_settings)
+        apply_button.pack(side=tk.LEFT, padx=6)
+
         clear_button = ttk.Button(button_frame, text="清除结果", style="Secondary.TButton",
                                  command=self.clear_results)
         clear_button.pack(side=tk.LEFT, padx=6)
 
+        self.export_buttons = {}
+        self.export_buttons[KIND_LATENCY] = ttk.Button(button_frame, text="导出结果", style="Secondary.TButton",
+                                                       command=lambda: self.export_results(KIND_LATENCY))
+        self.export_buttons[KIND_LATENCY].pack(side=tk.LEFT, padx=6)
+
         # 创建标签页容器
         self.notebook = ttk.Notebook(main_frame)
         self.notebook.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
@@ -573,26 +691,36 @@ class ProxySpeedTester:
         result_frame = ttk.Frame(content_frame, style='Card.TFrame')
         result_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(0, 10))
 
-        result_title = ttk.Label(result_frame, text="测试结果列表",
+        result_title_frame = ttk.Frame(result_frame, style='Card.TFrame')
+        result_title_frame.pack(fill=tk.X, padx=15, pady=10)
+
+        result_title = ttk.Label(result_title_frame, text="测试结果列表",
                                 font=('微软雅黑', 12, 'bold'),
                                 style='Card.TLabel')
-        result_title.pack(anchor=tk.W, padx=15, pady=10)
+        result_title.pack(side=tk.LEFT, anchor=tk.W)
 
-        # 创建表格和滚动条
-        tree_frame = ttk.Frame(result_frame)
-        tree_frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=(0, 15))
+        # 跳转到指定行
+        jump_button = ttk.Button(result_title_frame, text="跳转", style="Secondary.TButton",
+                                 command=self.jump_to_result)
+        jump_button.pack(side=tk.RIGHT)
 
-        # 创建滚动条
-        tree_scroll = ttk.Scrollbar(tree_frame)
-        tree_scroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.jump_entry = ttk.Entry(result_title_frame, width=10, font=('微软雅黑', 10))
+        self.jump_entry.pack(side=tk.RIGHT, padx=(0, 6))
+        self.jump_entry.bind('<Return>', lambda event: self.jump_to_result())
 
-        # 创建表格
+        jump_label = ttk.Label(result_title_frame, text="行号:", style='Card.TLabel')
+        jump_label.pack(side=tk.RIGHT, padx=(0, 6))
+
+        # 设置表格行高和换行显示
+        self.style.configure('Custom.Treeview',
+                           rowheight=35)  # 调整行高为合适的大小
+
+        # 创建虚拟化表格：结果保存在列式存储中，表格只渲染可见的行
         columns = ("request_id", "status", "response_time", "http_status")
-        self.result_tree = ttk.Treeview(tree_frame, columns=columns,
-                                       show="headings",
-                                       style="Custom.Treeview",
-                                       height=10,  # 增加显示行数
-                                       yscrollcommand=tree_scroll.set)
+        self.result_table = VirtualTable(result_frame, self.result_store, columns, self.format_result_row,
+                                         style="Custom.Treeview", height=10)
+        self.result_table.frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=(0, 15))
+        self.result_tree = self.result_table.tree
 
         # 设置列标题
         self.result_tree.heading("request_id", text="请求ID")
@@ -606,16 +734,8 @@ class ProxySpeedTester:
         self.result_tree.column("response_time", width=120, anchor="center")
         self.result_tree.column("http_status", width=200, anchor="center")
 
-        # 设置表格行高和换行显示
-        self.style.configure('Custom.Treeview',
-                           rowheight=35)  # 调整行高为合适的大小
-
-        # 配置滚动条
-        tree_scroll.config(command=self.result_tree.yview)
-
         # 绑定选择事件
         self.result_tree.bind('<<TreeviewSelect>>', self.on_tree_select)
-        self.result_tree.pack(fill=tk.BOTH, expand=True)
 
         # 中间统计信息区域
         stats_frame = ttk.Frame(content_frame, style='Card.TFrame')
@@ -678,19 +798,16 @@ class ProxySpeedTester:
         self.ip_info_label = ttk.Label(ip_frame, text="", style='Card.TLabel')
         self.ip_info_label.pack_forget()
 
-        # 绑定选择事件
-        self.result_tree.bind('<<TreeviewSelect>>', self.on_tree_select)
-
         # 创建下载速度测试标签页
         self.download_speed_tab = ttk.Frame(self.notebook, style='TFrame')
-        self.notebook.add(self.download_speed_tab, text='下载速度测试')
+        self.notebook.add(self.download_speed_tab, text='速度测试')
 
         # 下载速度测试设置区域
         speed_settings_frame = ttk.Frame(self.download_speed_tab, style='Card.TFrame')
         speed_settings_frame.pack(fill=tk.X, pady=(24, 24), ipady=18, padx=24)
 
         # 标题
-        speed_title_label = ttk.Label(speed_settings_frame, text="下载速度测试设置",
+        speed_title_label = ttk.Label(speed_settings_frame, text="上传/下载速度测试设置",
                                    font=('微软雅黑', 12, 'bold'),
                                    style='Card.TLabel')
         speed_title_label.pack(anchor=tk.W, padx=20, pady=(15, 20))
@@ -715,6 +832,53 @@ class ProxySpeedTester:
         self.speed_concurrency_entry.grid(row=0, column=3, pady=5)
         self.speed_concurrency_entry.insert(0, "5")
 
+        # 读取块大小，千兆以上链路建议使用 1MB 或更大
+        speed_chunk_label = ttk.Label(speed_input_frame, text="块大小(KB):", style='Card.TLabel')
+        speed_chunk_label.grid(row=0, column=4, padx=(20, 8), pady=5, sticky="e")
+
+        self.speed_chunk_entry = ttk.Entry(speed_input_frame, width=8, font=('微软雅黑', 10))
+        self.speed_chunk_entry.grid(row=0, column=5, pady=5)
+        self.speed_chunk_entry.insert(0, str(DEFAULT_CHUNK_SIZE // 1024))
+
+        # 分段数：大于1时每次测试把对象按 Range 切分，经多条连接并行下载
+        speed_segments_label = ttk.Label(speed_input_frame, text="分段数:", style='Card.TLabel')
+        speed_segments_label.grid(row=0, column=6, padx=(20, 8), pady=5, sticky="e")
+
+        self.speed_segments_entry = ttk.Entry(speed_input_frame, width=8, font=('微软雅黑', 10))
+        self.speed_segments_entry.grid(row=0, column=7, pady=5)
+        self.speed_segments_entry.insert(0, "1")
+
+        # 测试类型：下载或上传，上传时流式发送生成的数据
+        speed_direction_label = ttk.Label(speed_input_frame, text="测试类型:", style='Card.TLabel')
+        speed_direction_label.grid(row=1, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.speed_direction_var = tk.StringVar(value="下载")
+        self.speed_direction_combo = ttk.Combobox(speed_input_frame, textvariable=self.speed_direction_var,
+                                                  values=("下载", "上传"), state="readonly", width=6)
+        self.speed_direction_combo.grid(row=1, column=1, padx=(0, 20), pady=5)
+
+        speed_upload_size_label = ttk.Label(speed_input_frame, text="上传大小(MB):", style='Card.TLabel')
+        speed_upload_size_label.grid(row=1, column=2, padx=(0, 8), pady=5, sticky="e")
+
+        self.speed_upload_size_entry = ttk.Entry(speed_input_frame, width=8, font=('微软雅黑', 10))
+        self.speed_upload_size_entry.grid(row=1, column=3, pady=5)
+        self.speed_upload_size_entry.insert(0, "10")
+
+        # 测试地址，可改为本地测试服务器（local_bench_server.py）以离线测试
+        speed_download_url_label = ttk.Label(speed_input_frame, text="下载地址:", style='Card.TLabel')
+        speed_download_url_label.grid(row=2, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.speed_download_url_entry = ttk.Entry(speed_input_frame, width=45, font=('微软雅黑', 10))
+        self.speed_download_url_entry.grid(row=2, column=1, columnspan=3, padx=(0, 20), pady=5, sticky="ew")
+        self.speed_download_url_entry.insert(0, DEFAULT_DOWNLOAD_URL)
+
+        speed_upload_url_label = ttk.Label(speed_input_frame, text="上传地址:", style='Card.TLabel')
+        speed_upload_url_label.grid(row=2, column=4, padx=(20, 8), pady=5, sticky="e")
+
+        self.speed_upload_url_entry = ttk.Entry(speed_input_frame, width=35, font=('微软雅黑', 10))
+        self.speed_upload_url_entry.grid(row=2, column=5, columnspan=3, pady=5, sticky="ew")
+        self.speed_upload_url_entry.insert(0, DEFAULT_UPLOAD_URL)
+
         # 按钮区域
         speed_button_frame = ttk.Frame(speed_settings_frame, style='Card.TFrame')
         speed_button_frame.pack(anchor=tk.E, padx=15, pady=(12, 0))
@@ -723,6 +887,10 @@ class ProxySpeedTester:
                                         command=self.test_download_speed, width=15)
         self.speed_test_button.pack(side=tk.LEFT, padx=6)
 
+        self.export_buttons[KIND_SPEED] = ttk.Button(speed_button_frame, text="导出结果", style="Secondary.TButton",
+                                                     command=lambda: self.export_results(KIND_SPEED), width=15)
+        self.export_buttons[KIND_SPEED].pack(side=tk.LEFT, padx=6)
+
         # 创建结果区域
         speed_content_frame = ttk.Frame(self.download_speed_tab)
         speed_content_frame.pack(fill=tk.BOTH, expand=True, padx=24)
@@ -818,9 +986,433 @@ class ProxySpeedTester:
         self.speed_stats_text = tk.Text(self.window, width=1, height=1)
         self.speed_stats_text.pack_forget()  # 不显示
 
-    # 更新速度测试统计显示
-    def update_speed_stats_display(self):
+        # 创建批量扫描标签页
+        self.setup_scan_tab()
+        # 创建容量扫描标签页
+        self.setup_sweep_tab()
+        # 创建历史记录标签页
+        self.setup_history_tab()
+
+    def export_results(self, kind):
+        """把延迟或速度测试的结果导出到文件
+
+        在后台线程中逐批读取和写出，内存中最多只有一批结果，导出期间界面和测试照常运行；
+        测试进行中导出时只包含点击导出时已有的结果。
+        """
+        if self.export_state:
+            messagebox.showinfo("提示", "正在导出，请等待完成")
+            return
+        if kind == KIND_SPEED:
+            total = len(self.speed_records)
+            fields, batches = SPEED_FIELDS, record_batches(self.speed_records, SPEED_FIELDS)
+        else:
+            total = len(self.result_store)
+            fields, batches = LATENCY_FIELDS, self.result_store.iter_pages(EXPORT_BATCH_SIZE)
+        if total == 0:
+            messagebox.showinfo("提示", "没有可导出的结果")
+            return
+        path = filedialog.asksaveasfilename(title="导出结果", defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("NDJSON", "*.ndjson"),
+                                                       ("Parquet", "*.parquet")])
+        if not path:
+            return
+        error = check_format(format_for_path(path))
+        if error:
+            messagebox.showerror("错误", error)
+            return
+
+        state = self.export_state = {'kind': kind, 'rows': 0, 'total': total}
+        self.export_buttons[kind].config(state="disabled")
+
+        def run_export():
+            error_message = None
+            try:
+                export_batches(batches, path, fields, on_progress=lambda rows: state.update(rows=rows))
+            except Exception as e:
+                error_message = str(e)
+            finally:
+                self.window.after(0, lambda: self.finish_export(state, path, error_message))
+
+        threading.Thread(target=run_export, daemon=True).start()
+        self.update_export_progress()
+
+    def update_export_progress(self):
+        state = self.export_state
+        if not state:
+            return
+        self.export_buttons[state['kind']].config(text=f"导出中 {state['rows'] * 100 // state['total']}%")
+        self.window.after(200, self.update_export_progress)
+
+    def finish_export(self, state, path, error_message):
+        self.export_state = None
+        self.export_buttons[state['kind']].config(text="导出结果", state="normal")
+        if error_message:
+            messagebox.showerror("错误", f"导出失败: {error_message}")
+        else:
+            messagebox.showinfo("导出完成", f"已导出 {state['rows']} 条结果到 {path}")
+
+    def setup_scan_tab(self):
+        self.scan_tab = ttk.Frame(self.notebook, style='TFrame')
+        self.notebook.add(self.scan_tab, text='批量扫描')
+
+        scan_settings_frame = ttk.Frame(self.scan_tab, style='Card.TFrame')
+        scan_settings_frame.pack(fill=tk.X, pady=(24, 24), ipady=18, padx=24)
+
+        scan_title_label = ttk.Label(scan_settings_frame, text="代理列表批量扫描",
+                                     font=('微软雅黑', 12, 'bold'),
+                                     style='Card.TLabel')
+        scan_title_label.pack(anchor=tk.W, padx=20, pady=(15, 20))
+
+        scan_input_frame = ttk.Frame(scan_settings_frame, style='Card.TFrame')
+        scan_input_frame.pack(fill=tk.X, padx=20)
+
+        # 代理列表文件（每行 host:port、user:pass@host:port 或 URL）
+        scan_file_label = ttk.Label(scan_input_frame, text="代理列表:", style='Card.TLabel')
+        scan_file_label.grid(row=0, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.scan_file_entry = ttk.Entry(scan_input_frame, width=45, font=('微软雅黑', 10))
+        self.scan_file_entry.grid(row=0, column=1, padx=(0, 8), pady=5, sticky="ew")
+
+        scan_file_button = ttk.Button(scan_input_frame, text="选择文件", style="Secondary.TButton",
+                                      command=self.choose_scan_file)
+        scan_file_button.grid(row=0, column=2, padx=(0, 20), pady=5)
+
+        # 结果输出文件（.csv 或 .ndjson）
+        scan_output_label = ttk.Label(scan_input_frame, text="结果文件:", style='Card.TLabel')
+        scan_output_label.grid(row=1, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.scan_output_entry = ttk.Entry(scan_input_frame, width=45, font=('微软雅黑', 10))
+        self.scan_output_entry.grid(row=1, column=1, padx=(0, 8), pady=5, sticky="ew")
+        self.scan_output_entry.insert(0, "scan_results.csv")
+
+        scan_output_button = ttk.Button(scan_input_frame, text="另存为", style="Secondary.TButton",
+                                        command=self.choose_scan_output)
+        scan_output_button.grid(row=1, column=2, padx=(0, 20), pady=5)
+
+        scan_concurrency_label = ttk.Label(scan_input_frame, text="并发数量:", style='Card.TLabel')
+        scan_concurrency_label.grid(row=0, column=3, padx=(0, 8), pady=5, sticky="e")
+
+        self.scan_concurrency_entry = ttk.Entry(scan_input_frame, width=8, font=('微软雅黑', 10))
+        self.scan_concurrency_entry.grid(row=0, column=4, pady=5)
+        self.scan_concurrency_entry.insert(0, "500")
+
+        scan_attempts_label = ttk.Label(scan_input_frame, text="每代理次数:", style='Card.TLabel')
+        scan_attempts_label.grid(row=1, column=3, padx=(0, 8), pady=5, sticky="e")
+
+        self.scan_attempts_entry = ttk.Entry(scan_input_frame, width=8, font=('微软雅黑', 10))
+        self.scan_attempts_entry.grid(row=1, column=4, pady=5)
+        self.scan_attempts_entry.insert(0, "3")
+
+        scan_input_frame.columnconfigure(1, weight=1)
+
+        scan_button_frame = ttk.Frame(scan_settings_frame, style='Card.TFrame')
+        scan_button_frame.pack(anchor=tk.E, padx=15, pady=(12, 0))
+
+        self.scan_button = ttk.Button(scan_button_frame, text="开始扫描", style="Primary.TButton",
+                                      command=self.toggle_scan, width=15)
+        self.scan_button.pack(side=tk.LEFT, padx=6)
+
+        scan_status_frame = ttk.Frame(self.scan_tab, style='Card.TFrame')
+        scan_status_frame.pack(fill=tk.X, padx=24)
+
+        self.scan_status_label = ttk.Label(scan_status_frame, text="扫描进度: 暂无数据",
+                                           font=('微软雅黑', 10, 'bold'),
+                                           foreground='#0078D7',
+                                           style='Card.TLabel')
+        self.scan_status_label.pack(anchor=tk.W, padx=15, pady=10)
+
+        self.proxy_scanner = None
+
+    def choose_scan_file(self):
+        path = filedialog.askopenfilename(title="选择代理列表", filetypes=[("文本文件", "*.txt"), ("所有文件", "*.*")])
+        if path:
+            self.scan_file_entry.delete(0, tk.END)
+            self.scan_file_entry.insert(0, path)
+
+    def choose_scan_output(self):
+        path = filedialog.asksaveasfilename(title="保存扫描结果", defaultextension=".csv",
+                                            filetypes=[("CSV", "*.csv"), ("NDJSON", "*.ndjson")])
+        if path:
+            self.scan_output_entry.delete(0, tk.END)
+            self.scan_output_entry.insert(0, path)
+
+    def toggle_scan(self):
+        # 扫描进行中再次点击则停止
+        if self.proxy_scanner:
+            self.proxy_scanner.stop()
+            return
+
+        input_path = self.scan_file_entry.get().strip()
+        output_path = self.scan_output_entry.get().strip()
+        if not input_path or not output_path:
+            messagebox.showerror("错误", "请选择代理列表文件和结果文件")
+            return
+        try:
+            concurrency = int(self.scan_concurrency_entry.get())
+            attempts = int(self.scan_attempts_entry.get())
+            if concurrency <= 0 or attempts <= 0:
+                messagebox.showerror("错误", "请输入大于0的并发数量和每代理次数")
+                return
+        except ValueError:
+            messagebox.showerror("错误", "请输入有效的并发数量和每代理次数")
+            return
+
+        target_url = self.target_entry.get().strip() or self.default_target
+        scanner = ProxyScanner(target_url, concurrency=concurrency, attempts=attempts,
+                               mode=self.connection_mode_var.get())
+        self.proxy_scanner = scanner
+        self.scan_button.config(text="停止扫描", style="Warning.TButton")
+
+        def run_scan():
+            error_message = None
+            try:
+                scanner.scan_file(input_path, output_path)
+            except Exception as e:
+                error_message = str(e)
+            finally:
+                self.proxy_scanner = None
+                self.window.after(0, lambda: self.finish_scan(scanner, output_path, error_message))
+
+        threading.Thread(target=run_scan, daemon=True).start()
+        self.window.after(500, self.update_scan_progress)
+
+    def update_scan_progress(self):
+        scanner = self.proxy_scanner
+        if not scanner:
+            return
+        self.scan_status_label.config(
+            text=f"扫描进度: 已扫描 {scanner.scanned} | 可用 {scanner.alive} | 速率 {scanner.rate:.1f} 个/秒")
+        self.window.after(500, self.update_scan_progress)
+
+    def finish_scan(self, scanner, output_path, error_message):
+        self.scan_button.config(text="开始扫描", style="Primary.TButton")
+        if error_message:
+            self.scan_status_label.config(text=f"扫描失败: {error_message}", foreground='#ef4444')
+            return
+        self.scan_status_label.config(
+            text=f"扫描完成: 共 {scanner.scanned} 个 | 可用 {scanner.alive} 个 | 结果已写入 {output_path}",
+            foreground='#0078D7')
+
+    def setup_sweep_tab(self):
+        self.sweep_tab = ttk.Frame(self.notebook, style='TFrame')
+        self.notebook.add(self.sweep_tab, text='容量扫描')
+
+        sweep_settings_frame = ttk.Frame(self.sweep_tab, style='Card.TFrame')
+        sweep_settings_frame.pack(fill=tk.X, pady=(24, 24), ipady=18, padx=24)
+
+        sweep_title_label = ttk.Label(sweep_settings_frame, text="逐级加压寻找饱和拐点（使用代理连接测试页的目标、代理和连接模式）",
+                                      font=('微软雅黑', 12, 'bold'),
+                                      style='Card.TLabel')
+        sweep_title_label.pack(anchor=tk.W, padx=20, pady=(15, 20))
+
+        sweep_input_frame = ttk.Frame(sweep_settings_frame, style='Card.TFrame')
+        sweep_input_frame.pack(fill=tk.X, padx=20)
+
+        # 扫描维度：并发（闭环）或 RPS（开环）
+        sweep_kind_label = ttk.Label(sweep_input_frame, text="扫描维度:", style='Card.TLabel')
+        sweep_kind_label.grid(row=0, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.sweep_kind_var = tk.StringVar(value=SWEEP_NAMES[SWEEP_CONCURRENCY])
+        self.sweep_kind_combo = ttk.Combobox(sweep_input_frame, textvariable=self.sweep_kind_var,
+                                             values=tuple(SWEEP_NAMES.values()), state="readonly", width=12)
+        self.sweep_kind_combo.grid(row=0, column=1, pady=5, sticky="w")
+
+        sweep_duration_label = ttk.Label(sweep_input_frame, text="每步时长(秒):", style='Card.TLabel')
+        sweep_duration_label.grid(row=0, column=2, padx=(0, 8), pady=5, sticky="e")
+
+        self.sweep_duration_entry = ttk.Entry(sweep_input_frame, width=8, font=('微软雅黑', 10))
+        self.sweep_duration_entry.grid(row=0, column=3, pady=5)
+        self.sweep_duration_entry.insert(0, "10")
+
+        # 步骤列表，逗号分隔，依次执行
+        sweep_schedule_label = ttk.Label(sweep_input_frame, text="步骤列表:", style='Card.TLabel')
+        sweep_schedule_label.grid(row=1, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.sweep_schedule_entry = ttk.Entry(sweep_input_frame, width=45, font=('微软雅黑', 10))
+        self.sweep_schedule_entry.grid(row=1, column=1, columnspan=3, padx=(0, 20), pady=5, sticky="ew")
+        self.sweep_schedule_entry.insert(0, "10,20,50,100,200,500")
+
+        sweep_input_frame.columnconfigure(1, weight=1)
+
+        sweep_button_frame = ttk.Frame(sweep_settings_frame, style='Card.TFrame')
+        sweep_button_frame.pack(anchor=tk.E, padx=15, pady=(12, 0))
+
+        self.sweep_button = ttk.Button(sweep_button_frame, text="开始扫描", style="Primary.TButton",
+                                       command=self.toggle_sweep, width=15)
+        self.sweep_button.pack(side=tk.LEFT, padx=6)
+
+        sweep_result_frame = ttk.Frame(self.sweep_tab, style='Card.TFrame')
+        sweep_result_frame.pack(fill=tk.BOTH, expand=True, padx=24, pady=(0, 24))
+
+        self.sweep_status_label = ttk.Label(sweep_result_frame, text="扫描进度: 暂无数据",
+                                            font=('微软雅黑', 10, 'bold'),
+                                            foreground='#0078D7',
+                                            style='Card.TLabel')
+        self.sweep_status_label.pack(anchor=tk.W, padx=15, pady=10)
+
+        # 等宽字体使各步骤的数据对齐
+        self.sweep_text = tk.Text(sweep_result_frame, height=15, font=('Consolas', 10))
+        self.sweep_text.pack(fill=tk.BOTH, expand=True, padx=12, pady=(0, 12))
+        self.sweep_text.config(state=tk.DISABLED)
+
+        self.load_sweep = None
+
+    def toggle_sweep(self):
+        # 扫描进行中再次点击则停止，已完成的步骤仍会给出报告
+        if self.load_sweep:
+            self.load_sweep.stop()
+            return
+
+        kind = SWEEP_RATE if self.sweep_kind_var.get() == SWEEP_NAMES[SWEEP_RATE] else SWEEP_CONCURRENCY
+        try:
+            schedule = parse_schedule(self.sweep_schedule_entry.get())
+            step_duration = float(self.sweep_duration_entry.get())
+            if step_duration <= 0:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("错误", "请输入递增的正数步骤列表和大于0的每步时长")
+            return
+
+        sweep = LoadSweep(self.target_entry.get().strip() or self.default_target,
+                          self.proxy_entry.get().strip(), kind=kind, schedule=schedule,
+                          step_duration=step_duration, mode=self.connection_mode_var.get())
+        self.load_sweep = sweep
+        self.sweep_button.config(text="停止扫描", style="Warning.TButton")
+        self.update_sweep_report(sweep)
+
+        def on_step(step):
+            self.window.after(0, lambda: self.update_sweep_report(sweep))
+
+        def run_sweep():
+            error_message = None
+            knee = recommended = None
+            try:
+                knee, recommended = sweep.run_sync(on_step)
+            except Exception as e:
+                error_message = str(e)
+            finally:
+                self.load_sweep = None
+                self.window.after(0, lambda: self.finish_sweep(sweep, knee, recommended, error_message))
+
+        threading.Thread(target=run_sweep, daemon=True).start()
+        self.window.after(500, self.update_sweep_progress)
+
+    def update_sweep_progress(self):
+        sweep = self.load_sweep
+        if not sweep:
+            return
+        stats = sweep.step_stats
+        if stats:
+            name = SWEEP_NAMES[sweep.kind]
+            value = sweep.schedule[sweep.step_index]
+            self.sweep_status_label.config(
+                text=f"扫描进度: 第 {sweep.step_index + 1}/{len(sweep.schedule)} 步 ({name} {value:g}) | "
+                     f"已完成 {stats.total} | 失败 {stats.failed}")
+        self.window.after(500, self.update_sweep_progress)
+
+    def update_sweep_report(self, sweep, knee=None, recommended=None):
+        self.sweep_text.config(state=tk.NORMAL)
+        self.sweep_text.delete('1.0', tk.END)
+        self.sweep_text.insert('1.0', format_sweep_report(sweep.kind, sweep.steps, knee, recommended))
+        self.sweep_text.config(state=tk.DISABLED)
+
+    def finish_sweep(self, sweep, knee, recommended, error_message):
+        self.sweep_button.config(text="开始扫描", style="Primary.TButton")
+        if error_message:
+            self.sweep_status_label.config(text=f"扫描失败: {error_message}", foreground='#ef4444')
+            return
+        self.update_sweep_report(sweep, knee, recommended)
+        self.sweep_status_label.config(text=f"扫描完成: 共 {len(sweep.steps)} 步", foreground='#0078D7')
+
+    def setup_history_tab(self):
+        self.history_tab = ttk.Frame(self.notebook, style='TFrame')
+        self.notebook.add(self.history_tab, text='历史记录')
+
+        history_settings_frame = ttk.Frame(self.history_tab, style='Card.TFrame')
+        history_settings_frame.pack(fill=tk.X, pady=(24, 24), ipady=18, padx=24)
+
+        history_title_label = ttk.Label(history_settings_frame, text="按代理、目标和时间范围查询历史运行（留空表示不限）",
+                                        font=('微软雅黑', 12, 'bold'),
+                                        style='Card.TLabel')
+        history_title_label.pack(anchor=tk.W, padx=20, pady=(15, 20))
+
+        history_input_frame = ttk.Frame(history_settings_frame, style='Card.TFrame')
+        history_input_frame.pack(fill=tk.X, padx=20)
+
+        history_proxy_label = ttk.Label(history_input_frame, text="代理地址:", style='Card.TLabel')
+        history_proxy_label.grid(row=0, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.history_proxy_entry = ttk.Entry(history_input_frame, width=45, font=('微软雅黑', 10))
+        self.history_proxy_entry.grid(row=0, column=1, padx=(0, 20), pady=5, sticky="ew")
+
+        history_days_label = ttk.Label(history_input_frame, text="最近天数:", style='Card.TLabel')
+        history_days_label.grid(row=0, column=2, padx=(0, 8), pady=5, sticky="e")
+
+        self.history_days_entry = ttk.Entry(history_input_frame, width=8, font=('微软雅黑', 10))
+        self.history_days_entry.grid(row=0, column=3, pady=5)
+        self.history_days_entry.insert(0, "30")
+
+        history_target_label = ttk.Label(history_input_frame, text="目标地址:", style='Card.TLabel')
+        history_target_label.grid(row=1, column=0, padx=(0, 8), pady=5, sticky="e")
+
+        self.history_target_entry = ttk.Entry(history_input_frame, width=45, font=('微软雅黑', 10))
+        self.history_target_entry.grid(row=1, column=1, padx=(0, 20), pady=5, sticky="ew")
+
+        history_kind_label = ttk.Label(history_input_frame, text="测试类型:", style='Card.TLabel')
+        history_kind_label.grid(row=1, column=2, padx=(0, 8), pady=5, sticky="e")
+
+        self.history_kind_var = tk.StringVar(value="延迟")
+        self.history_kind_combo = ttk.Combobox(history_input_frame, textvariable=self.history_kind_var,
+                                               values=("延迟", "速度", "全部"), state="readonly", width=6)
+        self.history_kind_combo.grid(row=1, column=3, pady=5)
+
+        history_input_frame.columnconfigure(1, weight=1)
+
+        history_button_frame = ttk.Frame(history_settings_frame, style='Card.TFrame')
+        history_button_frame.pack(anchor=tk.E, padx=15, pady=(12, 0))
+
+        self.history_button = ttk.Button(history_button_frame, text="查询", style="Primary.TButton",
+                                         command=self.query_history, width=15)
+        self.history_button.pack(side=tk.LEFT, padx=6)
+
+        history_result_frame = ttk.Frame(self.history_tab, style='Card.TFrame')
+        history_result_frame.pack(fill=tk.BOTH, expand=True, padx=24, pady=(0, 24))
+
+        # 等宽字体使各次运行的数据对齐
+        self.history_text = tk.Text(history_result_frame, height=15, font=('Consolas', 10))
+        self.history_text.pack(fill=tk.BOTH, expand=True, padx=12, pady=12)
+        if self.run_store_error:
+            self.history_text.insert('1.0', self.run_store_error)
+        self.history_text.config(state=tk.DISABLED)
+
+    def query_history(self):
+        if not self.run_store:
+            messagebox.showerror("错误", self.run_store_error or "历史记录数据库不可用")
+            return
+        try:
+            days = float(self.history_days_entry.get() or 0)
+        except ValueError:
+            messagebox.showerror("错误", "请输入有效的天数")
+            return
+        kind = {"延迟": KIND_LATENCY, "速度": KIND_SPEED}.get(self.history_kind_var.get())
+        filters = {
+            'kind': kind,
+            'proxy': self.history_proxy_entry.get().strip() or None,
+            'target': self.history_target_entry.get().strip() or None,
+            'since': time.time() - days * 86400 if days > 0 else None,
+        }
+        # 查询只读取运行汇总和直方图，不扫描探测明细
+        histogram, run_count, total, failed = self.run_store.query_latency(**filters)
+        runs = self.run_store.list_runs(**filters)
+        self.history_text.config(state=tk.NORMAL)
+        self.history_text.delete('1.0', tk.END)
+        self.history_text.insert('1.0', format_history_report(runs, histogram, run_count, total, failed))
+        self.history_text.config(state=tk.DISABLED)
+
+    # 更新速度测试页的成功率和底部统计标签
+    def update_speed_summary_labels(self):
         if hasattr(self, 'speed_stats') and self.speed_stats['total'] > 0:
+            direction = self.speed_stats.get('direction', "下载")
             # 计算平均速度
             avg_speed = 0
             if len(self.speed_stats['speeds']) > 0:
@@ -842,7 +1434,7 @@ class ProxySpeedTester:
 
             # 构建简洁的统计信息文本（用于底部标签）
             summary_text = f"速度测试统计信息: 总测试 {self.speed_stats['total']} | 成功 {self.speed_stats['success']} | "
-            summary_text += f"总下载 {total_size_str} | 平均速度 {self.format_speed(avg_speed)} | "
+            summary_text += f"总{direction} {total_size_str} | 平均速度 {self.format_speed(avg_speed)} | "
             summary_text += f"最大速度 {self.format_speed(self.speed_stats['max_speed'])}"
 
             # 更新底部统计信息标签
@@ -860,7 +1452,8 @@ class ProxySpeedTester:
                 success_color = '#FF0000'  # 红色
 
             # 构建成功率和平均下载速度文本
-            stats_label_text = f"成功率: {success_rate:.2f}% | 平均下载速度: {self.format_speed(avg_speed)}"
+            stats_label_text = f"成功率: {success_rate:.2f}% | 平均{direction}速度: {self.format_speed(avg_speed)}"
+            stats_label_text += self.format_segment_summary(avg_speed)
 
             # 如果测试已完成，添加更多信息
             if not self.speed_testing and self.speed_stats['total'] == int(self.speed_count_entry.get()):
@@ -874,7 +1467,7 @@ class ProxySpeedTester:
             stats_text += f"成功次数: {self.speed_stats['success']}\n"
             stats_text += f"失败次数: {self.speed_stats['failed']}\n\n"
             stats_text += f"成功率: {success_rate:.2f}%\n\n"
-            stats_text += f"总下载: {total_size_str}\n"
+            stats_text += f"总{direction}: {total_size_str}\n"
             stats_text += f"最大速度: {self.format_speed(self.speed_stats['max_speed'])}\n"
             stats_text += f"最小速度: {self.format_speed(self.speed_stats['min_speed']) if self.speed_stats['min_speed'] != float('inf') else '0.00 KB/s'}\n"
             stats_text += f"平均速度: {self.format_speed(avg_speed)}\n"
@@ -890,6 +1483,22 @@ class ProxySpeedTester:
         self.speed_stats_text.insert('1.0', stats_text)
         self.speed_stats_text.config(state=tk.DISABLED)
 
+    def format_segment_summary(self, avg_speed):
+        # 分段模式下附加分段数、单流基准和扩展效率
+        segments = self.speed_stats.get('segments', 1)
+        if segments <= 1:
+            return ""
+        text = f" | 分段: {segments}"
+        baseline = self.speed_stats.get('baseline_speed')
+        if baseline:
+            text += f" | 单流基准: {self.format_speed(baseline)}"
+            efficiency = scaling_efficiency(avg_speed, baseline, segments)
+            text += f" | 扩展效率: {efficiency * 100:.1f}%"
+        spreads = self.speed_stats.get('spreads')
+        if spreads:
+            text += f" | 分段离散度: {sum(spreads) / len(spreads) * 100:.1f}%"
+        return text
+
     # 添加一个新方法来重置测试状态
     def reset_test_state(self):
         self.is_testing = False
@@ -921,9 +1530,23 @@ class ProxySpeedTester:
         try:
             test_count = int(self.speed_count_entry.get())
             concurrency = int(self.speed_concurrency_entry.get())
-            if test_count <= 0 or concurrency <= 0:
-                messagebox.showerror("错误", "请输入大于0的测试次数和并发数量")
+            pool_size = int(self.pool_size_entry.get())
+            chunk_size = int(self.speed_chunk_entry.get()) * 1024
+            segments = int(self.speed_segments_entry.get())
+            upload = self.speed_direction_var.get() == "上传"
+            upload_size = int(float(self.speed_upload_size_entry.get()) * 1024 * 1024)
+            if (test_count <= 0 or concurrency <= 0 or pool_size <= 0 or chunk_size <= 0 or segments <= 0
+                    or upload_size <= 0):
+                messagebox.showerror("错误", "请输入大于0的测试次数、并发数量、块大小、分段数和上传大小")
                 return
+            # 分段模式只用于下载
+            if upload:
+                segments = 1
+            download_url = self.speed_download_url_entry.get().strip() or DEFAULT_DOWNLOAD_URL
+            upload_url = self.speed_upload_url_entry.get().strip() or DEFAULT_UPLOAD_URL
+            # 下载测试沿用代理设置中的连接模式和连接池大小
+            self.connection_mode = self.connection_mode_var.get()
+            self.pool_size = pool_size
         except ValueError:
             messagebox.showerror("错误", "请输入有效的测试次数和并发数量")
             return
@@ -933,6 +1556,7 @@ class ProxySpeedTester:
             self.speed_result_tree.delete(item)
 
         # 重置统计数据
+        self.speed_records = []
         self.speed_stats = {
             'total': 0,
             'success': 0,
@@ -940,7 +1564,12 @@ class ProxySpeedTester:
             'total_speed': 0,
             'max_speed': 0,
             'min_speed': float('inf'),
-            'speeds': []
+            'speeds': [],
+            # 分段下载：分段数、单流基准速度、每次测试的分段速度离散系数
+            'segments': segments,
+            'baseline_speed': None,
+            'spreads': [],
+            'direction': "上传" if upload else "下载"
         }
 
         # 重置进度显示
@@ -957,6 +1586,14 @@ class ProxySpeedTester:
         # 更新统计显示
         self.update_speed_stats_display()
 
+        speed_run_id = None
+        if self.run_store:
+            speed_run_id = self.run_store.start_run(
+                KIND_SPEED, self.proxy_entry.get().strip(), upload_url if upload else download_url,
+                {'count': test_count, 'concurrency': concurrency, 'chunk_size': chunk_size, 'segments': segments,
+                 'direction': 'upload' if upload else 'download', 'upload_size': upload_size,
+                 'mode': self.connection_mode})
+
         # 设置测试状态
         self.speed_testing = True
         self.speed_test_button.config(text="停止测试", style="Warning.TButton")
@@ -981,9 +1618,8 @@ class ProxySpeedTester:
                         break
 
                     # 处理测试结果
-                    if result[1] == "成功":  # 检查状态
-                        # 解包参数，现在包含实时速度
-                        test_id, status, url, size_kb, time_s, realtime_speed, speed_kbps, error = result
+                    if result.success:
+                        test_id, status, realtime_speed = result.test_id, "成功", result.realtime_speed
 
                         # 检查是否已经有对应的树项
                         if hasattr(self, 'speed_update_map') and test_id in self.speed_update_map:
@@ -1019,10 +1655,10 @@ class ProxySpeedTester:
                                     self.speed_result_tree.item(tree_item_id, values=(
                                         test_id,
                                         status,
-                                        f"{size_kb:.2f} KB",
-                                        f"{time_s:.2f} 秒",
+                                        f"{result.bytes / 1024:.2f} KB",
+                                        f"{result.elapsed:.2f} 秒",
                                         realtime_display,  # 使用带指示器的实时速度显示
-                                        self.format_speed(speed_kbps),  # 平均速度，智能单位转换
+                                        self.format_speed(result.avg_speed),  # 平均速度，智能单位转换
                                         progress_display  # 进度显示
                                     ))
 
@@ -1039,7 +1675,7 @@ class ProxySpeedTester:
                             print(f"警告: 未找到测试ID {test_id} 的速度更新映射")
                     else:
                         try:
-                            test_id, status, url, size_kb, time_s, realtime_speed, speed_kbps, error = result
+                            test_id, status, error = result.test_id, "失败", result.error
 
                             # 检查是否已经有对应的树项
                             if hasattr(self, 'speed_update_map') and test_id in self.speed_update_map:
@@ -1092,9 +1728,9 @@ class ProxySpeedTester:
                             print(f"处理失败结果错误: {str(e)}")
                             # 尝试使用更安全的方式插入
                             try:
-                                error_msg = str(result[-1]) if len(result) > 7 else "未知错误"
+                                error_msg = result.error or "未知错误"
                                 self.speed_result_tree.insert('', 'end', values=(
-                                    result[0] if len(result) > 0 else 0,
+                                    result.test_id,
                                     "失败",
                                     "N/A",
                                     "N/A",
@@ -1129,148 +1765,67 @@ class ProxySpeedTester:
         # 测试单个URL的下载速度
         def test_single_download(test_id, url):
             proxy_url = self.proxy_entry.get().strip()
-            proxy = {
-                'http': proxy_url,
-                'https': proxy_url
-            } if proxy_url else None
+            # 读取线程只累加字节数，实时速度由全局速度更新函数按定时器采样
+            segmented = None
+            if segments > 1:
+                # 分段模式：同一对象按 Range 切分，经多条独立隧道并行下载
+                segmented = SegmentedDownload(url, proxy_url, segments, chunk_size, timeout=15)
+                progress = segmented.progress
+            else:
+                progress = TransferProgress()
+
+            # 预先在树视图中插入一个项目，这样可以立即开始更新实时速度
+            tree_item_id = self.speed_result_tree.insert('', 'end', values=(
+                test_id,
+                "上传中..." if upload else "下载中...",
+                f"0.00 KB",
+                "0.00 秒",
+                "0.00 KB/s",  # 初始实时速度
+                "0.00 KB/s",  # 初始平均速度
+                "0%"  # 初始进度
+            ))
+
+            # 将当前测试的进度和树项ID存储到全局映射表中
+            self.speed_update_map[test_id] = {
+                'progress': progress,
+                'tree_item_id': tree_item_id,
+            }
 
-            start_time = time.time()
             try:
-                response = requests.get(url, proxies=proxy, timeout=15, stream=True)
-
-                # 获取文件总大小（如果服务器提供）
-                total_size = int(response.headers.get('content-length', 0))
-                total_size_kb = total_size / 1024 if total_size > 0 else 0
-
-                # 读取内容计算大小
-                content_size = 0
-                last_update_time = time.time()
-                last_content_size = 0
-                current_speed = 0
-
-                # 创建一个队列用于实时更新UI
-                import queue
-                speed_update_queue = queue.Queue()
-
-                # 创建一个变量存储当前测试项的ID
-                tree_item_id = None
-
-                # 添加一个方法来设置树项ID，供外部调用
-                def set_tree_item_id(item_id):
-                    nonlocal tree_item_id
-                    tree_item_id = item_id
-
-                # 创建一个预先的树项，这样我们可以立即开始更新实时速度
-                # 初始进度为0%
-                progress_display = "0%"
-
-                # 预先在树视图中插入一个项目
-                item_id = self.speed_result_tree.insert('', 'end', values=(
-                    test_id,
-                    "下载中...",
-                    f"0.00 KB",
-                    "0.00 秒",
-                    "0.00 KB/s",  # 初始实时速度
-                    "0.00 KB/s",  # 初始平均速度
-                    progress_display  # 初始进度
-                ))
-
-                # 确保滚动到当前测试项
-                self.speed_result_tree.see(item_id)
-                self.window.update_idletasks()
-
-                # 设置树项ID
-                tree_item_id = item_id
-
-                # 将当前测试的信息存储到全局映射表中，包括已创建的树项ID
-                self.speed_update_map[test_id] = {
-                    'queue': speed_update_queue,
-                    'tree_item_id': tree_item_id,  # 直接设置树项ID
-                    'total_size_kb': total_size_kb,
-                    'last_speed': 0,
-                    'last_progress': 0,
-                    'last_update_time': time.time()
-                }
-
-                # 打印调试信息
-                print(f"已注册测试ID {test_id} 的速度更新队列，树项ID: {tree_item_id}")
-
-                # 强制更新UI
-                self.window.update_idletasks()
-
-                # 记录最后一次测量的实时速度值，用于返回结果
-                last_realtime_speed = 0
-                # 记录速度历史，用于计算平均速度
-                speed_history = []
-                # 记录下载开始时间，用于计算平均速度
-                download_start_time = time.time()
-
-                for chunk in response.iter_content(chunk_size=8192):
-                    if not self.speed_testing:
-                        # 如果测试被停止，则中断下载
-                        raise Exception("测试被用户中断")
-
-                    if chunk:
-                        chunk_size = len(chunk)
-                        content_size += chunk_size
-
-                        # 计算实时速度（每0.1秒更新一次，大幅提高更新频率）
-                        current_time = time.time()
-                        time_diff = current_time - last_update_time
-
-                        if time_diff >= 0.1:  # 每0.1秒更新一次速度，提高更新频率
-                            size_diff = content_size - last_content_size  # 这段时间内下载的字节数
-                            current_speed = (size_diff / 1024) / time_diff  # 当前速度 KB/s
-
-                            # 应用平滑处理，避免速度波动过大
-                            if len(speed_history) > 0:
-                                # 使用简单的移动平均来平滑速度显示
-                                smoothed_speed = (current_speed + speed_history[-1]) / 2
-                                current_speed = smoothed_speed
-
-                            last_realtime_speed = current_speed  # 保存最后一次测量的实时速度
-
-                            # 记录当前速度到历史记录
-                            speed_history.append(current_speed)
-
-                            # 限制历史记录长度，只保留最近的速度值
-                            if len(speed_history) > 10:
-                                speed_history = speed_history[-10:]
-
-                            # 计算平均速度（使用所有历史速度的平均值）
-                            avg_speed = sum(speed_history) / len(speed_history)
-
-                            # 计算下载进度百分比
-                            progress_percent = (content_size / total_size * 100) if total_size > 0 else 0
-
-                            # 将当前速度放入队列，由UI线程处理
-                            speed_update_queue.put((content_size, current_speed, progress_percent, avg_speed))
-
-                            # 更新基准值
-                            last_update_time = current_time
-                            last_content_size = content_size
-
-                # 计算总体平均速度
-                elapsed_time = time.time() - start_time
-                file_size_kb = content_size / 1024  # KB
-                speed_kbps = file_size_kb / elapsed_time if elapsed_time > 0 else 0  # KB/s
-
-                # 返回结果中添加最后一次测量的实时速度
-                return test_id, "成功", url, file_size_kb, elapsed_time, last_realtime_speed, speed_kbps, None
-            except requests.exceptions.RequestException as e:
-                return test_id, "失败", url, 0, 0, 0, 0, str(e)
+                should_stop = lambda: not self.speed_testing
+                if upload:
+                    streaming_upload(url, upload_size, proxy_url, progress, chunk_size, should_stop, timeout=15)
+                elif segmented:
+                    summary = segmented.run(should_stop)
+                else:
+                    # warm 模式复用本线程上一次下载的连接
+                    keep_alive = mode_for_request(self.connection_mode, test_id) == MODE_WARM
+                    discard_download(url, proxy_url, progress, chunk_size=chunk_size, timeout=15,
+                                     should_stop=should_stop, keep_alive=keep_alive)
+                # 结果中包含最后一次采样的实时速度
+                return TransferResult.from_progress(test_id, url, progress, proxy_url,
+                                                    summary['spread'] if segmented else None)
             except Exception as e:
-                return test_id, "失败", url, 0, 0, 0, 0, str(e)
+                return TransferResult(test_id, False, url, error=str(e), proxy=proxy_url)
 
         # 运行测试的线程函数
         def run_speed_tests():
             try:
                 # 测试文件URL列表
-                test_urls = [
-                    "https://speed.cloudflare.com/__down?bytes=10485760",  # 10MB文件
-                    "https://speed.cloudflare.com/__down?bytes=10485760",  # 10MB文件
-                    "https://speed.cloudflare.com/__down?bytes=10485760"   # 10MB文件
-                ]
+                test_urls = [download_url]
+                if upload:
+                    test_urls = [upload_url]
+
+                if segments > 1:
+                    # 先用单条连接下载同一对象作为基准，用于计算多连接的扩展效率
+                    self.window.after(0, lambda: self.stats_summary_label.config(text="速度测试统计信息: 正在测量单流基准..."))
+                    baseline = TransferProgress()
+                    try:
+                        discard_download(test_urls[0], self.proxy_entry.get().strip(), baseline, chunk_size,
+                                         should_stop=lambda: not self.speed_testing)
+                        self.speed_stats['baseline_speed'] = baseline.average_speed
+                    except Exception as e:
+                        print(f"单流基准测量失败: {str(e)}")
 
                 # 创建线程池
                 with ThreadPoolExecutor(max_workers=concurrency) as executor:
@@ -1294,13 +1849,17 @@ class ProxySpeedTester:
                             # 将结果放入队列，由UI线程处理
                             speed_result_queue.put(result)
 
-                            # 解包结果用于统计
-                            test_id, status, url, size_kb, time_s, realtime_speed, speed_kbps, error = result
+                            self.speed_records.append(result)
+                            if speed_run_id is not None:
+                                self.run_store.add_transfer(speed_run_id, result)
 
                             # 更新统计数据
+                            speed_kbps = result.avg_speed
                             self.speed_stats['total'] += 1
-                            if status == "成功":
+                            if result.success:
                                 self.speed_stats['success'] += 1
+                                if result.spread is not None:
+                                    self.speed_stats['spreads'].append(result.spread)
                                 self.speed_stats['total_speed'] += speed_kbps
                                 self.speed_stats['speeds'].append(speed_kbps)
 
@@ -1312,10 +1871,20 @@ class ProxySpeedTester:
                             else:
                                 self.speed_stats['failed'] += 1
                         except Exception as e:
-                            speed_result_queue.put((0, "失败", "", 0, 0, 0, 0, f"执行错误: {str(e)}"))
+                            speed_result_queue.put(TransferResult(0, False, "", error=f"执行错误: {str(e)}"))
             except Exception as e:
                 print(f"下载速度测试错误: {str(e)}")
             finally:
+                if speed_run_id is not None:
+                    stats = self.speed_stats
+                    speeds = stats['speeds']
+                    self.run_store.finish_run(speed_run_id, status=RUN_FINISHED if self.speed_testing else RUN_STOPPED,
+                                              summary={'total': stats['total'], 'success': stats['success'],
+                                                       'failed': stats['failed'],
+                                                       'avg_speed': sum(speeds) / len(speeds) if speeds else 0,
+                                                       'max_speed': stats['max_speed'],
+                                                       'min_speed': min(speeds, default=0),
+                                                       'baseline_speed': stats['baseline_speed']})
                 # 测试完成后重置状态
                 self.speed_testing = False
                 self.window.after(0, lambda: self.speed_test_button.config(text="开始测试", style="Primary.TButton"))
@@ -1329,21 +1898,17 @@ class ProxySpeedTester:
 
     # 启动全局实时速度更新函数
     def start_global_speed_updater(self):
-        """启动一个全局的实时速度更新函数，处理所有测试项的速度更新"""
+        """启动一个全局的实时速度更新函数，按定时器采样所有进行中下载的进度"""
         def update_all_speeds():
             if not hasattr(self, 'speed_update_map'):
                 return
 
-            # 打印调试信息
-            if self.speed_testing:
-                print(f"全局速度更新: 当前有 {len(self.speed_update_map)} 个测试项")
-
-            # 处理每个测试项的速度更新
             for test_id, test_info in list(self.speed_update_map.items()):
-                queue = test_info.get('queue')
+                progress = test_info.get('progress')
                 tree_item_id = test_info.get('tree_item_id')
 
-                if not queue or not tree_item_id:
+                # 已完成的下载由结果处理函数写入最终结果
+                if not progress or not tree_item_id or progress.finished:
                     continue
 
                 # 检查树项是否存在
@@ -1354,92 +1919,66 @@ class ProxySpeedTester:
                 except Exception:
                     continue
 
-                # 处理队列中的所有更新
-                updates_processed = 0
-                max_updates_per_item = 3  # 每个测试项每次处理的最大更新数
+                current_speed, avg_speed, progress_percent = progress.sample()
 
-                while not queue.empty() and updates_processed < max_updates_per_item:
-                    try:
-                        # 获取最新的速度更新
-                        current_size, current_speed, progress_percent, avg_speed = queue.get_nowait()
-                        updates_processed += 1
-
-                        # 更新测试信息
-                        test_info['last_speed'] = current_speed
-                        test_info['last_progress'] = progress_percent
-                        test_info['last_update_time'] = time.time()
-
-                        # 创建新的值元组
-                        new_values = list(current_values)
-                        while len(new_values) < 7:
-                            new_values.append("")
-
-                        # 使用智能单位转换显示速度
-                        formatted_speed = self.format_speed(current_speed)
-                        formatted_avg = self.format_speed(avg_speed)
-
-                        # 为实时速度添加动态指示器和动画效果
-                        if current_speed > 0:
-                            # 根据速度大小选择不同的指示器和颜色
-                            if current_speed < 100:
-                                indicator = "▲"
-                                speed_color = "慢"
-                            elif current_speed < 500:
-                                indicator = "▲▲"
-                                speed_color = "中"
-                            elif current_speed < 1000:
-                                indicator = "▲▲▲"
-                                speed_color = "快"
-                            elif current_speed < 5000:
-                                indicator = "▲▲▲▲"
-                                speed_color = "很快"
-                            else:
-                                indicator = "▲▲▲▲▲"
-                                speed_color = "超快"
-
-                            # 添加动画效果
-                            animation_frame = int((time.time() * 10) % 3)
-                            if animation_frame == 0:
-                                animation = "⟳"
-                            elif animation_frame == 1:
-                                animation = "⟲"
-                            else:
-                                animation = "↻"
+                # 创建新的值元组
+                new_values = list(current_values)
+                while len(new_values) < 7:
+                    new_values.append("")
 
-                            # 更新实时速度显示
-                            new_values[4] = f"{formatted_speed} {indicator} [{speed_color}] {animation}"
-                        else:
-                            new_values[4] = formatted_speed
+                # 使用智能单位转换显示速度
+                formatted_speed = self.format_speed(current_speed)
+                formatted_avg = self.format_speed(avg_speed)
 
-                        # 更新平均速度
-                        new_values[5] = formatted_avg
+                # 为实时速度添加动态指示器和动画效果
+                if current_speed > 0:
+                    # 根据速度大小选择不同的指示器和颜色
+                    if current_speed < 100:
+                        indicator = "▲"
+                        speed_color = "慢"
+                    elif current_speed < 500:
+                        indicator = "▲▲"
+                        speed_color = "中"
+                    elif current_speed < 1000:
+                        indicator = "▲▲▲"
+                        speed_color = "快"
+                    elif current_speed < 5000:
+                        indicator = "▲▲▲▲"
+                        speed_color = "很快"
+                    else:
+                        indicator = "▲▲▲▲▲"
+                        speed_color = "超快"
+
+                    # 添加动画效果
+                    animation_frame = int((time.time() * 10) % 3)
+                    if animation_frame == 0:
+                        animation = "⟳"
+                    elif animation_frame == 1:
+                        animation = "⟲"
+                    else:
+                        animation = "↻"
 
-                        # 更新进度列，添加进度条效果
-                        progress_bar = ""
-                        bar_length = int(progress_percent / 10)
-                        progress_bar = "▓" * bar_length + "░" * (10 - bar_length)
-                        new_values[6] = f"{progress_percent:.1f}% {progress_bar}"
+                    # 更新实时速度显示
+                    new_values[4] = f"{formatted_speed} {indicator} [{speed_color}] {animation}"
+                else:
+                    new_values[4] = formatted_speed
 
-                        # 更新树项
-                        self.speed_result_tree.item(tree_item_id, values=tuple(new_values))
+                # 更新已传输大小、耗时和平均速度
+                new_values[2] = f"{progress.bytes / 1024:.2f} KB"
+                new_values[3] = f"{progress.elapsed:.2f} 秒"
+                new_values[5] = formatted_avg
 
-                        # 确保滚动到当前测试项
-                        self.speed_result_tree.see(tree_item_id)
+                # 更新进度列，添加进度条效果
+                bar_length = int(progress_percent / 10)
+                progress_bar = "▓" * bar_length + "░" * (10 - bar_length)
+                new_values[6] = f"{progress_percent:.1f}% {progress_bar}"
 
-                        # 标记任务完成
-                        queue.task_done()
-                    except queue.Empty:
-                        break
-                    except Exception as e:
-                        print(f"处理速度更新错误: {str(e)}")
-                        try:
-                            queue.task_done()
-                        except:
-                            pass
+                # 更新树项
+                self.speed_result_tree.item(tree_item_id, values=tuple(new_values))
 
             # 无论测试是否在进行，都继续更新一段时间
             # 这确保了即使测试结束，最后的速度更新也能显示出来
-            self.window.after(20, update_all_speeds)
+            self.window.after(int(SAMPLE_INTERVAL * 1000), update_all_speeds)
 
         # 启动更新
         self.window.after(10, update_all_speeds)
@@ -1448,6 +1987,7 @@ class ProxySpeedTester:
     def update_speed_stats_display(self):
         if not hasattr(self, 'speed_stats'):
             return
+        self.update_speed_summary_labels()
 
         # 清空文本框
         self.speed_stats_text.config(state=tk.NORMAL)
@@ -1553,5 +2093,7 @@ class ProxySpeedTester:
         self.speed_stats_text.config(state=tk.DISABLED)
 
 if __name__ == '__main__':
+    # 打包后的程序以 spawn 方式启动工作进程时需要
+    multiprocessing.freeze_support()
     app = ProxySpeedTester()
     app.window.mainloop()
\ No newline at end of file
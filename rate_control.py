@@ -0,0 +1,81 @@
+import threading
+import time
+
+
+# 未获得许可时的轮询间隔，决定暂停/继续和调整参数的生效延迟
+POLL_INTERVAL = 0.005
+
+
+class TokenBucket:
+    """线程安全的令牌桶，rate <= 0 表示不限速"""
+
+    def __init__(self, rate=0, burst=1):
+        self._lock = threading.Lock()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            if burst is not None:
+                self.burst = max(1, burst)
+                self.tokens = min(self.tokens, self.burst)
+
+    def _refill(self, now):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self):
+        """取走一个令牌返回 0，否则返回距下一个令牌的秒数"""
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class DispatchController:
+    """探测任务的发送控制：令牌桶限速、并发上限、暂停/继续
+
+    调度线程（或协程）在每次提交任务前调用 try_acquire，只有获得许可才提交，
+    因此暂停、限速和并发调整在几毫秒内生效，不会有预先提交的任务继续发出。
+    所有参数都可以在运行过程中从界面线程修改。
+    """
+
+    def __init__(self, rate=0, burst=1, concurrency=50):
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = concurrency
+        self.paused = False
+        self.stopped = False
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def stop(self):
+        self.stopped = True
+
+    def set_rate(self, rate, burst=None):
+        self.bucket.set_rate(rate, burst)
+
+    def set_concurrency(self, concurrency):
+        self.concurrency = max(1, concurrency)
+
+    def try_acquire(self, in_flight):
+        """获得发送许可返回 0，否则返回建议的等待秒数
+
+        并发已满时返回轮询间隔，调用方可在有任务完成时提前唤醒。
+        """
+        if self.paused or in_flight >= self.concurrency:
+            return POLL_INTERVAL
+        delay = self.bucket.try_take()
+        return min(delay, POLL_INTERVAL) if delay else 0
@@ -0,0 +1,71 @@
+import queue
+import time
+
+from latency_stats import LatencyHistogram
+
+
+class RenderScheduler:
+    """按帧率批量渲染的调度器
+
+    每帧（默认最多30帧/秒）一次性取出结果队列中积压的数据交给 on_batch，
+    然后调用一次 on_frame 刷新表格和统计，界面开销与结果数量无关。
+    同时记录界面事件循环的延迟（实际执行时间与计划时间之差）。
+    """
+
+    def __init__(self, widget, source_queue, on_batch, on_frame, is_active, fps=30, frame_budget=0.008):
+        self.widget = widget
+        self.source_queue = source_queue
+        self.on_batch = on_batch
+        self.on_frame = on_frame
+        self.is_active = is_active
+        self.interval = 1.0 / fps
+        # 每帧取数的时间预算，防止积压过多时一帧占用太久
+        self.frame_budget = frame_budget
+        self.lag = LatencyHistogram()
+        self.frames = 0
+        self.backlog = 0
+        self.running = False
+        self._expected = 0
+
+    def start(self):
+        self.running = True
+        self._schedule()
+
+    def _schedule(self):
+        self._expected = time.perf_counter() + self.interval
+        self.widget.after(int(self.interval * 1000), self._tick)
+
+    def _tick(self):
+        now = time.perf_counter()
+        self.lag.record(max(0, now - self._expected))
+        self.frames += 1
+        # 先判断测试是否结束再取数：结束后不会再有新结果入队，取空即可停止
+        active = self.is_active()
+
+        batch = []
+        deadline = now + self.frame_budget
+        while True:
+            try:
+                batch.append(self.source_queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) % 256 == 0 and time.perf_counter() > deadline:
+                break
+        self.backlog = self.source_queue.qsize()
+
+        if batch:
+            self.on_batch(batch)
+        self.on_frame(bool(batch))
+
+        # 测试结束后继续运行，直到队列中的结果全部渲染完毕
+        if active or self.backlog:
+            self._schedule()
+        else:
+            self.running = False
+
+    def lag_text(self):
+        if self.lag.count == 0:
+            return ""
+        return (f"界面延迟: 平均 {self.lag.mean * 1000:.1f}ms | p99 {self.lag.percentile(99) * 1000:.1f}ms"
+                f" | 最大 {self.lag.max * 1000:.1f}ms\n"
+                f"渲染帧数: {self.frames} | 待渲染: {self.backlog}\n")
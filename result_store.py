@@ -0,0 +1,101 @@
+from array import array
+
+from probe_engine import BODY_HASH_SIZE
+
+
+# 未保存响应体时哈希列中的占位值
+EMPTY_HASH = bytes(BODY_HASH_SIZE)
+
+
+class ResultStore:
+    """按列存储的探测结果
+
+    数值字段使用 array 紧凑存储，状态码和错误分类字符串做驻留只保存编号，响应体只保存截断的原始字节，
+    哈希按固定长度连续存放在一个 bytearray 中。支持按行号随机访问和分页读取，供虚拟化表格按需取数。
+    """
+
+    def __init__(self):
+        self.request_ids = array('q')
+        self.successes = array('b')
+        self.elapsed = array('d')
+        self.code_indexes = array('H')
+        self.error_indexes = array('H')
+        self.details = []
+        # 响应体前缀（未保存时为 b''）、完整响应体的字节数和哈希（未保存时为全零）
+        self.bodies = []
+        self.sizes = array('q')
+        self.body_hashes = bytearray()
+        # 状态码和错误分类的驻留表
+        self.codes = []
+        self._code_lookup = {}
+
+    def __len__(self):
+        return len(self.request_ids)
+
+    def _intern_code(self, status_code):
+        index = self._code_lookup.get(status_code)
+        if index is None:
+            index = len(self.codes)
+            self.codes.append(status_code)
+            self._code_lookup[status_code] = index
+        return index
+
+    def append(self, result):
+        """追加一条 ProbeResult，返回行号"""
+        self.request_ids.append(result.request_id)
+        self.successes.append(1 if result.success else 0)
+        self.elapsed.append(result.elapsed)
+        self.code_indexes.append(self._intern_code(result.status_code))
+        self.error_indexes.append(self._intern_code(result.error))
+        self.details.append(result.details)
+        self.bodies.append(result.body)
+        self.sizes.append(result.bytes)
+        self.body_hashes += result.body_hash or EMPTY_HASH
+        return len(self.request_ids) - 1
+
+    def row(self, index):
+        # 返回 (请求ID, 是否成功, 耗时, 状态码, 详情)
+        return (self.request_ids[index], bool(self.successes[index]), self.elapsed[index],
+                self.codes[self.code_indexes[index]], self.details[index])
+
+    def body(self, index):
+        # 返回 (响应体前缀, 响应体字节数, 哈希)，未保存响应体时哈希为 b''
+        digest = bytes(self.body_hashes[index * BODY_HASH_SIZE:(index + 1) * BODY_HASH_SIZE])
+        return self.bodies[index], self.sizes[index], digest if digest != EMPTY_HASH else b''
+
+    def page(self, start, count):
+        """读取从 start 开始的最多 count 行"""
+        end = min(len(self), start + count)
+        return [self.row(index) for index in range(max(0, start), end)]
+
+    def iter_pages(self, batch_size):
+        """逐页读取当前已有的行，可在其他线程中调用
+
+        开始时取得各列的引用和行数，读取期间继续追加或清除结果都不影响本次读取。
+        """
+        request_ids, successes, elapsed = self.request_ids, self.successes, self.elapsed
+        code_indexes, error_indexes, codes = self.code_indexes, self.error_indexes, self.codes
+        details, sizes, body_hashes = self.details, self.sizes, self.body_hashes
+        end = len(request_ids)
+        for start in range(0, end, batch_size):
+            page = []
+            for index in range(start, min(end, start + batch_size)):
+                digest = bytes(body_hashes[index * BODY_HASH_SIZE:(index + 1) * BODY_HASH_SIZE])
+                # 与导出列 LATENCY_FIELDS 的顺序一致
+                page.append((request_ids[index], bool(successes[index]), elapsed[index], codes[code_indexes[index]],
+                             codes[error_indexes[index]], sizes[index], digest.hex() if digest != EMPTY_HASH else '',
+                             details[index]))
+            yield page
+
+    def find_request(self, request_id):
+        # 请求ID基本按顺序递增，先尝试直接定位，再回退到线性查找
+        guess = request_id - self.request_ids[0] if self.request_ids else -1
+        if 0 <= guess < len(self) and self.request_ids[guess] == request_id:
+            return guess
+        try:
+            return self.request_ids.index(request_id)
+        except ValueError:
+            return None
+
+    def clear(self):
+        self.__init__()
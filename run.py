@@ -1,5 +1,8 @@
+import multiprocessing
+
 from proxy_speed_test import ProxySpeedTester
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
     app = ProxySpeedTester()
     app.window.mainloop()
\ No newline at end of file
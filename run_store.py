@@ -0,0 +1,330 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from latency_stats import LatencyHistogram
+
+
+# 默认数据库位置（用户目录下），多次运行和多个入口共用
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser('~'), '.proxy_speed_test', 'runs.db')
+# 写入线程每批最多写入的行数，以及未满一批时的最长等待（秒）
+WRITE_BATCH_SIZE = 5000
+WRITE_INTERVAL = 0.5
+
+# 测试类型
+KIND_LATENCY = 'latency'
+KIND_SPEED = 'speed'
+
+# 运行状态
+RUN_RUNNING = 'running'
+RUN_FINISHED = 'finished'
+RUN_STOPPED = 'stopped'
+RUN_FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    proxy TEXT NOT NULL,
+    target TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    success INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    timeout INTEGER NOT NULL DEFAULT 0,
+    error_rate REAL,
+    p50 REAL,
+    p99 REAL,
+    settings TEXT,
+    histogram TEXT,
+    summary TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_proxy ON runs (proxy, started);
+CREATE INDEX IF NOT EXISTS runs_target ON runs (target, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status, started);
+CREATE TABLE IF NOT EXISTS probes (
+    run_id INTEGER NOT NULL,
+    request_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    success INTEGER NOT NULL,
+    status_code TEXT,
+    elapsed REAL,
+    queue_delay REAL,
+    error TEXT,
+    bytes INTEGER,
+    proxy TEXT
+);
+CREATE INDEX IF NOT EXISTS probes_run ON probes (run_id, request_id);
+CREATE TABLE IF NOT EXISTS transfers (
+    run_id INTEGER NOT NULL,
+    transfer_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    success INTEGER NOT NULL,
+    bytes INTEGER,
+    elapsed REAL,
+    speed REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS transfers_run ON transfers (run_id, transfer_id);
+"""
+
+# 旧版本数据库缺少的明细列：{表名: [(列名, 类型)]}，打开时补齐
+ADDED_COLUMNS = {
+    'probes': [('error', 'TEXT'), ('bytes', 'INTEGER'), ('proxy', 'TEXT')],
+}
+
+
+def mask_proxy(proxy_url):
+    """去掉代理地址中的密码，保存和索引时只保留用户名、主机和端口"""
+    if not proxy_url:
+        return ''
+    parts = urlsplit(proxy_url if '://' in proxy_url else f"http://{proxy_url}")
+    if parts.password is None:
+        return urlunsplit(parts)
+    netloc = f"{parts.username}:***@{parts.hostname}" + (f":{parts.port}" if parts.port else '')
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def connect(path):
+    connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    # WAL 模式下写入不阻塞查询；同步级别 NORMAL 在 WAL 下仍能保证数据库一致
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class RunStore:
+    """保存每次测试运行和每条探测结果的 SQLite 存储（只追加）
+
+    探测结果先放入队列，由后台写入线程批量插入，记录调用只有一次入队开销。
+    每次运行结束时保存汇总计数和延迟直方图，历史查询直接合并各运行的直方图，
+    不需要扫描探测明细，因此按代理、目标和时间范围查询百分位只需几毫秒。
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = connect(path)
+        with self._connection:
+            self._connection.executescript(SCHEMA)
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {row[1] for row in self._connection.execute(f'PRAGMA table_info({table})')}
+                for column, column_type in columns:
+                    if column not in existing:
+                        self._connection.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def start_run(self, kind, proxy_url, target, settings=None):
+        """新建一次运行并返回运行ID"""
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                'INSERT INTO runs (kind, proxy, target, started, status, settings) VALUES (?, ?, ?, ?, ?, ?)',
+                (kind, mask_proxy(proxy_url), target or '', time.time(), RUN_RUNNING,
+                 json.dumps(settings or {}, ensure_ascii=False)))
+            return cursor.lastrowid
+
+    def add_results(self, run_id, results):
+        """追加探测结果（ProbeResult 序列），包括发起时间、错误分类、响应字节数和代理（不含密码）
+
+        ts 为探测自身的发起时间，没有记录发起时间的结果使用入队时间。
+        """
+        now = time.time()
+        # 同一批结果通常来自同一个代理，只对每个不同的地址去掉一次密码
+        masked = {}
+        rows = []
+        for result in results:
+            proxy = masked.get(result.proxy)
+            if proxy is None:
+                proxy = masked[result.proxy] = mask_proxy(result.proxy)
+            rows.append((run_id, result.request_id, result.started or now, 1 if result.success else 0,
+                         result.status_code, result.elapsed, result.queue_delay, result.error, result.bytes, proxy))
+        self._queue.put(('probes', rows))
+
+    def add_transfer(self, run_id, result):
+        """追加一次传输的结果（TransferResult）"""
+        self._queue.put(('transfers', [(run_id, result.test_id, time.time(), 1 if result.success else 0, result.bytes,
+                                        result.elapsed, result.avg_speed, result.error)]))
+
+    def finish_run(self, run_id, stats=None, status=RUN_FINISHED, summary=None):
+        """结束运行：保存汇总计数和延迟直方图，先等待该运行已入队的明细写完
+
+        没有探测统计时（如速度测试）从 summary 中读取 total/success/failed。
+        """
+        self.flush()
+        values = {'finished': time.time(), 'status': status,
+                  'summary': json.dumps(summary, ensure_ascii=False) if summary is not None else None}
+        if stats is None and summary:
+            total = summary.get('total', 0)
+            values.update(total=total, success=summary.get('success', 0), failed=summary.get('failed', 0),
+                          error_rate=summary.get('failed', 0) / total if total else None)
+        if stats is not None:
+            latency = stats.latency
+            values.update(total=stats.total, success=stats.success, failed=stats.failed, timeout=stats.timeout,
+                          error_rate=stats.failed / stats.total if stats.total else None,
+                          p50=latency.percentile(50) if latency.count else None,
+                          p99=latency.percentile(99) if latency.count else None,
+                          histogram=json.dumps(latency.to_dict()))
+        assignments = ', '.join(f"{column} = ?" for column in values)
+        with self._lock, self._connection:
+            self._connection.execute(f'UPDATE runs SET {assignments} WHERE id = ?', (*values.values(), run_id))
+
+    def flush(self):
+        """等待队列中的明细全部写入"""
+        done = threading.Event()
+        self._queue.put(('flush', done))
+        done.wait()
+
+    def close(self):
+        self.flush()
+        self._queue.put(None)
+        self._writer.join()
+        with self._lock:
+            self._connection.close()
+
+    def _write_loop(self):
+        # 写入线程使用自己的连接，凑满一批或等待超时后在一个事务中写入
+        connection = connect(self.path)
+        statements = {
+            'probes': 'INSERT INTO probes (run_id, request_id, ts, success, status_code, elapsed, queue_delay, error, '
+                      'bytes, proxy) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            'transfers': 'INSERT INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        }
+        running = True
+        while running:
+            pending = {'probes': [], 'transfers': []}
+            waiters = []
+            count = 0
+            deadline = time.monotonic() + WRITE_INTERVAL
+            while count < WRITE_BATCH_SIZE:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                kind, payload = item
+                if kind == 'flush':
+                    waiters.append(payload)
+                    break
+                pending[kind].extend(payload)
+                count += len(payload)
+            if count:
+                with connection:
+                    for kind, rows in pending.items():
+                        if rows:
+                            connection.executemany(statements[kind], rows)
+            for waiter in waiters:
+                waiter.set()
+        connection.close()
+
+    def _where(self, kind=None, proxy=None, target=None, since=None, until=None, status=None):
+        clauses, params = [], []
+        for column, value in (('kind', kind), ('proxy', mask_proxy(proxy) if proxy else None), ('target', target),
+                              ('status', status)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append('started >= ?')
+            params.append(since)
+        if until is not None:
+            clauses.append('started < ?')
+            params.append(until)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def list_runs(self, limit=100, **filters):
+        """按开始时间倒序列出运行，filters 为 kind/proxy/target/since/until/status"""
+        where, params = self._where(**filters)
+        columns = ('id', 'kind', 'proxy', 'target', 'started', 'finished', 'status', 'total', 'success', 'failed',
+                   'timeout', 'error_rate', 'p50', 'p99', 'summary')
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {', '.join(columns)} FROM runs{where} ORDER BY started DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        runs = [dict(zip(columns, row)) for row in rows]
+        for run in runs:
+            run['summary'] = json.loads(run['summary']) if run['summary'] else None
+        return runs
+
+    def query_latency(self, **filters):
+        """合并符合条件的所有运行的延迟直方图，返回 (直方图, 运行数, 总探测数, 失败数)
+
+        例如 query_latency(proxy=url, since=time.time() - 30 * 86400).percentile(99)。
+        """
+        where, params = self._where(**filters)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT histogram, total, failed FROM runs{where}", params).fetchall()
+        histogram = LatencyHistogram()
+        total = failed = 0
+        for data, run_total, run_failed in rows:
+            if data:
+                histogram.merge(LatencyHistogram.from_dict(json.loads(data)))
+            total += run_total
+            failed += run_failed
+        return histogram, len(rows), total, failed
+
+    def get_run(self, run_id):
+        """返回一次运行的记录，不存在时返回 None"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT id, kind, proxy, target, started, finished, status FROM runs WHERE id = ?', (run_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'kind', 'proxy', 'target', 'started', 'finished', 'status'), row))
+
+    def _iter_details(self, table, id_column, columns, run_id, batch_size):
+        # 按明细ID做键集分页，每次只取一批，内存占用与运行规模无关
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = self._connection.execute(
+                    f"SELECT {id_column}, {columns} FROM {table} WHERE run_id = ? AND {id_column} > ? "
+                    f"ORDER BY {id_column} LIMIT ?", (run_id, last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last_id = rows[-1][0]
+
+    def probes(self, run_id, batch_size=10000):
+        """按请求ID顺序逐批读取一次运行的探测明细：
+
+        (请求ID, 时间, 是否成功, 状态码, 耗时, 排队延迟, 错误分类, 响应字节数, 代理)
+        """
+        return self._iter_details('probes', 'request_id',
+                                  'ts, success, status_code, elapsed, queue_delay, error, bytes, proxy', run_id,
+                                  batch_size)
+
+    def transfers(self, run_id, batch_size=10000):
+        """按传输ID顺序逐批读取一次速度测试的明细：(传输ID, 时间, 是否成功, 字节数, 耗时, 速度, 错误)"""
+        return self._iter_details('transfers', 'transfer_id', 'ts, success, bytes, elapsed, speed, error', run_id,
+                                  batch_size)
+
+
+def format_history_report(runs, histogram, run_count, total, failed):
+    """历史查询结果：合并后的延迟百分位和各次运行的列表"""
+    text = f"运行次数: {run_count} | 探测总数: {total} | 失败率: {failed / total * 100 if total else 0:.2f}%\n"
+    if histogram.count:
+        percentiles = histogram.percentiles((50, 90, 99))
+        text += (f"合并延迟: p50 {percentiles[50]:.3f}秒 | p90 {percentiles[90]:.3f}秒 | "
+                 f"p99 {percentiles[99]:.3f}秒 | 最大 {histogram.max:.3f}秒\n")
+    text += f"\n{'ID':>6} {'开始时间':<19} {'类型':<8} {'状态':<9} {'总数':>7} {'失败率':>7} {'p50':>8} {'p99':>8}  代理\n"
+    for run in runs:
+        started = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(run['started']))
+        error_rate = f"{run['error_rate'] * 100:6.1f}%" if run['error_rate'] is not None else f"{'N/A':>7}"
+        latencies = "".join(f" {run[key]:8.3f}" if run[key] is not None else f" {'N/A':>8}" for key in ('p50', 'p99'))
+        text += (f"{run['id']:>6} {started:<19} {run['kind']:<8} {run['status']:<9} {run['total']:>7} "
+                 f"{error_rate}{latencies}  {run['proxy'] or '直连'}\n")
+    return text
@@ -0,0 +1,138 @@
+import threading
+
+from latency_stats import LatencyHistogram
+from probe_engine import PhaseAggregate, MODE_COLD, MODE_WARM
+
+
+class StatsShard:
+    """单个工作线程独占的统计分片，只由所属线程写入，因此无需加锁"""
+
+    def __init__(self):
+        self.total = 0
+        self.success = 0
+        self.failed = 0
+        self.timeout = 0
+        self.status_codes = {}
+        self.latency = LatencyHistogram()
+        self.modes = {MODE_COLD: LatencyHistogram(), MODE_WARM: LatencyHistogram()}
+        self.phases = PhaseAggregate()
+        # 开环模式：计划发送到实际发送的排队延迟，以及从计划发送时间算起的校正耗时
+        self.queue_delays = LatencyHistogram()
+        self.corrected = LatencyHistogram()
+
+    def record(self, status_code, success, elapsed=0, timeout=False, mode=MODE_COLD, phases=None,
+               queue_delay=None):
+        # 在探测完成时记录，total 与 success/failed 同步增加
+        self.total += 1
+        if queue_delay is not None:
+            self.queue_delays.record(queue_delay)
+            if success:
+                self.corrected.record(elapsed + queue_delay)
+        self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+        if success:
+            self.success += 1
+            self.latency.record(elapsed)
+            self.modes[mode].record(elapsed)
+        else:
+            self.failed += 1
+            if timeout:
+                self.timeout += 1
+        self.phases.add(phases)
+
+    def record_result(self, result):
+        self.record(result.status_code, result.success, result.elapsed, result.timeout, result.mode, result.phases,
+                    result.queue_delay)
+
+    def merge(self, other):
+        self.total += other.total
+        self.success += other.success
+        self.failed += other.failed
+        self.timeout += other.timeout
+        # dict.copy() 在GIL下是原子的，避免写线程新增键时迭代出错
+        for code, count in other.status_codes.copy().items():
+            self.status_codes[code] = self.status_codes.get(code, 0) + count
+        self.latency.merge(other.latency)
+        for mode, histogram in other.modes.items():
+            self.modes[mode].merge(histogram)
+        self.phases.merge(other.phases)
+        self.queue_delays.merge(other.queue_delays)
+        self.corrected.merge(other.corrected)
+        return self
+
+    def to_dict(self):
+        """序列化为只含基本类型的字典，供工作进程定期上报"""
+        return {
+            'total': self.total,
+            'success': self.success,
+            'failed': self.failed,
+            'timeout': self.timeout,
+            'status_codes': dict(self.status_codes),
+            'latency': self.latency.to_dict(),
+            'modes': {mode: histogram.to_dict() for mode, histogram in self.modes.items()},
+            'phases': self.phases.to_dict(),
+            'queue_delays': self.queue_delays.to_dict(),
+            'corrected': self.corrected.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        shard = cls()
+        shard.total = data['total']
+        shard.success = data['success']
+        shard.failed = data['failed']
+        shard.timeout = data['timeout']
+        shard.status_codes = dict(data['status_codes'])
+        shard.latency = LatencyHistogram.from_dict(data['latency'])
+        shard.modes = {mode: LatencyHistogram.from_dict(histogram) for mode, histogram in data['modes'].items()}
+        shard.phases = PhaseAggregate.from_dict(data['phases'])
+        shard.queue_delays = LatencyHistogram.from_dict(data['queue_delays'])
+        shard.corrected = LatencyHistogram.from_dict(data['corrected'])
+        return shard
+
+
+class ShardedStats:
+    """按线程分片的统计聚合器
+
+    每个工作线程第一次记录时获得自己的分片，之后的记录只写本线程分片，热路径上没有
+    全局锁，计数不会因并发读改写而丢失。界面需要显示时调用 snapshot() 合并所有分片。
+    工作进程的统计通过 set_remote_shard() 定期整体替换，与本进程的分片一起合并。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        # 其他进程上报的累计分片，按工作进程编号保存
+        self._remote = {}
+        # 只在线程首次注册分片时使用，不在记录路径上
+        self._register_lock = threading.Lock()
+
+    def shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = StatsShard()
+            with self._register_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def record(self, status_code, success, elapsed=0, timeout=False, mode=MODE_COLD, phases=None,
+               queue_delay=None):
+        self.shard().record(status_code, success, elapsed, timeout, mode, phases, queue_delay)
+
+    def record_result(self, result):
+        self.shard().record_result(result)
+
+    def set_remote_shard(self, key, shard):
+        # 工作进程上报的是累计值，直接替换上一次的分片
+        with self._register_lock:
+            self._remote[key] = shard
+
+    def snapshot(self):
+        """合并所有分片，返回一个新的 StatsShard"""
+        with self._register_lock:
+            shards = list(self._shards) + list(self._remote.values())
+        merged = StatsShard()
+        for shard in shards:
+            merged.merge(shard)
+        return merged
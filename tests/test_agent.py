@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+import agent
+from agent import AGENT_TOKEN_HEADER, MAX_PLANS, PLAN_TTL, agent_app, agent_plans, prune_plans, validate_plan
+
+
+TOKEN = 'test-token'
+PLAN = {'planId': 'plan-1', 'targetUrl': 'http://127.0.0.1:9/', 'count': 10, 'concurrency': 2, 'workers': 1}
+
+
+@pytest.fixture
+def client():
+    agent_app.config['AGENT_TOKEN'] = TOKEN
+    agent_plans.clear()
+    yield agent_app.test_client()
+    for agent_plan in agent_plans.values():
+        agent_plan.runner.stop()
+    agent_plans.clear()
+
+
+def headers(token=TOKEN):
+    return {AGENT_TOKEN_HEADER: token}
+
+
+@pytest.mark.parametrize('changes, error', [
+    ({}, None),
+    ({'startAt': time.time() + 60}, None),
+    ({'targetUrl': ''}, "测试计划缺少字段: targetUrl"),
+    ({'count': '10'}, "count 必须是整数"),
+    ({'concurrency': True}, "concurrency 必须是整数"),
+    ({'rate': 'fast'}, "rate 必须是数字"),
+    ({'startAt': 'now'}, "startAt 必须是数字"),
+    ({'count': 0}, "测试次数和并发数量必须大于0"),
+    ({'workers': 0}, "进程数必须大于0"),
+    ({'rate': -1}, "目标RPS不能小于0"),
+    ({'openLoop': True}, "开环模式需要大于0的目标RPS"),
+    ({'mode': 'hot'}, "未知的连接模式: hot"),
+    ({'startAt': 1.0}, "开始时间已过"),
+])
+def test_validate_plan(changes, error):
+    assert validate_plan(dict(PLAN, **changes)) == error
+
+
+def test_requests_without_token_are_rejected(client):
+    assert client.get('/clock').status_code == 401
+    assert client.get('/clock', headers=headers('wrong')).status_code == 401
+    assert client.get('/clock', headers=headers()).status_code == 200
+
+
+def test_bad_plan_is_400_not_500(client):
+    response = client.post('/plans', json=dict(PLAN, count='many'), headers=headers())
+    assert response.status_code == 400
+    assert not agent_plans
+
+
+def test_plan_waits_for_confirmed_start_time(client):
+    assert client.post('/plans', json=PLAN, headers=headers()).status_code == 200
+    assert client.post('/plans', json=PLAN, headers=headers()).status_code == 409
+    assert agent_plans['plan-1'].start_at is None
+
+    # 已过的开始时间会被拒绝，节点不会晚于其他节点开始
+    response = client.post('/plans/plan-1/start', json={'startAt': time.time() - 1}, headers=headers())
+    assert response.status_code == 409
+    assert client.post('/plans/plan-1/start', json={'startAt': 'soon'}, headers=headers()).status_code == 400
+    assert client.post('/plans/missing/start', json={'startAt': time.time() + 60}, headers=headers()).status_code == 404
+
+    start_at = time.time() + 60
+    assert client.post('/plans/plan-1/start', json={'startAt': start_at}, headers=headers()).status_code == 200
+    assert agent_plans['plan-1'].start_at == start_at
+    assert client.post('/plans/plan-1/start', json={'startAt': start_at}, headers=headers()).status_code == 409
+    assert client.post('/plans/plan-1/stop', headers=headers()).status_code == 200
+
+
+class FinishedPlan:
+    def __init__(self, finished):
+        self.finished = finished
+
+
+def test_prune_plans():
+    now = 1_000_000.0
+    agent_plans.clear()
+    try:
+        agent_plans['expired'] = FinishedPlan(now - PLAN_TTL - 1)
+        agent_plans['running'] = FinishedPlan(None)
+        for index in range(MAX_PLANS + 5):
+            agent_plans[f"recent-{index}"] = FinishedPlan(now - 100 + index)
+        prune_plans(now)
+        assert 'expired' not in agent_plans
+        assert 'running' in agent_plans
+        assert len(agent_plans) == MAX_PLANS
+        # 超出上限时先删除最早结束的计划
+        assert 'recent-0' not in agent_plans
+        assert f"recent-{MAX_PLANS + 4}" in agent_plans
+    finally:
+        agent_plans.clear()
+
+
+def test_distributed_rate_only_counts_agents_with_a_plan(monkeypatch):
+    posted = []
+
+    class FakeResponse:
+        status_code = 200
+
+        def json(self):
+            return {'success': True}
+
+    def fake_post(session, url, json=None, timeout=None):
+        posted.append((url, json))
+        return FakeResponse()
+
+    monkeypatch.setattr(agent, 'measure_clock_offset', lambda agent_url, session: 0.0)
+    monkeypatch.setattr(agent.requests.Session, 'post', fake_post)
+    monkeypatch.setattr(agent.threading.Thread, 'start', lambda thread: None)
+    settings = {'target_url': 'http://127.0.0.1:9/', 'proxy_url': None, 'count': 2, 'concurrency': 4,
+                'mode': 'cold', 'pool_size': 10, 'rate': 100, 'open_loop': False, 'workers': 1}
+    run = agent.DistributedRun(['http://a:1', 'http://b:1', 'http://c:1', 'http://d:1'], settings, TOKEN)
+    run.start()
+
+    plans = [body for url, body in posted if url.endswith('/plans')]
+    assert [plan['count'] for plan in plans] == [1, 1]
+    assert [plan['rate'] for plan in plans] == [50, 50]
+    assert all('startAt' not in plan for plan in plans)
+    confirms = [body['startAt'] for url, body in posted if url.endswith('/start')]
+    assert len(confirms) == 2 and confirms[0] == confirms[1] > time.time()
@@ -0,0 +1,114 @@
+import json
+import random
+
+import pytest
+
+from latency_stats import LatencyHistogram, BUCKET_COUNT, bucket_index, bucket_value, format_latency_summary
+
+
+# 对数分桶的最大相对误差（每个2的幂区间 64 个子桶）
+RELATIVE_ERROR = 1 / 64
+
+
+def exact_percentile(values, percentile):
+    ordered = sorted(values)
+    return ordered[max(1, int(len(ordered) * percentile / 100 + 0.5)) - 1]
+
+
+def test_empty_histogram():
+    histogram = LatencyHistogram()
+    assert histogram.count == 0
+    assert histogram.percentile(99) == 0
+    assert histogram.percentiles((50, 99)) == {50: 0, 99: 0}
+    assert histogram.mean == 0
+    assert histogram.min == 0
+    assert format_latency_summary(histogram) == "暂无数据\n"
+
+
+def test_bucket_index_is_monotonic_and_bounded():
+    previous = -1
+    for value_us in list(range(0, 4096)) + [10 ** exponent for exponent in range(4, 12)]:
+        index = bucket_index(value_us)
+        assert previous <= index < BUCKET_COUNT
+        previous = index
+    assert bucket_index(10 ** 15) == BUCKET_COUNT - 1
+
+
+def test_bucket_value_within_relative_error():
+    for value_us in (1, 127, 128, 1000, 12345, 999999, 3 * 10 ** 8):
+        assert abs(bucket_value(bucket_index(value_us)) - value_us) <= value_us * RELATIVE_ERROR + 1
+
+
+def test_percentiles_match_exact_values():
+    rng = random.Random(1)
+    # 对数正态分布的延迟，覆盖从微秒到秒的多个数量级
+    values = [rng.lognormvariate(-4, 1.5) for _ in range(20000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    assert histogram.count == len(values)
+    percentiles = histogram.percentiles((50, 90, 99, 99.9))
+    for percentile, value in percentiles.items():
+        exact = exact_percentile(values, percentile)
+        assert value == pytest.approx(exact, rel=RELATIVE_ERROR, abs=2e-6)
+        assert histogram.percentile(percentile) == value
+    assert histogram.max == pytest.approx(max(values), abs=1e-6)
+    assert histogram.min == pytest.approx(min(values), abs=1e-6)
+    assert histogram.mean == pytest.approx(sum(values) / len(values), rel=1e-3)
+
+
+def test_percentile_never_exceeds_max():
+    histogram = LatencyHistogram()
+    histogram.record(0.123456)
+    assert histogram.percentile(100) == pytest.approx(0.123456, rel=RELATIVE_ERROR)
+    assert histogram.percentile(100) <= histogram.max == 0.123456
+
+
+def test_negative_values_recorded_as_zero():
+    histogram = LatencyHistogram()
+    histogram.record(-1)
+    assert histogram.count == 1
+    assert histogram.min == 0
+    assert histogram.max == 0
+
+
+def test_merge_equals_recording_everything():
+    rng = random.Random(2)
+    values = [rng.expovariate(50) for _ in range(5000)]
+    combined = LatencyHistogram()
+    parts = [LatencyHistogram() for _ in range(4)]
+    for index, value in enumerate(values):
+        combined.record(value)
+        parts[index % 4].record(value)
+    merged = LatencyHistogram()
+    for part in parts:
+        assert merged.merge(part) is merged
+    assert merged.counts == combined.counts
+    assert merged.count == combined.count
+    assert merged.total_us == combined.total_us
+    assert merged.summary() == combined.summary()
+
+
+def test_merge_empty_keeps_min():
+    histogram = LatencyHistogram()
+    histogram.record(0.5)
+    histogram.merge(LatencyHistogram())
+    assert histogram.min == 0.5
+    assert LatencyHistogram().merge(histogram).min == 0.5
+
+
+def test_dict_round_trip_through_json():
+    histogram = LatencyHistogram()
+    for value in (0.001, 0.002, 0.002, 0.5, 3.0):
+        histogram.record(value)
+    # JSON 把桶序号变成字符串，from_dict 需要还原
+    restored = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+    assert restored.counts == histogram.counts
+    assert restored.summary() == histogram.summary()
+    assert len(histogram.to_dict()['buckets']) == 4
+
+
+def test_summary_keys():
+    histogram = LatencyHistogram()
+    histogram.record(0.01)
+    assert set(histogram.summary()) == {'count', 'mean', 'min', 'max', 'p50', 'p90', 'p99', 'p99.9'}
@@ -0,0 +1,87 @@
+import pytest
+
+from load_sweep import (LoadSweep, SWEEP_CONCURRENCY, SWEEP_RATE, find_knee, format_sweep_report, parse_schedule,
+                        summarize_step)
+from local_bench_server import LocalBenchServer, FaultInjector
+from stats_aggregator import StatsShard
+
+
+def step(value, throughput, p99, error_rate=0.0):
+    return {'value': value, 'total': 100, 'success': 100, 'error_rate': error_rate, 'throughput': throughput,
+            'p50': p99 / 2, 'p90': p99 * 0.9, 'p99': p99}
+
+
+def test_parse_schedule():
+    assert parse_schedule("10, 20,50，100") == [10, 20, 50, 100]
+    for text in ("", "0,10", "20,10", "-5"):
+        with pytest.raises(ValueError):
+            parse_schedule(text)
+
+
+def test_concurrency_knee_when_throughput_flattens_and_latency_grows():
+    steps = [step(1, 100, 0.010), step(2, 195, 0.011), step(4, 380, 0.012), step(8, 400, 0.025),
+             step(16, 405, 0.060)]
+    assert find_knee(steps) == (3, 2)
+
+
+def test_concurrency_no_knee_while_scaling():
+    steps = [step(1, 100, 0.010), step(2, 200, 0.010), step(4, 400, 0.011)]
+    knee, recommended = find_knee(steps)
+    assert knee is None
+    assert recommended == 2
+    assert "未检测到拐点" in format_sweep_report(SWEEP_CONCURRENCY, steps, knee, recommended)
+
+
+def test_error_rate_is_a_knee():
+    steps = [step(1, 100, 0.010), step(2, 200, 0.010, error_rate=0.2)]
+    assert find_knee(steps) == (1, 0)
+
+
+def test_first_step_overloaded_has_no_recommendation():
+    steps = [step(10, 2, 1.0, error_rate=0.5)]
+    knee, recommended = find_knee(steps, SWEEP_RATE)
+    assert (knee, recommended) == (0, None)
+    assert "第一步即已过载" in format_sweep_report(SWEEP_RATE, steps, knee, recommended)
+
+
+def test_rate_knee_when_throughput_falls_behind_target():
+    steps = [step(100, 99, 0.010), step(200, 198, 0.011), step(400, 300, 0.012)]
+    assert find_knee(steps, SWEEP_RATE) == (2, 1)
+
+
+def test_rate_knee_ignores_small_latency_noise():
+    # 毫秒级 p99 的小幅波动（11ms -> 14ms）不是拐点，翻倍才是
+    steps = [step(100, 100, 0.011), step(200, 200, 0.014), step(400, 400, 0.030)]
+    assert find_knee(steps, SWEEP_RATE) == (2, 1)
+
+
+def test_rate_sweep_slow_target_is_not_saturated():
+    steps = [step(10, 10, 0.3), step(20, 20, 0.31)]
+    assert find_knee(steps, SWEEP_RATE) == (None, 1)
+
+
+def test_summarize_step_uses_corrected_latency_for_open_loop():
+    stats = StatsShard()
+    for _ in range(3):
+        stats.record('200', True, 0.01, queue_delay=0.5)
+    stats.record('503', False, queue_delay=0.5)
+    summary = summarize_step(10, stats, 2.0)
+    assert summary['throughput'] == 1.5
+    assert summary['error_rate'] == 0.25
+    assert summary['p50'] == pytest.approx(0.51, rel=0.02)
+    assert summarize_step(10, stats, 2.0, success=1)['throughput'] == 0.5
+
+
+def test_rate_step_counts_probes_still_in_flight_at_window_end():
+    # 延迟占步骤时长的比例较高时，窗口结束后才完成的探测也属于本步骤，吞吐不应被低估
+    server = LocalBenchServer(target_port=0, proxy_port=0, target_faults=FaultInjector(latency=0.2))
+    server.start()
+    try:
+        sweep = LoadSweep(server.target_url, kind=SWEEP_RATE, schedule=[20], step_duration=0.5, timeout=5)
+        knee, recommended = sweep.run_sync()
+    finally:
+        server.stop()
+    result = sweep.steps[0]
+    assert result['total'] == 10
+    assert result['throughput'] == pytest.approx(20, rel=0.1)
+    assert knee is None
@@ -0,0 +1,140 @@
+import asyncio
+import socket
+
+import pytest
+
+from probe_engine import ProbeEngine, PhaseTimer, is_ip_literal, parse_status_line, read_response_head
+
+
+@pytest.mark.parametrize('line, expected', [
+    (b'HTTP/1.1 200 OK\r\n', 200),
+    (b'HTTP/1.0 503 Service Unavailable\r\n', 503),
+    (b'HTTP/1.1 204\r\n', 204),
+    (b'HTTP/2 301 Moved Permanently\r\n', 301),
+])
+def test_parse_status_line(line, expected):
+    assert parse_status_line(line) == expected
+
+
+@pytest.mark.parametrize('line', [
+    b'',
+    b'\r\n',
+    b'HTTP/1.1\r\n',
+    b'HTTP/1.1 OK\r\n',
+    b'HTTP/1.1 20 OK\r\n',
+    b'HTTP/1.1 2000 OK\r\n',
+    b'SSH-2.0-OpenSSH_9.6\r\n',
+])
+def test_parse_status_line_rejects_malformed(line):
+    with pytest.raises(ValueError):
+        parse_status_line(line)
+
+
+def read_head(data):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_response_head(reader)
+    return asyncio.run(read())
+
+
+def test_read_response_head():
+    status_code, headers = read_head(b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\nConnection: close\r\n\r\nhello')
+    assert status_code == 200
+    assert headers['content-length'] == '5'
+    assert headers['connection'] == 'close'
+
+
+def test_read_response_head_malformed_status():
+    with pytest.raises(ValueError):
+        read_head(b'garbage\r\n\r\n')
+
+
+class FakeResolver:
+    """替换事件循环的 getaddrinfo，记录查询次数，每次返回 127.0.0.1"""
+
+    def __init__(self, delay=0):
+        self.calls = 0
+        self.delay = delay
+
+    async def getaddrinfo(self, host, port, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))]
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    fake = FakeResolver()
+
+    async def getaddrinfo(loop, host, port, **kwargs):
+        return await fake.getaddrinfo(host, port, **kwargs)
+
+    monkeypatch.setattr(asyncio.BaseEventLoop, 'getaddrinfo', getaddrinfo)
+    return fake
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_is_ip_literal():
+    assert is_ip_literal('127.0.0.1')
+    assert is_ip_literal('::1')
+    assert not is_ip_literal('localhost')
+    assert not is_ip_literal('proxy.example.com')
+
+
+def test_resolve_every_probe_by_default(resolver):
+    engine = ProbeEngine()
+
+    async def resolve_three_times():
+        return [await engine._resolve('proxy.example.com', 8080) for _ in range(3)]
+
+    results = asyncio.run(resolve_three_times())
+    assert results == [(('127.0.0.1', 8080), True)] * 3
+    assert resolver.calls == 3
+    assert engine._addresses == {}
+
+
+def test_concurrent_lookups_are_shared(resolver):
+    resolver.delay = 0.05
+    engine = ProbeEngine()
+
+    async def resolve_concurrently():
+        return await asyncio.gather(*(engine._resolve('proxy.example.com', 8080) for _ in range(5)))
+
+    results = asyncio.run(resolve_concurrently())
+    # 每个等待了解析的探测都计入DNS阶段
+    assert all(looked_up for _, looked_up in results)
+    assert resolver.calls == 1
+
+
+def test_resolve_cache_expires(resolver):
+    engine = ProbeEngine(dns_ttl=0.05)
+
+    async def resolve():
+        first = await engine._resolve('proxy.example.com', 8080)
+        second = await engine._resolve('proxy.example.com', 8080)
+        await asyncio.sleep(0.06)
+        third = await engine._resolve('proxy.example.com', 8080)
+        return first[1], second[1], third[1]
+
+    assert asyncio.run(resolve()) == (True, False, True)
+    assert resolver.calls == 2
+
+
+def test_connect_failure_evicts_cached_address(resolver):
+    engine = ProbeEngine(dns_ttl=60)
+    port = closed_port()
+
+    async def connect():
+        with pytest.raises(OSError):
+            await engine._open_connection('proxy.example.com', port, PhaseTimer())
+
+    asyncio.run(connect())
+    assert resolver.calls == 1
+    assert engine._addresses == {}
@@ -0,0 +1,54 @@
+import pytest
+
+from process_pool import (CONTROL_BURST, CONTROL_CONCURRENCY, CONTROL_PAUSED, CONTROL_RATE, CONTROL_SIZE,
+                          CONTROL_STOPPED, apply_control, split_evenly)
+from rate_control import DispatchController
+
+
+@pytest.mark.parametrize('total, parts', [(10, 3), (3, 5), (0, 4), (100, 1), (7, 7), (1000, 16)])
+def test_split_evenly(total, parts):
+    shares = split_evenly(total, parts)
+    assert len(shares) == parts
+    assert sum(shares) == total
+    assert max(shares) - min(shares) <= 1
+    # 余数分给前面的份数
+    assert shares == sorted(shares, reverse=True)
+
+
+def test_split_evenly_more_parts_than_total():
+    assert split_evenly(3, 5) == [1, 1, 1, 0, 0]
+
+
+def make_control(concurrency, rate=0, burst=1, paused=0, stopped=0):
+    control = [0] * CONTROL_SIZE
+    control[CONTROL_CONCURRENCY] = concurrency
+    control[CONTROL_RATE] = rate
+    control[CONTROL_BURST] = burst
+    control[CONTROL_PAUSED] = paused
+    control[CONTROL_STOPPED] = stopped
+    return control
+
+
+def test_apply_control_splits_concurrency_and_rate():
+    controllers = [DispatchController() for _ in range(3)]
+    for index, controller in enumerate(controllers):
+        apply_control(controller, make_control(10, rate=300, burst=30), index, 3)
+    assert [controller.concurrency for controller in controllers] == [4, 3, 3]
+    assert all(controller.bucket.rate == 100 for controller in controllers)
+    assert all(controller.bucket.burst == 10 for controller in controllers)
+
+
+def test_apply_control_keeps_one_slot_per_worker():
+    # 总并发调低到进程数以下时，每个进程仍保留一个并发
+    controller = DispatchController()
+    apply_control(controller, make_control(2), 3, 4)
+    assert controller.concurrency == 1
+
+
+def test_apply_control_pause_and_stop():
+    controller = DispatchController()
+    apply_control(controller, make_control(4, paused=1), 0, 2)
+    assert controller.paused
+    apply_control(controller, make_control(4, stopped=1), 0, 2)
+    assert not controller.paused
+    assert controller.stopped
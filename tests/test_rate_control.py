@@ -0,0 +1,94 @@
+import pytest
+
+import rate_control
+from rate_control import TokenBucket, DispatchController, POLL_INTERVAL
+
+
+class FakeClock:
+    # 使用二进制可精确表示的时间步长，避免浮点累加误差让令牌差一点点
+    def __init__(self):
+        self.now = 1024.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_control.time, 'monotonic', fake)
+    return fake
+
+
+def test_unlimited_bucket_never_waits(clock):
+    bucket = TokenBucket(rate=0)
+    assert all(bucket.try_take() == 0 for _ in range(1000))
+
+
+def test_burst_then_wait(clock):
+    bucket = TokenBucket(rate=8, burst=3)
+    assert [bucket.try_take() for _ in range(3)] == [0, 0, 0]
+    # 桶已空，下一个令牌在 1/rate 秒后产生
+    assert bucket.try_take() == 0.125
+    clock.advance(0.0625)
+    assert bucket.try_take() == 0.0625
+    clock.advance(0.0625)
+    assert bucket.try_take() == 0
+
+
+def test_rate_is_respected_over_time(clock):
+    bucket = TokenBucket(rate=128, burst=1)
+    taken = 0
+    for _ in range(8192):
+        if bucket.try_take() == 0:
+            taken += 1
+        clock.advance(1 / 1024)
+    # 8 秒内 128 次/秒，第一个令牌在开始时即可取走
+    assert taken == 8 * 128
+
+
+def test_refill_capped_at_burst(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+    bucket.try_take()
+    clock.advance(60)
+    assert [bucket.try_take() for _ in range(2)] == [0, 0]
+    assert bucket.try_take() > 0
+
+
+def test_set_rate_keeps_accrued_tokens_and_caps_burst(clock):
+    bucket = TokenBucket(rate=1, burst=5)
+    for _ in range(5):
+        bucket.try_take()
+    clock.advance(2)
+    # 调整前按旧速率补充的 2 个令牌保留
+    bucket.set_rate(100, burst=1)
+    assert bucket.burst == 1
+    assert bucket.tokens == 1
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == pytest.approx(0.01)
+
+
+def test_burst_at_least_one(clock):
+    assert TokenBucket(rate=5, burst=0).burst == 1
+
+
+def test_controller_pause_and_concurrency(clock):
+    controller = DispatchController(rate=0, concurrency=2)
+    assert controller.try_acquire(0) == 0
+    assert controller.try_acquire(2) == POLL_INTERVAL
+    controller.pause()
+    assert controller.try_acquire(0) == POLL_INTERVAL
+    controller.resume()
+    assert controller.try_acquire(1) == 0
+    controller.set_concurrency(0)
+    assert controller.concurrency == 1
+
+
+def test_controller_wait_capped_at_poll_interval(clock):
+    controller = DispatchController(rate=1, burst=1)
+    assert controller.try_acquire(0) == 0
+    # 距下一个令牌还有 1 秒，但只建议等待一个轮询间隔，以便及时响应暂停和调整
+    assert controller.try_acquire(0) == POLL_INTERVAL
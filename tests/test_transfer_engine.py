@@ -0,0 +1,24 @@
+import pytest
+
+from transfer_engine import split_ranges
+
+
+@pytest.mark.parametrize('total, segments', [(100, 4), (10, 3), (1, 1), (1 << 30, 8), (5, 5)])
+def test_split_ranges_cover_every_byte_once(total, segments):
+    ranges = split_ranges(total, segments)
+    assert len(ranges) == segments
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == total - 1
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert start == end + 1
+    sizes = [end - start + 1 for start, end in ranges]
+    assert sum(sizes) == total
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_split_ranges_caps_segments_at_total():
+    assert split_ranges(3, 8) == [(0, 0), (1, 1), (2, 2)]
+
+
+def test_split_ranges_at_least_one_segment():
+    assert split_ranges(10, 0) == [(0, 9)]
@@ -0,0 +1,186 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from probe_engine import (ProbeResult, MODE_COLD, MODE_WARM, PHASES, PHASE_TTFB, PHASE_BODY, DEFAULT_BODY_LIMIT,
+                          STATUS_SUCCESS, STATUS_FAILED, ERROR_TIMEOUT, ERROR_PROXY, ERROR_CONNECTION, ERROR_HTTP,
+                          ERROR_EXECUTION, mode_for_request, format_phases, capture_body)
+from rate_control import DispatchController, POLL_INTERVAL
+
+
+# 线程池的线程上限，线程按需创建，实际并发由发送控制器决定
+MAX_THREAD_WORKERS = 1000
+
+
+class SessionCache:
+    """按 (代理地址, 连接池大小) 缓存的保持连接会话，可在多次测试间复用，使隧道在多次请求间保持"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, proxy_url, pool_size):
+        key = (proxy_url, pool_size)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[key] = session
+            return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class ThreadProbeEngine:
+    """基于线程池和 requests 的探测引擎（界面的“线程池”引擎），不依赖Tk
+
+    GUI 和自测基准都通过它执行：每个探测获得 self.controller 的发送许可后才提交到线程池，
+    在途任务不超过并发上限，按完成顺序返回 ProbeResult。统计在工作线程中写入 stats 的分片。
+    """
+
+    def __init__(self, proxy_url=None, timeout=10, mode=MODE_COLD, pool_size=10, body_limit=DEFAULT_BODY_LIMIT,
+                 stats=None, sessions=None, executor=None):
+        self.proxy_url = proxy_url
+        self.proxies = {'http': proxy_url, 'https': proxy_url} if proxy_url else None
+        self.timeout = timeout
+        self.mode = mode
+        self.pool_size = pool_size
+        self.body_limit = body_limit
+        self.stats = stats
+        # 调用方可传入长期持有的会话缓存和线程池，在多次测试间复用
+        self.sessions = sessions if sessions is not None else SessionCache()
+        self.executor = executor
+        # 发送控制：限速、并发上限、暂停/继续，运行中可随时调整
+        self.controller = DispatchController()
+
+    def stop(self):
+        self.controller.stop()
+
+    def get_http_client(self, mode):
+        # cold 模式使用模块级 requests（每次新建连接），warm 模式使用连接池会话
+        if mode == MODE_WARM:
+            return self.sessions.get(self.proxy_url, self.pool_size)
+        return requests
+
+    def probe(self, url, request_id):
+        """在当前线程中执行单次探测，不抛出异常"""
+        proxy_url = self.proxy_url
+        mode = mode_for_request(self.mode, request_id)
+        started = time.time()
+        try:
+            start_ns = time.perf_counter_ns()
+            response = self.get_http_client(mode).get(url, proxies=self.proxies, timeout=self.timeout)
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            elapsed_time = elapsed_ns / 1e9
+
+            # requests 无法拆分连接阶段，只区分首字节（含建连）与响应体
+            phases = [None] * len(PHASES)
+            phases[PHASE_TTFB] = min(int(response.elapsed.total_seconds() * 1e9), elapsed_ns)
+            phases[PHASE_BODY] = elapsed_ns - phases[PHASE_TTFB]
+
+            # 只保留截断的原始响应体和哈希，选中该行时才解码和格式化
+            content = response.content
+            body, digest = capture_body(content, self.body_limit)
+
+            if response.status_code == 200:
+                details = f"请求ID: {request_id}\n响应时间: {elapsed_time:.2f}秒\n状态码: {response.status_code}\n连接模式: {mode}\n{format_phases(phases)}"
+                result = ProbeResult(request_id, STATUS_SUCCESS, str(response.status_code), elapsed_time, details,
+                                     mode=mode, phases=phases, body=body, size=len(content), body_hash=digest,
+                                     proxy=proxy_url, target=url)
+            else:
+                result = ProbeResult(request_id, STATUS_FAILED, str(response.status_code), 0,
+                                     f"HTTP错误: {response.status_code}", mode=mode, phases=phases, body=body,
+                                     size=len(content), body_hash=digest, error=ERROR_HTTP, proxy=proxy_url,
+                                     target=url)
+
+        except requests.exceptions.Timeout:
+            result = ProbeResult(request_id, STATUS_FAILED, ERROR_TIMEOUT, 0, "连接超时", timeout=True, mode=mode,
+                                 error=ERROR_TIMEOUT, proxy=proxy_url, target=url)
+        except requests.exceptions.ProxyError as e:
+            error_message = "代理服务器连接失败"
+            status_code = ERROR_PROXY
+
+            # 获取原始错误对象
+            cause = e.__context__
+            if cause:
+                if hasattr(cause, 'response') and cause.response:
+                    try:
+                        response = cause.response
+                        response.encoding = 'utf-8'
+                        error_message = response.text
+                        if not error_message and response.content:
+                            error_message = response.content.decode('utf-8', errors='replace')
+                        status_code = str(response.status_code)
+                    except Exception as decode_error:
+                        error_message = f"解码错误: {str(decode_error)}"
+                elif str(cause).startswith('errorMsg:'):
+                    # 直接处理类似 'errorMsg: user forbidden...' 的错误信息
+                    error_message = str(cause)
+                    status_code = '403'  # 对于这类错误，通常是403 Forbidden
+
+            result = ProbeResult(request_id, STATUS_FAILED, status_code, 0, error_message, mode=mode,
+                                 error=ERROR_PROXY, proxy=proxy_url, target=url)
+        except requests.exceptions.RequestException as e:
+            result = ProbeResult(request_id, STATUS_FAILED, ERROR_CONNECTION, 0, f"连接错误: {str(e)}", mode=mode,
+                                 error=ERROR_CONNECTION, proxy=proxy_url, target=url)
+
+        result.started = started
+        # 更新统计（写入本线程的分片）
+        if self.stats is not None:
+            self.stats.record_result(result)
+        return result
+
+    def run(self, url, count, on_result=None, first_request_id=1):
+        """执行 count 次探测并阻塞到全部完成或停止，每完成一次在调用线程中调用 on_result(result)
+
+        流式提交：每个任务获得发送控制器的许可后才提交，在途任务不超过并发上限，
+        按完成顺序输出结果，内存占用与并发数成正比，与测试次数无关。
+        """
+        controller = self.controller
+        executor = self.executor or ThreadPoolExecutor(max_workers=MAX_THREAD_WORKERS)
+        pending = {}
+        submitted = 0
+        try:
+            while (submitted < count or pending) and not controller.stopped:
+                # 在令牌和并发允许的范围内提交任务，暂停时不再提交
+                wait_time = 0
+                while submitted < count:
+                    wait_time = controller.try_acquire(len(pending))
+                    if wait_time:
+                        break
+                    request_id = first_request_id + submitted
+                    pending[executor.submit(self.probe, url, request_id)] = request_id
+                    submitted += 1
+
+                if not pending:
+                    time.sleep(wait_time or POLL_INTERVAL)
+                    continue
+
+                # 还有任务待提交时只等待到下一个令牌，有任务完成时提前返回
+                timeout = wait_time if submitted < count else 0.1
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    request_id = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = ProbeResult(request_id, STATUS_FAILED, ERROR_EXECUTION, 0, f"执行错误: {str(e)}",
+                                             error=ERROR_EXECUTION)
+                    if on_result:
+                        on_result(result)
+        finally:
+            # 停止测试时取消尚未开始的任务
+            for future in pending:
+                future.cancel()
+            if executor is not self.executor:
+                executor.shutdown(wait=False)
@@ -0,0 +1,363 @@
+import http.client
+import os
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from probe_engine import parse_proxy
+
+
+# 默认读取块大小，大块读取可减少Python层循环次数，在高带宽链路上避免解释器成为瓶颈
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# 实时速度的最短采样间隔（秒）
+SAMPLE_INTERVAL = 0.1
+USER_AGENT = 'proxy-speed-test/transfer'
+# 速度测试的默认地址（10MB文件和上传接口）
+DEFAULT_DOWNLOAD_URL = "https://speed.cloudflare.com/__down?bytes=10485760"
+DEFAULT_UPLOAD_URL = "https://speed.cloudflare.com/__up"
+
+# 每个线程保留的空闲连接（warm 模式复用），线程结束后随线程一起释放
+_idle_connections = threading.local()
+
+
+class TransferError(Exception):
+    """传输失败（HTTP错误或被用户中断）"""
+
+
+class TransferResult:
+    """单次下载或上传的结果，速度单位为 KB/s
+
+    速度测试页、命令行、历史记录和导出共用这一种记录。
+    """
+    __slots__ = ('test_id', 'success', 'url', 'bytes', 'elapsed', 'realtime_speed', 'avg_speed', 'error', 'proxy',
+                 'spread')
+
+    def __init__(self, test_id, success, url, size=0, elapsed=0, realtime_speed=0, avg_speed=0, error=None,
+                 proxy=None, spread=None):
+        self.test_id = test_id
+        self.success = success
+        self.url = url
+        self.bytes = size
+        self.elapsed = elapsed
+        # 最后一次采样的实时速度和整次传输的平均速度
+        self.realtime_speed = realtime_speed
+        self.avg_speed = avg_speed
+        self.error = error
+        self.proxy = proxy
+        # 分段下载时各分段速度的离散系数，单连接时为 None
+        self.spread = spread
+
+    @classmethod
+    def from_progress(cls, test_id, url, progress, proxy=None, spread=None):
+        return cls(test_id, True, url, progress.bytes, progress.elapsed, progress.last_speed,
+                   progress.average_speed, proxy=proxy, spread=spread)
+
+
+class TransferProgress:
+    """单次传输的进度
+
+    传输线程只累加字节数，不做计时和计算；界面按定时器调用 sample() 计算实时速度，
+    因此进度更新的开销与读取次数无关。速度单位为 KB/s，与速度测试页的显示一致。
+    """
+
+    def __init__(self, total=0):
+        self.bytes = 0
+        self.total = total
+        self.started = time.perf_counter()
+        self.finished = None
+        self.last_speed = 0
+        self._sample_time = self.started
+        self._sample_bytes = 0
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def average_speed(self):
+        elapsed = self.elapsed
+        return self.bytes / 1024 / elapsed if elapsed > 0 else 0
+
+    @property
+    def percent(self):
+        return min(100.0, self.bytes * 100 / self.total) if self.total else 0
+
+    def sample(self):
+        """返回 (实时速度, 平均速度, 进度百分比)，距上次采样不足 SAMPLE_INTERVAL 时沿用上次的实时速度"""
+        now = time.perf_counter()
+        interval = now - self._sample_time
+        if interval >= SAMPLE_INTERVAL:
+            current_bytes = self.bytes
+            speed = (current_bytes - self._sample_bytes) / 1024 / interval
+            # 与上一次采样做简单平滑，避免显示剧烈波动
+            self.last_speed = (speed + self.last_speed) / 2 if self.last_speed else speed
+            self._sample_time = now
+            self._sample_bytes = current_bytes
+        return self.last_speed, self.average_speed, self.percent
+
+
+class SegmentedProgress(TransferProgress):
+    """多个分段的合并进度，字节数为各分段字节数之和，每个分段只由自己的线程写入"""
+
+    def __init__(self, parts, total=0):
+        self.parts = parts
+        super().__init__(total)
+
+    @property
+    def bytes(self):
+        return sum(part.bytes for part in self.parts)
+
+    @bytes.setter
+    def bytes(self, value):
+        # 字节数由各分段累加，忽略基类初始化时的赋值
+        pass
+
+
+def split_ranges(total, segments):
+    """把 total 字节平均切分为 segments 个闭区间 [(start, end), ...]"""
+    segments = max(1, min(segments, total))
+    size, remainder = divmod(total, segments)
+    ranges = []
+    start = 0
+    for index in range(segments):
+        end = start + size + (1 if index < remainder else 0) - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+def request_target(url, proxy_url=None):
+    """返回 (请求路径, 请求头)：经代理访问 HTTP 目标时使用绝对地址并附带代理认证"""
+    parts = urlsplit(url)
+    headers = {'User-Agent': USER_AGENT}
+    proxy = parse_proxy(proxy_url)
+    if proxy and parts.scheme == 'http':
+        if proxy[2]:
+            headers['Proxy-Authorization'] = proxy[2]
+        return url, headers
+    return (parts.path or '/') + (f"?{parts.query}" if parts.query else ''), headers
+
+
+def open_http_connection(url, proxy_url=None, timeout=15, ssl_context=None):
+    """建立到目标的 http.client 连接（首次请求时才真正连接）
+
+    经代理访问 HTTPS 目标时使用 CONNECT 隧道，访问 HTTP 目标时直接连接代理。
+    """
+    parts = urlsplit(url)
+    https = parts.scheme == 'https'
+    host = parts.hostname
+    port = parts.port or (443 if https else 80)
+    if https and ssl_context is None:
+        ssl_context = ssl.create_default_context()
+
+    proxy = parse_proxy(proxy_url)
+    if not proxy:
+        if https:
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    proxy_host, proxy_port, auth_header = proxy
+    if https:
+        connection = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=timeout, context=ssl_context)
+        connection.set_tunnel(host, port, headers={'Proxy-Authorization': auth_header} if auth_header else None)
+        return connection
+    return http.client.HTTPConnection(proxy_host, proxy_port, timeout=timeout)
+
+
+def _connection_key(url, proxy_url):
+    parts = urlsplit(url)
+    return proxy_url or '', parts.scheme, parts.hostname, parts.port
+
+
+def _take_idle_connection(key):
+    idle = getattr(_idle_connections, 'connections', None)
+    if idle is None:
+        idle = _idle_connections.connections = {}
+    return idle.pop(key, None)
+
+
+def _send_request(connection, path, headers):
+    connection.request('GET', path, headers=headers)
+    return connection.getresponse()
+
+
+def probe_range_support(url, proxy_url=None, timeout=15, ssl_context=None):
+    """请求第一个字节，返回对象总大小；服务器不支持 Range 时抛出 TransferError"""
+    path, headers = request_target(url, proxy_url)
+    headers['Range'] = 'bytes=0-0'
+    connection = open_http_connection(url, proxy_url, timeout, ssl_context)
+    try:
+        response = _send_request(connection, path, headers)
+        response.read()
+        content_range = response.getheader('content-range') or ''
+        if response.status != 206 or '/' not in content_range:
+            raise TransferError(f"服务器不支持Range请求 (HTTP {response.status})")
+        total = content_range.rsplit('/', 1)[1]
+        if not total.isdigit():
+            raise TransferError("服务器未返回对象大小")
+        return int(total)
+    finally:
+        connection.close()
+
+
+def discard_download(url, proxy_url=None, progress=None, chunk_size=DEFAULT_CHUNK_SIZE, should_stop=None,
+                     timeout=15, ssl_context=None, keep_alive=False, byte_range=None):
+    """下载 url 并丢弃数据，返回下载的字节数
+
+    数据读入预先分配、反复复用的缓冲区，读取循环中没有对象分配和计时，
+    只累加 progress.bytes，速度由调用方定时采样。
+    keep_alive 为真时复用本线程上一次下载留下的连接，下载完成后再放回。
+    byte_range 为 (start, end) 时只下载该闭区间，要求服务器返回 206。
+    """
+    progress = progress or TransferProgress()
+    path, headers = request_target(url, proxy_url)
+    expected_status = 200
+    if byte_range:
+        headers['Range'] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        expected_status = 206
+    key = _connection_key(url, proxy_url)
+    connection = _take_idle_connection(key) if keep_alive else None
+    reusable = False
+    try:
+        response = None
+        if connection:
+            try:
+                response = _send_request(connection, path, headers)
+            except (OSError, http.client.HTTPException):
+                # 空闲连接已被对端关闭，改用新连接重试
+                connection.close()
+        if response is None:
+            connection = open_http_connection(url, proxy_url, timeout, ssl_context)
+            response = _send_request(connection, path, headers)
+        if response.status != expected_status:
+            raise TransferError(f"HTTP错误: {response.status}")
+        progress.total = int(response.getheader('content-length') or 0)
+
+        view = memoryview(bytearray(chunk_size))
+        readinto = response.readinto
+        while True:
+            count = readinto(view)
+            if not count:
+                break
+            progress.bytes += count
+            if should_stop and should_stop():
+                raise TransferError("测试被用户中断")
+        progress.finish()
+        reusable = keep_alive and not response.will_close
+        return progress.bytes
+    finally:
+        if reusable:
+            _idle_connections.connections[key] = connection
+        elif connection:
+            connection.close()
+
+
+def streaming_upload(url, size, proxy_url=None, progress=None, chunk_size=DEFAULT_CHUNK_SIZE, should_stop=None,
+                     timeout=15, ssl_context=None):
+    """以 POST 向 url 上传 size 字节的生成数据，返回上传的字节数
+
+    负载是一块预先生成的随机数据（避免被压缩）反复发送，不在内存中生成完整请求体；
+    发送循环只累加 progress.bytes，计时到服务器返回响应为止。
+    """
+    progress = progress or TransferProgress()
+    progress.total = size
+    path, headers = request_target(url, proxy_url)
+    headers['Content-Type'] = 'application/octet-stream'
+    headers['Content-Length'] = str(size)
+    view = memoryview(os.urandom(min(chunk_size, size) or 1))
+    connection = open_http_connection(url, proxy_url, timeout, ssl_context)
+    try:
+        connection.putrequest('POST', path, skip_accept_encoding=True)
+        for name, value in headers.items():
+            connection.putheader(name, value)
+        connection.endheaders()
+
+        send = connection.send
+        remaining = size
+        while remaining:
+            count = min(remaining, len(view))
+            send(view if count == len(view) else view[:count])
+            remaining -= count
+            progress.bytes += count
+            if should_stop and should_stop():
+                raise TransferError("测试被用户中断")
+
+        response = connection.getresponse()
+        response.read()
+        if not 200 <= response.status < 300:
+            raise TransferError(f"HTTP错误: {response.status}")
+        progress.finish()
+        return progress.bytes
+    finally:
+        connection.close()
+
+
+class SegmentedDownload:
+    """把一个对象按 HTTP Range 切分为多个分段，经各自独立的连接（隧道）并行下载
+
+    用于测量代理的总带宽而不是单条TCP流的表现。progress 为各分段的合并进度，
+    下载过程中可由界面定时采样。
+    """
+
+    def __init__(self, url, proxy_url=None, segments=4, chunk_size=DEFAULT_CHUNK_SIZE, timeout=15,
+                 ssl_context=None):
+        self.url = url
+        self.proxy_url = proxy_url
+        self.segments = segments
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self.parts = [TransferProgress() for _ in range(segments)]
+        self.progress = SegmentedProgress(self.parts)
+
+    def _download_segment(self, index, byte_range, should_stop):
+        part = self.parts[index]
+        part.started = time.perf_counter()
+        discard_download(self.url, self.proxy_url, part, self.chunk_size, should_stop, self.timeout,
+                         self.ssl_context, byte_range=byte_range)
+        return part
+
+    def run(self, should_stop=None):
+        """执行分段下载并返回汇总，任一分段失败时抛出异常"""
+        total = probe_range_support(self.url, self.proxy_url, self.timeout, self.ssl_context)
+        ranges = split_ranges(total, self.segments)
+        # 对象小于分段数时分段会变少
+        self.parts = self.parts[:len(ranges)]
+        self.progress.parts = self.parts
+        self.progress.total = total
+        self.progress.started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            futures = [executor.submit(self._download_segment, index, byte_range, should_stop)
+                       for index, byte_range in enumerate(ranges)]
+            for future in futures:
+                future.result()
+        self.progress.finish()
+        return self.summary()
+
+    def summary(self):
+        """返回总字节数、耗时、总速度和各分段速度（KB/s），spread 为分段速度的离散系数"""
+        speeds = [part.average_speed for part in self.parts]
+        mean = sum(speeds) / len(speeds) if speeds else 0
+        variance = sum((speed - mean) ** 2 for speed in speeds) / len(speeds) if speeds else 0
+        return {
+            'segments': len(self.parts),
+            'bytes': self.progress.bytes,
+            'elapsed': self.progress.elapsed,
+            'speed': self.progress.average_speed,
+            'segment_speeds': speeds,
+            'min_speed': min(speeds, default=0),
+            'max_speed': max(speeds, default=0),
+            'spread': variance ** 0.5 / mean if mean else 0,
+        }
+
+
+def scaling_efficiency(aggregate_speed, single_stream_speed, segments):
+    """多连接总速度相对 segments 条单流理想叠加的比例（0-1），无单流基准时返回 None"""
+    if not single_stream_speed or segments <= 0:
+        return None
+    return aggregate_speed / (single_stream_speed * segments)
@@ -0,0 +1,128 @@
+import tkinter as tk
+from tkinter import ttk
+
+
+class VirtualTable:
+    """只渲染可见行的虚拟化表格
+
+    Treeview 中始终只有一屏的行，滚动时从数据源按页取数并改写这些行的值，
+    因此无论数据源有多少行，界面开销都只与可见行数有关。
+    数据源需要支持 len() 和 page(start, count)，format_row 把一行数据转换为列值。
+    """
+
+    def __init__(self, parent, source, columns, format_row, style="Custom.Treeview", height=10):
+        self.source = source
+        self.format_row = format_row
+        self.first = 0
+        # 位于底部时自动跟随新数据
+        self.follow = True
+
+        self.frame = ttk.Frame(parent)
+        self.scrollbar = ttk.Scrollbar(self.frame, command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", style=style,
+                                 height=height, selectmode="browse")
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        self.row_height = int(ttk.Style().lookup(style, 'rowheight') or 20)
+        self.items = []
+        self.resize_rows(height)
+
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll_by(3))
+        self.tree.bind('<Up>', lambda event: self.move_selection(-1))
+        self.tree.bind('<Down>', lambda event: self.move_selection(1))
+        self.tree.bind('<Prior>', lambda event: self.scroll_by(-self.visible_rows))
+        self.tree.bind('<Next>', lambda event: self.scroll_by(self.visible_rows))
+
+    @property
+    def visible_rows(self):
+        return len(self.items)
+
+    def resize_rows(self, count):
+        count = max(1, count)
+        while len(self.items) < count:
+            self.items.append(self.tree.insert('', 'end', values=()))
+        while len(self.items) > count:
+            self.tree.delete(self.items.pop())
+
+    def on_configure(self, event):
+        # 窗口大小变化时按可用高度调整可见行数（扣除表头高度）
+        rows = (event.height - self.row_height) // self.row_height
+        if rows > 0 and rows != self.visible_rows:
+            self.resize_rows(rows)
+            self.refresh()
+
+    def on_mousewheel(self, event):
+        self.scroll_by(-3 if event.delta > 0 else 3)
+        return "break"
+
+    def on_scroll(self, action, value, unit=None):
+        total = len(self.source)
+        if action == 'moveto':
+            first = int(float(value) * total)
+        elif unit == 'pages':
+            first = self.first + int(value) * self.visible_rows
+        else:
+            first = self.first + int(value)
+        self.set_first(first)
+
+    def scroll_by(self, rows):
+        self.set_first(self.first + rows)
+        return "break"
+
+    def set_first(self, first):
+        max_first = max(0, len(self.source) - self.visible_rows)
+        self.first = min(max(0, first), max_first)
+        self.follow = self.first >= max_first
+        self.refresh()
+
+    def refresh(self):
+        """按当前位置重新填充可见行，每次调用只处理一屏数据"""
+        total = len(self.source)
+        if self.follow:
+            self.first = max(0, total - self.visible_rows)
+        rows = self.source.page(self.first, self.visible_rows)
+        for index, item in enumerate(self.items):
+            values = self.format_row(rows[index]) if index < len(rows) else ()
+            self.tree.item(item, values=values)
+        if total:
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def selected_index(self):
+        """返回当前选中行在数据源中的行号，未选中或选中空行时返回 None"""
+        selection = self.tree.selection()
+        if not selection:
+            return None
+        index = self.first + self.items.index(selection[0])
+        return index if index < len(self.source) else None
+
+    def move_selection(self, delta):
+        index = self.selected_index()
+        if index is None:
+            return "break"
+        self.jump_to(min(max(0, index + delta), len(self.source) - 1), center=False)
+        return "break"
+
+    def jump_to(self, index, center=True):
+        """跳转到指定行号并选中该行"""
+        if not 0 <= index < len(self.source):
+            return False
+        if center:
+            self.set_first(index - self.visible_rows // 2)
+        elif index < self.first:
+            self.set_first(index)
+        elif index >= self.first + self.visible_rows:
+            self.set_first(index - self.visible_rows + 1)
+        item = self.items[index - self.first]
+        self.tree.selection_set(item)
+        self.tree.focus(item)
+        return True
+
+    def clear_selection(self):
+        self.tree.selection_remove(self.tree.selection())